@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',   # Volltextsuche (SearchVectorField, GIN-Index)
     "crispy_forms",
     "crispy_bootstrap5"
 
@@ -51,7 +52,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    'inventory.middleware.StaticFilesMiddleware',    # WhiteNoise, auch unter ASGI async
+    'inventory.middleware.LookupsMiddleware',        # Lookup-Version einmal pro Request
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,6 +61,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
+    'inventory.middleware.ImageHistoryMiddleware',   # Bild-Aktionen pro Request bündeln
 ]
 
 ROOT_URLCONF = 'bebo_core.urls'
@@ -80,11 +83,15 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'bebo_core.wsgi.application'
+# ASGI-Betrieb mit uvicorn: docker-compose.asgi.yml, siehe inventory/asgi.py
+ASGI_APPLICATION = 'bebo_core.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Keine dauerhaften Verbindungen (CONN_MAX_AGE = 0): unter ASGI hat jeder Request
+# seinen eigenen Thread, offen gehaltene Verbindungen würden sich ansammeln.
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
@@ -97,6 +104,28 @@ DATABASES = {
 }
 
 
+# Cache (Berechtigungen, siehe inventory/permissions.py)
+# Mit REDIS_URL teilen sich alle Gunicorn-Worker einen Cache, sonst hat jeder Prozess seinen eigenen.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Anmeldung über die Benutzer-Tabelle, Rechte werden gecacht
+AUTHENTICATION_BACKENDS = ['inventory.permissions.CachedPermissionBackend']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -150,8 +179,11 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-# WhiteNoise auch für Media-Dateien (Production)
-WHITENOISE_ROOT = os.path.join(BASE_DIR, 'media')
+# Media-Dateien liefert inventory.media.serve_media (mit Login-Prüfung) aus.
+# 'nginx': X-Accel-Redirect auf BEBO_MEDIA_ACCEL_PREFIX (interne Location mit alias auf MEDIA_ROOT)
+# 'sendfile': X-Sendfile (Apache/lighttpd), leer: Django sendet selbst
+BEBO_MEDIA_ACCEL = config('BEBO_MEDIA_ACCEL', default='')
+BEBO_MEDIA_ACCEL_PREFIX = config('BEBO_MEDIA_ACCEL_PREFIX', default='/protected-media/')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Login & Logout Konfiguration
@@ -164,6 +196,19 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"        # 1.6.0
 CRISPY_TEMPLATE_PACK = "bootstrap5"                 # 1.6.0
 
 
+# Hintergrund-Aufgaben: ohne Worker-Prozess (z.B. lokal) direkt im Request ausführen
+BEBO_JOBS_SYNC = config('BEBO_JOBS_SYNC', default=False, cast=bool)
+
+
+# History-Einträge älter als so viele Tage archiviert der Worker einmal täglich
+# (0 = aus; manuell: manage.py history_maintenance --days N)
+BEBO_HISTORY_RETENTION_DAYS = config('BEBO_HISTORY_RETENTION_DAYS', default=0, cast=int)
+
+
+# Maximale Größe eines Bildes beim Hochladen in Stücken (inventory/uploads.py)
+BEBO_UPLOAD_MAX_MB = config('BEBO_UPLOAD_MAX_MB', default=50, cast=int)
+
+
 # Versionierung
 BEBO_VERSION = '1.6.4'
 print(f"### BEBO VERSION GELADEN: {BEBO_VERSION} ###")
\ No newline at end of file
@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.conf import settings
-from django.views.static import serve
+
+from inventory.media import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -11,9 +11,9 @@ urlpatterns = [
     path('accounts/', include('django.contrib.auth.urls')),
 ]
 
-# Media-Dateien servieren (auch in Production)
-# In Production übernimmt normalerweise Nginx/Caddy, aber für kleine Apps ist das OK
-# Nutzt django.views.static.serve statt static() - funktioniert auch mit Gunicorn
+# Media-Dateien (Box-Bilder) nur für angemeldete Benutzer mit Leserecht.
+# Das eigentliche Senden übernimmt je nach BEBO_MEDIA_ACCEL Nginx/Apache oder
+# Django selbst mit Range-Unterstützung, siehe inventory/media.py
 urlpatterns += [
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-]
\ No newline at end of file
+    re_path(r'^media/(?P<path>.*)$', serve_media, name='media'),
+]
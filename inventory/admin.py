@@ -1,5 +1,11 @@
-from django.contrib import admin
-from .models import Location, Box, Category, BoxImage
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from .forms import BoxImportForm
+from .jobs import enqueue_box_import
+from .models import Location, Box, Category, BoxImage, Job, UploadSession
 from simple_history.admin import SimpleHistoryAdmin
 
 # Bilder direkt in der Box-Ansicht anzeigen
@@ -14,10 +20,45 @@ class BoxAdmin(SimpleHistoryAdmin):
     list_filter = ('location', 'status', 'categories')
     inlines = [BoxImageInline]
 
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='inventory_box_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        # Viele Boxen aus einer Datei: läuft als Hintergrund-Aufgabe (inventory/importexport.py)
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        form = BoxImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            job = enqueue_box_import(form.cleaned_data['file'], user=request.user, create_missing=form.cleaned_data['create_missing'])
+            messages.info(request, f"{job.description}: läuft im Hintergrund, das Ergebnis steht an der Aufgabe.")
+            return redirect(reverse('admin:inventory_job_change', args=[job.pk]))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': "Boxen importieren",
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/inventory/box/import_form.html', context)
+
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
     list_display = ('name', 'is_external')
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ('name', 'color')
\ No newline at end of file
+    list_display = ('name', 'color')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'description', 'box', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('payload', 'error', 'created_at', 'started_at', 'finished_at')
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'box', 'created_by', 'received', 'size', 'status', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('job', 'created_at', 'updated_at')
@@ -0,0 +1,169 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+
+from .asgi import AsyncPermissionRequiredMixin
+from .barcodes import barcode_error, normalize_label
+from .models import Box
+
+
+# --- Scan-API für Handscanner ---
+# Schlanke JSON-Endpunkte statt der kompletten Detailseite (Verlauf, Bilder, ...).
+# Pro Anfrage: eine Abfrage für alle gescannten Boxen, optional ein gebündelter
+# Statuswechsel (Ein-/Auschecken) über BoxQuerySet.move().
+# Die Views sind async (siehe inventory/asgi.py), damit viele Scanner
+# gleichzeitig bedient werden können.
+
+# Aktion -> Ziel-Status
+SCAN_ACTIONS = {
+    'checkout': 'ACCESS',   # Box wird entnommen ("Im Zugriff")
+    'checkin': 'STORED',    # Box kommt zurück ins Lager ("Gelagert")
+}
+
+# Obergrenze pro Anfrage (offline gepufferte Scans)
+MAX_SCANS_PER_REQUEST = 1000
+
+
+def box_as_json(box):
+    """Kompakte Darstellung einer Box für Scanner-Clients."""
+    return {
+        'label': box.label,
+        'status': box.status,
+        'status_display': box.get_status_display(),
+        'location': {'id': box.location_id, 'name': box.location.name},
+        'description': box.description,
+        'updated_at': box.updated_at.isoformat(),
+    }
+
+
+async def lookup_scan(code):
+    """Wie process_scans([code])[0] ohne Aktion, aber mit dem async ORM."""
+    label = normalize_label(code)
+    error = barcode_error(label)
+    if not error:
+        box = await Box.objects.select_related('location').filter(label=label).afirst()
+        if box is not None:
+            return {'code': code, 'ok': True, 'changed': False, 'box': box_as_json(box)}
+        error = "Box nicht gefunden."
+    return {'code': code, 'ok': False, 'error': error}
+
+
+def process_scans(scans, user, default_action=None):
+    """
+    Verarbeitet eine Liste von Scans (Strings oder {"code": ..., "action": ...}).
+
+    Bei mehreren Scans derselben Box gilt die letzte Aktion (typisch für
+    offline gepufferte Scans). Gibt pro Scan ein Ergebnis-Dict zurück,
+    in derselben Reihenfolge wie die Eingabe.
+    """
+    items = []
+    for scan in scans:
+        if isinstance(scan, dict):
+            code, action = str(scan.get('code', '')), scan.get('action', default_action)
+        else:
+            code, action = str(scan), default_action
+        items.append({'code': code, 'label': normalize_label(code), 'action': action})
+
+    # 1. Prüfen (Format + Prüfziffer) und Aktion validieren
+    for item in items:
+        if item['action'] is not None and not isinstance(item['action'], str):
+            item['error'] = "Aktion muss ein Text sein."
+            continue
+        if item['action'] and item['action'] not in SCAN_ACTIONS:
+            item['error'] = f"Unbekannte Aktion: {item['action']}"
+            continue
+        error = barcode_error(item['label'])
+        if error:
+            item['error'] = error
+
+    # 2. Alle Boxen mit einer Abfrage über den eindeutigen label-Index holen
+    labels = {item['label'] for item in items if 'error' not in item}
+    boxes = {box.label: box for box in Box.objects.select_related('location').filter(label__in=labels)}
+
+    # 3. Ziel-Status pro Box (letzte Aktion gewinnt) und gebündelt anwenden
+    targets = {}
+    for item in items:
+        if 'error' in item:
+            continue
+        if item['label'] not in boxes:
+            item['error'] = "Box nicht gefunden."
+        elif item['action']:
+            targets[item['label']] = SCAN_ACTIONS[item['action']]
+
+    changed = set()
+    for status in set(targets.values()):
+        group = [label for label, target in targets.items() if target == status]
+        pending = [label for label in group if boxes[label].status != status]
+        if pending:
+            Box.objects.filter(label__in=pending).move(status=status, user=user)
+            changed.update(pending)
+
+    # Geänderte Boxen neu laden: move() schreibt Status und updated_at per UPDATE
+    if changed:
+        boxes.update({box.label: box for box in Box.objects.select_related('location').filter(label__in=changed)})
+
+    # 4. Antwort zusammenbauen
+    results = []
+    for item in items:
+        if 'error' in item:
+            results.append({'code': item['code'], 'ok': False, 'error': item['error']})
+        else:
+            results.append({
+                'code': item['code'],
+                'ok': True,
+                'changed': item['label'] in changed,
+                'box': box_as_json(boxes[item['label']]),
+            })
+    return results
+
+
+class ScanView(AsyncPermissionRequiredMixin, View):
+    """
+    GET  /api/scan/<code>/          -> Box nachschlagen
+    POST /api/scan/                 -> {"codes": [...], "action": "checkout"|"checkin"}
+                                       oder {"code": "...", "action": ...}
+
+    Antwortet immer mit JSON (auch bei fehlendem Login: 401 statt Redirect).
+    """
+    permission_required = 'inventory.view_box'
+
+    def handle_no_permission(self):
+        # Scanner-Clients können mit einem Login-Redirect nichts anfangen
+        if not self.request.user.is_authenticated:
+            return JsonResponse({'error': "Nicht angemeldet."}, status=401)
+        return JsonResponse({'error': "Keine Berechtigung."}, status=403)
+
+    async def get(self, request, code):
+        result = await lookup_scan(code)
+        return JsonResponse(result, status=200 if result['ok'] else 404)
+
+    async def post(self, request, code=None):
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': "Ungültiges JSON."}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': "JSON-Objekt erwartet."}, status=400)
+
+        scans = payload.get('codes')
+        if scans is None:
+            scans = [payload.get('code') or code or '']
+        if not isinstance(scans, list):
+            return JsonResponse({'error': "'codes' muss eine Liste sein."}, status=400)
+        if len(scans) > MAX_SCANS_PER_REQUEST:
+            return JsonResponse({'error': f"Maximal {MAX_SCANS_PER_REQUEST} Scans pro Anfrage."}, status=400)
+
+        action = payload.get('action')
+        wants_change = action or any(isinstance(s, dict) and s.get('action') for s in scans)
+        if wants_change and not await request.user.ahas_perm('inventory.change_box'):
+            return JsonResponse({'error': "Keine Berechtigung zum Ändern von Boxen."}, status=403)
+
+        # Statuswechsel schreiben (History, Signale) -> synchron im Thread des Requests
+        results = await sync_to_async(process_scans)(scans, request.user, default_action=action)
+        return JsonResponse({
+            'results': results,
+            'ok': sum(1 for r in results if r['ok']),
+            'failed': sum(1 for r in results if not r['ok']),
+        })
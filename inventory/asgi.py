@@ -0,0 +1,56 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import PermissionRequiredMixin
+from django.core.handlers.asgi import ASGIRequest
+
+
+# --- ASGI-Betrieb (uvicorn, siehe docker-compose.asgi.yml) ---
+# Unter ASGI laufen synchrone Views in einem eigenen Thread pro Request, async
+# Views direkt in der Event-Loop des Workers. Die viel genutzten Lesepfade
+# (Dashboard, Box-Detailseite, Scan-API, Lese-API) sind deshalb async: sie
+# belegen nur während der eigentlichen Abfragen einen Thread, nicht während
+# Login-Prüfung, Warten auf den Client usw.
+#
+# Unter WSGI (Gunicorn) funktionieren dieselben Views unverändert, Django
+# führt sie dort synchron aus.
+#
+# LoginRequiredMixin/PermissionRequiredMixin sind rein synchron (request.user
+# lädt den Benutzer mit einer synchronen Abfrage) - async Views nehmen
+# stattdessen AsyncPermissionRequiredMixin.
+
+
+def is_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+class AsyncPermissionRequiredMixin(PermissionRequiredMixin):
+    """
+    Login + Berechtigung wie LoginRequiredMixin und PermissionRequiredMixin,
+    aber mit request.auser() / ahas_perms(). Danach ist request.user der
+    geladene Benutzer, Templates und Views können ihn ohne Abfrage benutzen.
+    Nur für Views, deren Handler (get, post, ...) async sind.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        request.user = user = await request.auser()
+        if not user.is_authenticated or not await user.ahas_perms(self.get_permission_required()):
+            return self.handle_no_permission()
+        # PermissionRequiredMixin.dispatch (synchrone Prüfung) überspringen
+        return await super(PermissionRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+async def stream_in_thread(iterator):
+    """
+    Streamt einen synchronen Iterator (Datei, Export mit DB-Cursor) unter
+    ASGI. Django würde ihn sonst komplett in den Speicher lesen, bevor das
+    erste Byte rausgeht. Jeder Block wird im Thread des Requests gelesen.
+    """
+    next_block = sync_to_async(next)
+    try:
+        while True:
+            block = await next_block(iterator, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        if hasattr(iterator, 'close'):
+            await sync_to_async(iterator.close)()
@@ -0,0 +1,99 @@
+# --- Barcodes im Format 94.xxxxxxxxx.p (Bechtold-Algorithmus) ---
+# Prüfziffer: die 9 Nutzziffern werden abwechselnd mit 3 und 1 gewichtet,
+# Prüfziffer = (10 - Summe % 10) % 10.
+#
+# Für Druckläufe und Importe (hunderttausende Codes) arbeiten diese Funktionen
+# tabellengesteuert: pro Position und Ziffer ist der gewichtete Beitrag
+# vorberechnet, statt jede Ziffer einzeln per int() umzuwandeln und zu
+# multiplizieren.
+
+PREFIX = '94'
+PAYLOAD_LENGTH = 9
+LABEL_LENGTH = len(PREFIX) + PAYLOAD_LENGTH + 1   # 12 Ziffern ohne Punkte
+MAX_PAYLOAD = 10 ** PAYLOAD_LENGTH - 1
+
+WEIGHTS = (3, 1, 3, 1, 3, 1, 3, 1, 3)
+
+# _CONTRIBUTION[position][ord(zeichen)] -> gewichteter Beitrag der Ziffer
+_CONTRIBUTION = [
+    {ord('0') + digit: digit * weight for digit in range(10)}
+    for weight in WEIGHTS
+]
+
+# Summe % 10 -> Prüfziffer
+_CHECK_DIGIT = [str((10 - remainder) % 10) for remainder in range(10)]
+
+
+def check_digit(payload):
+    """Prüfziffer (als String) zu 9 Nutzziffern, z.B. '123456789' -> '5'."""
+    total = 0
+    for table, char in zip(_CONTRIBUTION, payload.encode('ascii')):
+        total += table[char]
+    return _CHECK_DIGIT[total % 10]
+
+
+def make_label(number):
+    """Vollständiges Label (ohne Punkte) zu einer laufenden Nummer, z.B. 1 -> '940000000017'."""
+    payload = f"{number:0{PAYLOAD_LENGTH}d}"
+    return f"{PREFIX}{payload}{check_digit(payload)}"
+
+
+def normalize_label(value):
+    """
+    Label so, wie es gespeichert wird: ohne Punkte und Leerraum,
+    z.B. ' 94.000000001.7' -> '940000000017'. Box.save() speichert nur diese
+    Form, Nachschlagen per label=normalize_label(eingabe) trifft also immer.
+    """
+    return value.replace('.', '').strip()
+
+
+def format_label(label):
+    """'940000000017' -> '94.000000001.7' (wie der Template-Filter format_barcode)."""
+    return f"{label[:2]}.{label[2:11]}.{label[11:]}"
+
+
+def generate_labels(start, count):
+    """Liste von `count` Labels ab der laufenden Nummer `start`."""
+    if start < 0 or count < 0 or start + count - 1 > MAX_PAYLOAD:
+        raise ValueError(f"Nummernbereich muss zwischen 0 und {MAX_PAYLOAD} liegen.")
+    return [make_label(number) for number in range(start, start + count)]
+
+
+def barcode_error(value):
+    """
+    Prüft einen Code und gibt die Fehlermeldung zurück (oder None, wenn gültig).
+    Gleiche Meldungen wie validate_barcode() in models.py.
+    """
+    clean_code = value.replace('.', '')
+
+    if not clean_code.startswith(PREFIX):
+        return f"Code muss mit 94 beginnen. Gegeben: {value}"
+
+    if len(clean_code) != LABEL_LENGTH:
+        return f"Code hat falsche Länge ({len(clean_code)}). Erwartet: 12 Ziffern (ohne Punkte)."
+
+    if not clean_code.isdigit() or not clean_code.isascii():
+        return "Code darf nur Ziffern enthalten."
+
+    expected = check_digit(clean_code[2:11])
+    if clean_code[11] != expected:
+        return f"Prüfziffer falsch! Erwartet: {expected}, Gelesen: {clean_code[11]}"
+
+    return None
+
+
+def validate_barcodes(values):
+    """
+    Prüft viele Codes auf einmal und sammelt ALLE Fehler, statt beim ersten abzubrechen.
+
+    Rückgabe: (gültige Labels ohne Punkte, {eingabe: fehlermeldung})
+    """
+    valid = []
+    errors = {}
+    for value in values:
+        error = barcode_error(value)
+        if error is None:
+            valid.append(normalize_label(value))
+        else:
+            errors[value] = error
+    return valid, errors
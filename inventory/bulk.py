@@ -0,0 +1,54 @@
+import re
+
+from .barcodes import normalize_label, validate_barcodes
+from .models import Box
+
+
+# --- Sammel-Aktionen für viele Boxen ---
+# Z.B. eine Palette mit 200 Boxen an einen neuen Lagerort: statt 200 einzelner
+# Formular-Posts (je Box.save() + History-Insert) läuft alles in einer
+# Transaktion mit gebündelten UPDATEs und History-Inserts (siehe BoxQuerySet.move).
+
+
+def parse_labels(text):
+    """
+    Zerlegt eingefügte/gescannte Barcodes (Zeilen, Kommas, Leerzeichen) in eine
+    Liste normalisierter Labels ohne Punkte. Doppelte werden entfernt, die
+    Reihenfolge bleibt erhalten.
+    """
+    labels = []
+    seen = set()
+    for token in re.split(r'[\s,;]+', text or ''):
+        label = normalize_label(token)
+        if label and label not in seen:
+            seen.add(label)
+            labels.append(label)
+    return labels
+
+
+def move_boxes(labels, location=None, status=None, user=None):
+    """
+    Verschiebt die Boxen mit den angegebenen Barcodes an einen Lagerort und/oder
+    setzt ihren Status.
+
+    Rückgabe:
+        {
+            'moved': 180,           # tatsächlich geändert
+            'unchanged': 15,        # hatten die Zielwerte schon
+            'not_found': [...],     # gültige Barcodes ohne Box
+            'invalid': {label: fehlertext, ...},
+        }
+    """
+    valid, invalid = validate_barcodes(labels)
+
+    found = set(Box.objects.filter(label__in=valid).values_list('label', flat=True))
+    not_found = [label for label in valid if label not in found]
+
+    moved = Box.objects.filter(label__in=found).move(location=location, status=status, user=user)
+
+    return {
+        'moved': moved,
+        'unchanged': len(found) - moved,
+        'not_found': not_found,
+        'invalid': invalid,
+    }
@@ -0,0 +1,68 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+# --- Versionsnummern pro Box für Fragment-Cache und ETags ---
+# Jede Box hat im Cache eine zufällige Versionsnummer. Sie ändert sich bei
+# jeder Änderung an der Box, ihren Bildern, Kategorien oder ihrem Verlauf
+# (Signale in inventory/signals.py, dazu die Massen-Updates in history.py und
+# retention.py). Gecachte Fragmente (Dashboard-Karte, Kopf/Info der
+# Detailseite, Verlaufszeilen) und ETags enthalten die Versionsnummer, alte
+# Einträge werden also nie gelesen und laufen einfach ab.
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+VERSION_TIMEOUT = FRAGMENT_TIMEOUT * 7
+
+# Ohne gemeinsamen Cache (REDIS_URL) hat jeder Prozess (Gunicorn-Worker,
+# Job-Worker) seinen eigenen LocMemCache und sieht Invalidierungen der anderen
+# nicht. Versionsnummern und Rechte gelten dort deshalb nur so viele Sekunden.
+LOCAL_CACHE_TIMEOUT = 10
+
+
+def cache_is_shared():
+    """False, wenn der Cache nur im Speicher dieses Prozesses liegt (LocMemCache)."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def _version_timeout():
+    return VERSION_TIMEOUT if cache_is_shared() else LOCAL_CACHE_TIMEOUT
+
+
+def _version_key(box_id):
+    return f"bebo:box:{box_id}:version"
+
+
+def box_versions(box_ids):
+    """Versionsnummern für mehrere Boxen ({id: version}, ein Cache-Zugriff)."""
+    keys = {_version_key(pk): pk for pk in box_ids}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    for key, version in missing.items():
+        # add() statt set(): hat ein anderer Prozess inzwischen eine Nummer vergeben, gilt diese
+        if not cache.add(key, version, _version_timeout()):
+            version = cache.get(key, version)
+        versions[keys[key]] = version
+    return versions
+
+
+def box_version(box_id):
+    return box_versions([box_id])[box_id]
+
+
+def bump_box_versions(box_ids):
+    """Neue Versionsnummern nach dem Commit (vorher sähen andere Requests noch den alten Stand)."""
+    keys = [_version_key(pk) for pk in set(box_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({key: uuid.uuid4().hex for key in keys}, _version_timeout()))
+
+
+def make_etag(*parts):
+    """Schwaches ETag aus beliebigen Bestandteilen (Versionen, Benutzer, ...)."""
+    digest = hashlib.md5("|".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
@@ -1,6 +1,6 @@
 from django import forms
-from django.db.models.functions import Lower
-from .models import Box, Location, Category
+from .lookups import category_choices, location_choices
+from .models import Box, Location
 
 # 1. Das Widget: Erlaubt HTML-seitig mehrere Dateien (multiple)
 class MultipleFileInput(forms.ClearableFileInput):
@@ -24,6 +24,16 @@ class MultipleFileField(forms.FileField):
         # Wir geben die bereinigte Liste zurück
         return self.to_python(data)
 
+def use_cached_choices(field, choices):
+    """
+    Setzt die Auswahl eines Model-Felds aus dem Cache (inventory/lookups.py),
+    damit das Anzeigen des Formulars keine Abfrage kostet. Geprüft wird beim
+    Absenden weiterhin gegen das Queryset des Felds.
+    """
+    empty = [('', field.empty_label)] if getattr(field, 'empty_label', None) is not None else []
+    field.choices = empty + choices
+
+
 # 3. Das Formular
 class BoxForm(forms.ModelForm):
     # Wir nutzen unser neues Feld und unser neues Widget
@@ -40,11 +50,9 @@ class BoxForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(BoxForm, self).__init__(*args, **kwargs)
         
-        # Sortiere das 'location'-Feld alphabetisch nach dem Namen
-        self.fields['location'].queryset = Location.objects.order_by(Lower('name'))
-        
-        # Sortiere das 'categories'-Feld alphabetisch nach dem Namen
-        self.fields['categories'].queryset = Category.objects.order_by(Lower('name'))
+        # Lagerorte und Kategorien alphabetisch nach dem Namen (aus dem Cache)
+        use_cached_choices(self.fields['location'], location_choices())
+        use_cached_choices(self.fields['categories'], category_choices())
 
         # Das 'status'-Feld ist ein Choices-Feld, keine Datenbank-Abfrage.
         # Wenn wir es sortieren wollen, müssen wir die Choices direkt manipulieren.
@@ -75,4 +83,47 @@ class BoxForm(forms.ModelForm):
             'status': forms.Select(attrs={'class': 'form-select'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'categories': forms.SelectMultiple(attrs={'class': 'form-select', 'size': '5'}),
-        }
\ No newline at end of file
+        }
+
+
+# 4. Sammel-Umzug: viele Boxen auf einmal umlagern / Status setzen
+class BoxBulkMoveForm(forms.Form):
+    labels = forms.CharField(
+        label="Barcodes",
+        help_text="Ein Barcode pro Zeile (oder durch Komma/Leerzeichen getrennt), mit oder ohne Punkte.",
+        widget=forms.Textarea(attrs={'class': 'form-control font-monospace', 'rows': 8}),
+    )
+    location = forms.ModelChoiceField(
+        queryset=Location.objects.all(),
+        required=False,
+        label="Neuer Lagerort",
+        empty_label="(unverändert)",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    status = forms.ChoiceField(
+        choices=[('', '(unverändert)')] + sorted(Box.STATUS_CHOICES, key=lambda x: x[1].lower()),
+        required=False,
+        label="Neuer Status",
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_cached_choices(self.fields['location'], location_choices())
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('location') and not cleaned_data.get('status'):
+            raise forms.ValidationError("Bitte einen neuen Lagerort und/oder Status auswählen.")
+        return cleaned_data
+
+# 5. Import im Admin: CSV/JSONL-Datei hochladen (siehe inventory/importexport.py)
+class BoxImportForm(forms.Form):
+    file = forms.FileField(
+        label="Datei",
+        help_text="CSV (label,location,status,description,categories) oder JSONL, UTF-8.",
+    )
+    create_missing = forms.BooleanField(
+        required=False,
+        label="Unbekannte Lagerorte und Kategorien anlegen",
+    )
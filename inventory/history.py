@@ -0,0 +1,466 @@
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from simple_history.models import HistoricalRecords
+
+from .caching import bump_box_versions
+from .lookups import categories, locations
+from .models import ACTIVITY_ENTRY, Box
+
+
+# --- Box-Verlauf: Änderungen einmal berechnen, danach nur noch lesen ---
+# Früher hat BoxDetailView bei jedem Aufruf für jeden History-Eintrag
+# diff_against() aufgerufen und Lagerort-/Kategorienamen einzeln nachgeladen.
+# Jetzt werden die "übersetzten" Änderungen beim Schreiben des Eintrags
+# berechnet (bulk_create_history bzw. Signal post_create_historical_record)
+# und in HistoricalBox.change_summary gespeichert. Die Namen kommen dabei aus
+# dem Lagerort-/Kategorien-Cache (inventory/lookups.py).
+
+HistoricalBox = Box.history.model
+HistoricalBoxCategories = HistoricalBox.categories.model
+
+# Felder, die im Verlauf verglichen werden (wie diff_against: nur editierbare)
+DIFF_FIELDS = [f for f in Box._meta.concrete_fields if f.editable and not f.primary_key]
+
+# Einträge, die im Verlauf überhaupt angezeigt werden:
+# - mit Text (z.B. "Bild hinzugefügt: ...", "Status geändert: ...")
+# - Erstellen / Löschen
+# - Änderungen mit tatsächlichen Feld-Diffs
+MEANINGFUL_ENTRY = (
+    Q(history_change_reason__isnull=False) & ~Q(history_change_reason='') |
+    Q(history_type__in=['+', '-']) |
+    ~Q(change_summary=[])
+)
+
+
+# Sortierungen des globalen Aktivitäten-Feeds (URL-Parameter -> Feld)
+FEED_SORT_FIELDS = {
+    'wann': 'history_date',
+    'wer': 'history_user__username',
+    'aktion': 'history_type',
+    'box': 'label',
+    'lagerort': 'location__name',
+    'status': 'status',
+}
+
+
+def _category_ids_by_history(history_ids):
+    """history_id -> Menge der Kategorie-IDs (eine Abfrage für alle Einträge)."""
+    result = {history_id: set() for history_id in history_ids}
+    rows = HistoricalBoxCategories.objects.filter(history_id__in=history_ids).values_list('history_id', 'category_id')
+    for history_id, category_id in rows:
+        result[history_id].add(category_id)
+    return result
+
+
+def _format_change(field, old, new, location_names, category_names):
+    """Übersetzt Rohwerte (IDs, Codes) in Klarnamen für das Template."""
+    if field.name == 'location':
+        return location_names.get(old, "---"), location_names.get(new, "---")
+
+    if field.name == 'status':
+        choices = dict(Box.STATUS_CHOICES)
+        return choices.get(old, old), choices.get(new, new)
+
+    if field.name == 'categories':
+        old_names = sorted(category_names[pk] for pk in old if pk in category_names)
+        new_names = sorted(category_names[pk] for pk in new if pk in category_names)
+        return ", ".join(old_names) or "Keine", ", ".join(new_names) or "Keine"
+
+    # Fallback für andere Felder wie 'description'
+    return old if old else "---", new if new else "---"
+
+
+def _with_predecessors(records):
+    """
+    Lädt zu History-Einträgen (beliebiger Boxen) die direkten Vorgänger in
+    EINER Abfrage nach. Gibt {history_id: Vorgänger oder None} zurück.
+    """
+    previous_id = (
+        HistoricalBox.objects
+        .filter(id=OuterRef('id'))
+        .filter(
+            Q(history_date__lt=OuterRef('history_date')) |
+            Q(history_date=OuterRef('history_date'), history_id__lt=OuterRef('history_id'))
+        )
+        .order_by('-history_date', '-history_id')
+        .values('history_id')[:1]
+    )
+    history_ids = [r.history_id for r in records]
+    loaded = HistoricalBox.objects.filter(
+        history_id__in=(
+            HistoricalBox.objects
+            .filter(history_id__in=history_ids)
+            .annotate(previous_id=Subquery(previous_id))
+            .values('previous_id')
+        )
+    ).exclude(history_id__in=history_ids)
+
+    # Pro Box nach Zeit sortiert steht der Vorgänger direkt vor dem Eintrag:
+    # dazwischen kann es keinen weiteren Eintrag der Box geben
+    by_box = {}
+    for record in [*records, *loaded]:
+        by_box.setdefault(record.id, []).append(record)
+
+    result = {}
+    for chain in by_box.values():
+        chain.sort(key=lambda r: (r.history_date, r.history_id))
+        for previous, record in zip([None, *chain], chain):
+            result[record.history_id] = previous
+    return result
+
+
+def compute_change_summaries(records):
+    """
+    Berechnet die Feldänderungen für History-Einträge (beliebiger Boxen,
+    beliebige Reihenfolge) gegenüber ihrem jeweils direkten Vorgänger.
+    Gibt {history_id: [changes...]} zurück.
+    """
+    changed = [r for r in records if r.history_type == '~']
+    predecessors = _with_predecessors(changed) if changed else {}
+
+    category_ids = _category_ids_by_history(
+        [r.history_id for r in changed] + [p.history_id for p in predecessors.values() if p is not None]
+    )
+
+    # Rohe Änderungen sammeln, Namen erst danach gebündelt auflösen
+    raw_changes = {record.history_id: [] for record in records}
+    location_ids = set()
+    used_category_ids = set()
+
+    for record in changed:
+        previous = predecessors.get(record.history_id)
+        if previous is None:
+            continue
+
+        for field in DIFF_FIELDS:
+            old = getattr(previous, field.attname)
+            new = getattr(record, field.attname)
+            if old != new:
+                raw_changes[record.history_id].append((field, old, new))
+                if field.name == 'location':
+                    location_ids.update([old, new])
+
+        old_categories = category_ids[previous.history_id]
+        new_categories = category_ids[record.history_id]
+        if old_categories != new_categories:
+            field = Box._meta.get_field('categories')
+            raw_changes[record.history_id].append((field, old_categories, new_categories))
+            used_category_ids.update(old_categories | new_categories)
+
+    # Namen aus dem Cache (inventory/lookups.py); gelöschte fehlen dort wie in der Tabelle
+    # (nur wenn nötig - neue Boxen z.B. brauchen keine Namen)
+    location_names = {pk: row['name'] for pk, row in locations().items() if pk in location_ids} if location_ids else {}
+    category_names = {pk: row['name'] for pk, row in categories().items() if pk in used_category_ids} if used_category_ids else {}
+
+    summaries = {}
+    for history_id, changes in raw_changes.items():
+        summaries[history_id] = []
+        for field, old, new in changes:
+            old_value, new_value = _format_change(field, old, new, location_names, category_names)
+            summaries[history_id].append({
+                'field': str(field.verbose_name),
+                'old': old_value,
+                'new': new_value,
+            })
+    return summaries
+
+
+def save_change_summaries(records):
+    """
+    Berechnet change_summary für die Einträge und speichert es: ein UPDATE für
+    alle Einträge ohne Änderung, ein Bulk-Update für den Rest.
+    """
+    if not records:
+        return
+    summaries = compute_change_summaries(records)
+    for record in records:
+        record.change_summary = summaries[record.history_id]
+
+    HistoricalBox.objects.filter(
+        history_id__in=[r.history_id for r in records if not r.change_summary]
+    ).update(change_summary=[])
+    HistoricalBox.objects.bulk_update([r for r in records if r.change_summary], ['change_summary'], batch_size=500)
+
+
+def change_summary_batches(queryset, save=True, batch_size=500):
+    """
+    Berechnet fehlende change_summary-Werte für die Einträge des Querysets
+    (beliebig viele Boxen) stückweise und liefert jedes Stück als Liste.
+    Mit save=False wird nur berechnet, nicht gespeichert (Probeläufe).
+    """
+    missing = queryset.filter(change_summary__isnull=True).order_by('history_id')
+    last_id = None
+    while True:
+        batch = missing if last_id is None else missing.filter(history_id__gt=last_id)
+        records = list(batch[:batch_size])
+        if not records:
+            return
+        last_id = records[-1].history_id
+        if save:
+            save_change_summaries(records)
+        else:
+            summaries = compute_change_summaries(records)
+            for record in records:
+                record.change_summary = summaries[record.history_id]
+        yield records
+
+
+def ensure_change_summaries(box_id):
+    """
+    Holt fehlende change_summary-Werte einer Box nach (Einträge aus der Zeit,
+    bevor sie beim Schreiben berechnet wurden). Geladen werden nur die
+    fehlenden Einträge und ihre direkten Vorgänger; sind keine mehr offen,
+    ist das nur noch eine leere Abfrage.
+    """
+    save_change_summaries(list(HistoricalBox.objects.filter(id=box_id, change_summary__isnull=True)))
+
+
+def bulk_create_history(boxes, user=None, history_type='~'):
+    """
+    Schreibt History-Einträge für viele Boxen auf einmal (statt box.save() pro Box),
+    inklusive Kategorien-Snapshot, damit der Verlauf keine falschen
+    "Kategorien entfernt"-Änderungen zeigt. Der Text kommt aus box._change_reason.
+    """
+    if not boxes:
+        return []
+
+    records = Box.history.bulk_history_create(boxes, update=(history_type == '~'), default_user=user)
+
+    # Kategorie-Zuordnungen (Zeilen der Zwischentabelle) aller Boxen in einer Abfrage
+    through = Box.categories.through
+    rows_by_box = {}
+    for row_id, box_id, category_id in (
+        through.objects.filter(box_id__in=[b.pk for b in boxes]).values_list('id', 'box_id', 'category_id')
+    ):
+        rows_by_box.setdefault(box_id, []).append((row_id, category_id))
+
+    HistoricalBoxCategories.objects.bulk_create([
+        HistoricalBoxCategories(history=record, id=row_id, box_id=record.id, category_id=category_id)
+        for record in records
+        for row_id, category_id in rows_by_box.get(record.id, [])
+    ], batch_size=1000)
+    save_change_summaries(records)
+    bump_box_versions(record.id for record in records)
+    return records
+
+
+def history_entries(records):
+    """
+    Bereitet History-Einträge so auf, wie das Template sie erwartet.
+    Einträge mit Text zeigen nur den Text, ohne Feld-Diffs.
+    """
+    return [
+        {
+            'record': record,
+            'changes': [] if record.history_change_reason else (record.change_summary or []),
+        }
+        for record in records
+    ]
+
+
+def activity_feed(user=None, sort='wann', direction='desc'):
+    """
+    Queryset und Sortierung für den globalen Aktivitäten-Feed.
+
+    Filter und Sortierung passen zu den Teil-Indizes der History-Tabelle
+    (ACTIVITY_ENTRY, siehe BoxHistoricalRecords). Die ID als letzte
+    Sortierspalte läuft in dieselbe Richtung, damit ein Index beide
+    Richtungen abdeckt. Gibt (queryset, ordering) für KeysetPaginator zurück.
+    """
+    queryset = (
+        Box.history.filter(ACTIVITY_ENTRY)
+        .select_related('history_user')
+        .defer('change_summary')
+    )
+    if user is not None:
+        queryset = queryset.filter(history_user=user)
+
+    field = FEED_SORT_FIELDS.get(sort, FEED_SORT_FIELDS['wann'])
+    prefix = '' if direction == 'asc' else '-'
+    return queryset, [f'{prefix}{field}', f'{prefix}history_id']
+
+
+# --- Aktivitäten exportieren (CSV/JSONL, siehe global_history_export) ---
+# Der Export liest über einen serverseitigen Cursor (iterator) in Stücken,
+# es liegen also nie alle Einträge gleichzeitig im Speicher. Fehlende
+# change_summary-Werte (ältere Einträge) werden pro Stück nachberechnet.
+
+HISTORY_TYPE_LABELS = {'+': 'Erstellt', '~': 'Geändert', '-': 'Gelöscht'}
+EXPORT_FIELDS = ['history_id', 'date', 'user', 'action', 'label', 'location', 'status', 'reason', 'changes']
+EXPORT_CHUNK_SIZE = 2000
+
+
+def _missing_summaries(history_ids):
+    """Berechnet und speichert change_summary für die Einträge, {history_id: Änderungen}."""
+    if not history_ids:
+        return {}
+    records = list(HistoricalBox.objects.filter(history_id__in=history_ids))
+    save_change_summaries(records)
+    return {record.history_id: record.change_summary for record in records}
+
+
+def export_feed(queryset, ordering, chunk_size=EXPORT_CHUNK_SIZE):
+    """Einträge von activity_feed() als dicts, in der Sortierung des Feeds."""
+    location_names = {pk: row['name'] for pk, row in locations().items()}
+    rows = (
+        queryset.order_by(*ordering)
+        .values_list(
+            'history_id', 'history_date', 'history_user__username', 'history_type',
+            'label', 'location_id', 'status', 'history_change_reason', 'change_summary',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    while chunk := list(islice(rows, chunk_size)):
+        computed = _missing_summaries([row[0] for row in chunk if row[-1] is None])
+        for history_id, date, username, history_type, label, location_id, status, reason, summary in chunk:
+            if summary is None:
+                summary = computed.get(history_id)
+            yield {
+                'history_id': history_id,
+                'date': date.isoformat(),
+                'user': username or '',
+                'action': HISTORY_TYPE_LABELS.get(history_type, history_type),
+                'label': label,
+                'location': location_names.get(location_id, ''),
+                'status': status,
+                'reason': reason or '',
+                'changes': summary or [],
+            }
+
+
+# --- Bild-Aktionen gesammelt protokollieren ---
+# Früher hat jedes hochgeladene/gelöschte Bild ein eigenes box.save() ausgelöst
+# (20 Fotos = 20 History-Einträge). Jetzt werden die Aktionen innerhalb von
+# image_history_batch() (pro Request über die Middleware, pro Job im Worker)
+# gesammelt und am Ende als EIN Eintrag pro Box geschrieben, z.B.
+# "12 Bilder hinzugefügt: a.jpg, b.jpg, …".
+
+# Wie viele Dateinamen im Text höchstens genannt werden
+IMAGE_NAMES_SHOWN = 5
+
+_image_events = ContextVar('image_events', default=None)
+
+
+def _history_user_for(box):
+    """Benutzer wie bei box.save(): _history_user der Box, sonst der aus dem Request."""
+    user = getattr(box, '_history_user', None)
+    if user is None:
+        request = getattr(HistoricalRecords.context, 'request', None)
+        user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+def _image_reason_text(added, removed, names_shown):
+    parts = []
+    for names, one, many in (
+        (added, "Bild hinzugefügt", "Bilder hinzugefügt"),
+        (removed, "Bild gelöscht", "Bilder gelöscht"),
+    ):
+        if not names:
+            continue
+        label = one if len(names) == 1 else f"{len(names)} {many}"
+        if not names_shown:
+            parts.append(label)
+            continue
+        shown = ", ".join(names[:names_shown])
+        if len(names) > names_shown:
+            shown += ", …"
+        parts.append(f"{label}: {shown}")
+    return "; ".join(parts)
+
+
+def image_change_reason(added, removed):
+    """
+    History-Text für hinzugefügte und gelöschte Bilder (Listen von Dateinamen).
+    Passt der Text nicht in history_change_reason, werden weniger Namen genannt.
+    """
+    max_length = HistoricalBox._meta.get_field('history_change_reason').max_length
+    for names_shown in range(IMAGE_NAMES_SHOWN, -1, -1):
+        text = _image_reason_text(added, removed, names_shown)
+        if len(text) <= max_length:
+            return text
+    return text[:max_length - 1] + "…"
+
+
+def record_image_event(box, action, filename):
+    """
+    Merkt sich eine Bild-Aktion ('added' oder 'removed') für den
+    History-Eintrag der Box. Außerhalb von image_history_batch() wird
+    sofort geschrieben.
+    """
+    events = _image_events.get()
+    if events is None:
+        with image_history_batch():
+            record_image_event(box, action, filename)
+        return
+
+    entry = events.setdefault(box.pk, {'added': [], 'removed': [], 'user': None})
+    entry[action].append(filename)
+    entry['user'] = entry['user'] or _history_user_for(box)
+
+
+@contextmanager
+def image_history_batch():
+    """
+    Sammelt Bild-Aktionen und schreibt am Ende einen History-Eintrag pro Box.
+    Verschachtelte Aufrufe schreiben erst beim äußersten Block. Bei einer
+    Exception wird nichts geschrieben.
+    """
+    if _image_events.get() is not None:
+        yield
+        return
+
+    token = _image_events.set({})
+    try:
+        yield
+        events = _image_events.get()
+    finally:
+        _image_events.reset(token)
+    write_image_history(events)
+
+
+@asynccontextmanager
+async def aimage_history_batch():
+    """image_history_batch() für async Code (Middleware unter ASGI)."""
+    if _image_events.get() is not None:
+        yield
+        return
+
+    token = _image_events.set({})
+    try:
+        yield
+        events = _image_events.get()
+    finally:
+        _image_events.reset(token)
+    if events:
+        await sync_to_async(write_image_history)(events)
+
+
+def write_image_history(events):
+    """
+    Ein UPDATE für updated_at und ein Bulk-Insert für die History aller
+    betroffenen Boxen (statt box.save() pro Bild). Boxen, die inzwischen
+    gelöscht wurden, werden übersprungen.
+    """
+    if not events:
+        return []
+
+    now = timezone.now()
+    boxes = list(Box.objects.filter(pk__in=events.keys()))
+    if not boxes:
+        return []
+    Box.objects.filter(pk__in=[box.pk for box in boxes]).update(updated_at=now)
+
+    for box in boxes:
+        entry = events[box.pk]
+        box.updated_at = now
+        box._change_reason = image_change_reason(entry['added'], entry['removed'])
+        box._history_user = entry['user']
+    return bulk_create_history(boxes)
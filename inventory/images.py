@@ -0,0 +1,191 @@
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import BoxImage
+from .storage import content_digest, lock_content
+
+logger = logging.getLogger(__name__)
+
+
+# --- Bild-Varianten (Thumbnails) für BoxImage ---
+# Handy-Fotos sind oft mehrere MB groß. Für die Anzeige werden daraus einmalig
+# verkleinerte Varianten als JPEG und WebP erzeugt (EXIF-Drehung angewendet,
+# Metadaten wie GPS entfernt). Die Pfade stehen in BoxImage.variants, das
+# Original bleibt unverändert liegen.
+
+VARIANT_DIR = 'box_images/variants'
+
+# Name -> maximale Kantenlänge in Pixeln (Seitenverhältnis bleibt erhalten)
+VARIANT_SIZES = {
+    'thumb': 320,
+    'medium': 1024,
+    'large': 2048,
+}
+
+# Dateiformat -> (Pillow-Format, Endung, Speicheroptionen)
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+
+
+# Schlüssel in BoxImage.variants für Originale, die nicht gelesen werden konnten
+VARIANT_ERROR = 'error'
+
+
+def variant_files(variants):
+    """Dateinamen aus BoxImage.variants (ohne einen Fehlervermerk)."""
+    return {key: name for key, name in (variants or {}).items() if key != VARIANT_ERROR}
+
+
+def variant_key(size, fmt='jpeg'):
+    """Schlüssel in BoxImage.variants, z.B. 'medium' oder 'medium_webp'."""
+    return size if fmt == 'jpeg' else f"{size}_{fmt}"
+
+
+def verify_image(f):
+    """
+    Prüft, ob Pillow die Datei als unbeschädigtes Bild erkennt (wie Djangos
+    ImageField, ohne die Pixel zu dekodieren). Die Datei steht danach wieder am Anfang.
+    """
+    try:
+        with Image.open(f) as image:
+            image.verify()
+    except Exception:
+        # Pillow meldet kaputte Dateien mit ganz unterschiedlichen Exceptions
+        return False
+    finally:
+        f.seek(0)
+    return True
+
+
+def _open_normalized(box_image):
+    """Öffnet das Original, dreht es laut EXIF und wandelt es nach RGB."""
+    with box_image.image.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        # Transparenz (PNG) auf weißem Hintergrund, sonst wird sie bei JPEG schwarz
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        else:
+            image = image.convert('RGB')
+    return image
+
+
+def _encode(image, fmt):
+    pil_format, _, options = VARIANT_FORMATS[fmt]
+    buffer = BytesIO()
+    # Ohne exif=... schreibt Pillow keine Metadaten mit
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def _variant_names(box_image):
+    """
+    Zieldateien aller Varianten. Bei inhaltsadressierten Bildern hängen die
+    Namen am Hash, gleiche Fotos teilen sich also auch ihre Varianten.
+    """
+    digest = content_digest(box_image.image.name)
+    if digest:
+        prefix = f"{VARIANT_DIR}/{digest[:2]}/{digest}"
+    else:
+        stem = os.path.splitext(os.path.basename(box_image.image.name))[0]
+        prefix = f"{VARIANT_DIR}/{box_image.pk}/{stem}"
+    return {
+        variant_key(size, fmt): f"{prefix}_{size}.{extension}"
+        for size in VARIANT_SIZES
+        for fmt, (_, extension, _) in VARIANT_FORMATS.items()
+    }
+
+
+def generate_variants(box_image, force=False):
+    """
+    Erzeugt alle Varianten eines Bildes und speichert die Pfade in
+    box_image.variants (per UPDATE, löst also keine Signale/History aus).
+
+    Bereits vorhandene Varianten werden nur mit force=True neu erzeugt; das
+    gilt auch für Varianten, die ein gleiches, früher hochgeladenes Foto schon hat.
+    Bei unlesbaren Dateien wird der Fehler in variants vermerkt (damit das
+    Original nicht bei jedem Aufruf erneut dekodiert wird) und {} zurückgegeben;
+    die Templates zeigen dann das Original.
+    """
+    if box_image.variants and not force:
+        return variant_files(box_image.variants)
+
+    names = _variant_names(box_image)
+    if not force and content_digest(box_image.image.name) and all(default_storage.exists(n) for n in names.values()):
+        variants = names
+    else:
+        try:
+            source = _open_normalized(box_image)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logger.warning("Bild %s konnte nicht gelesen werden: %s", box_image.image.name, e)
+            # Vorhandene Varianten (force=True) bleiben in dem Fall stehen
+            if not variant_files(box_image.variants):
+                box_image.variants = {VARIANT_ERROR: str(e)[:200]}
+                BoxImage.objects.filter(pk=box_image.pk).update(variants=box_image.variants)
+            return {}
+
+        variants = {}
+        for size, max_edge in VARIANT_SIZES.items():
+            image = source.copy()
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            for fmt in VARIANT_FORMATS:
+                key = variant_key(size, fmt)
+                if default_storage.exists(names[key]):
+                    default_storage.delete(names[key])
+                variants[key] = default_storage.save(names[key], ContentFile(_encode(image, fmt)))
+
+    old_names = set(variant_files(box_image.variants).values()) - set(variants.values())
+    for name in old_names:
+        default_storage.delete(name)
+
+    box_image.variants = variants
+    BoxImage.objects.filter(pk=box_image.pk).update(variants=variants)
+    return variants
+
+
+def delete_variants(box_image):
+    """Entfernt die Varianten-Dateien eines Bildes."""
+    for name in variant_files(box_image.variants).values():
+        default_storage.delete(name)
+
+
+def release_image_files(box_image):
+    """
+    Nach dem Löschen eines BoxImage: Original und Varianten entfernen, sobald
+    kein anderes BoxImage mehr auf dieselbe Datei verweist. Die Verweise
+    werden in der Tabelle gezählt (Index auf image) und erst nach dem Commit
+    geprüft, damit ein Rollback keine Dateien kostet.
+
+    Die Prüfung läuft unter derselben Sperre wie das Speichern (lock_content):
+    ein gleichzeitiger Upload desselben Fotos wartet, bis die Dateien weg
+    sind, und legt sie dann neu an - oder die Freigabe wartet auf seinen
+    Commit und sieht danach den neuen Verweis.
+    """
+    name = box_image.image.name
+    if not name:
+        return
+    storage = box_image.image.storage
+    digest = content_digest(name)
+
+    def release():
+        with transaction.atomic():
+            if digest:
+                lock_content(digest)
+            if BoxImage.objects.filter(image=name).exists():
+                return
+            delete_variants(box_image)
+            storage.delete(name)
+    transaction.on_commit(release)
@@ -0,0 +1,332 @@
+import csv
+import json
+
+from django.db import transaction
+
+from .barcodes import normalize_label, validate_barcodes
+from .history import bulk_create_history
+from .lookups import categories, locations
+from .models import Box, Category, Location
+from .search import update_search_vectors
+
+
+# --- Boxen aus Dateien importieren / in Dateien exportieren ---
+# Für die Erstbefüllung eines Lagers (tausende Boxen) statt BoxCreateView pro
+# Box. Die Datei wird zeilenweise gelesen und in Stapeln verarbeitet, pro
+# Stapel gibt es:
+#   - eine Barcode-Prüfung für alle Labels (validate_barcodes)
+#   - eine Abfrage nach schon vorhandenen Labels
+#   - Lagerorte/Kategorien aus dem Speicher (Namen -> ID, siehe lookups.py)
+#   - je einen Bulk-Insert für Boxen, Kategorien-Zuordnungen, History und Suchindex
+#
+# Formate:
+#   CSV   label,location,status,description,categories  (Kategorien mit | getrennt,
+#         Trennzeichen , oder ; wird an der Kopfzeile erkannt)
+#   JSONL {"label": ..., "location": ..., "status": ..., "description": ..., "categories": [...]}
+#
+# Vorhandene Boxen werden nicht verändert, sondern als Fehler gemeldet.
+
+FIELDS = ['label', 'location', 'status', 'description', 'categories']
+CATEGORY_SEPARATOR = '|'
+BATCH_SIZE = 2000
+FORMATS = ('csv', 'jsonl')
+
+IMPORT_REASON = "Importiert"
+
+
+def detect_format(filename):
+    """'jsonl' für .jsonl/.ndjson/.json, sonst 'csv'."""
+    return 'jsonl' if str(filename).lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, file_format):
+    """
+    Liest eine Textdatei Zeile für Zeile.
+    Liefert (zeilennummer, daten, fehler) - daten ist ein dict oder None.
+    """
+    if file_format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Ungültiges JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield number, None, "JSON-Objekt erwartet."
+                continue
+            yield number, row, None
+        return
+
+    header = stream.readline()
+    if not header:
+        return
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    fieldnames = [name.strip().lower() for name in next(csv.reader([header], delimiter=delimiter))]
+    if 'label' not in fieldnames:
+        yield 1, None, "Spalte 'label' fehlt in der Kopfzeile."
+        return
+    reader = csv.DictReader(stream, fieldnames=fieldnames, delimiter=delimiter)
+    for row in reader:
+        # +1: Kopfzeile wurde schon vorher gelesen
+        yield reader.line_num + 1, row, None
+
+
+def _split_categories(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        names = value
+    else:
+        names = str(value).split(CATEGORY_SEPARATOR)
+    return [str(name).strip() for name in names if str(name).strip()]
+
+
+class BoxImporter:
+    """
+    Importiert Boxen stapelweise. Fehler werden pro Zeile gesammelt
+    (on_error(zeilennummer, text) bzw. self.errors), gültige Zeilen trotzdem
+    angelegt. Jeder Stapel läuft in einer eigenen Transaktion; on_batch(importer)
+    wird am Ende jedes Stapels noch innerhalb dieser Transaktion aufgerufen
+    (z.B. um den Zwischenstand mit zu committen, siehe state()/restore()).
+    """
+
+    def __init__(self, user=None, create_missing=False, dry_run=False, batch_size=BATCH_SIZE, on_error=None, max_errors=None, on_batch=None):
+        self.user = user
+        self.create_missing = create_missing
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.on_batch = on_batch
+        # Nur so viele Fehler im Speicher behalten (gezählt werden alle)
+        self.max_errors = max_errors
+
+        self.rows = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+        # Zeilennummer der letzten verarbeiteten Zeile (Ende des letzten Stapels)
+        self.last_line = 0
+
+        self._locations = {row['name'].casefold(): pk for pk, row in reversed(list(locations().items()))}
+        self._categories = {row['name'].casefold(): pk for pk, row in reversed(list(categories().items()))}
+        self._statuses = {}
+        for code, label in Box.STATUS_CHOICES:
+            self._statuses[code.casefold()] = code
+            self._statuses[label.casefold()] = code
+        # Labels aus früheren Stapeln (für Duplikate innerhalb der Datei)
+        self._seen = set()
+        # Im laufenden Stapel angelegte Lagerorte/Kategorien - erst nach dem
+        # Commit in self._locations/_categories übernehmen
+        self._pending = {Location: {}, Category: {}}
+
+    def error(self, number, message):
+        self.error_count += 1
+        if self.max_errors is None or len(self.errors) < self.max_errors:
+            self.errors.append((number, message))
+        if self.on_error:
+            self.on_error(number, message)
+
+    def run(self, rows):
+        """Verarbeitet alle Zeilen aus read_rows(). Gibt die Zusammenfassung zurück."""
+        batch = []
+        for entry in rows:
+            batch.append(entry)
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'errors': self.error_count,
+            'dry_run': self.dry_run,
+        }
+
+    def state(self):
+        """Zwischenstand als JSON-fähiges dict (nach einem Stapel)."""
+        return {
+            'line': self.last_line,
+            'rows': self.rows,
+            'created': self.created,
+            'errors': self.error_count,
+            'error_list': self.errors,
+        }
+
+    def restore(self, state):
+        """Setzt einen mit state() gespeicherten Zwischenstand fort (Zeilen bis 'line' überspringen)."""
+        self.last_line = state.get('line', 0)
+        self.rows = state.get('rows', 0)
+        self.created = state.get('created', 0)
+        self.error_count = state.get('errors', 0)
+        self.errors = [tuple(error) for error in state.get('error_list', [])]
+
+    def _resolve(self, mapping, model, name, max_length):
+        """ID zu einem Namen; legt mit create_missing neue Lagerorte/Kategorien an."""
+        key = name.casefold()
+        pending = self._pending[model]
+        if key in mapping:
+            return mapping[key], None
+        if key in pending:
+            return pending[key], None
+        if not self.create_missing:
+            return None, f"{model._meta.verbose_name} '{name}' gibt es nicht."
+        if len(name) > max_length:
+            return None, f"{model._meta.verbose_name} '{name}' ist zu lang (maximal {max_length} Zeichen)."
+        # Im Probelauf nur merken, dass es ihn geben würde
+        pending[key] = None if self.dry_run else model.objects.create(name=name).pk
+        return pending[key], None
+
+    def _import_batch(self, batch):
+        self.rows += len(batch)
+        self.last_line = batch[-1][0]
+
+        rows = []
+        for number, row, error in batch:
+            if error:
+                self.error(number, error)
+                continue
+            rows.append((number, row, str(row.get('label') or '').strip()))
+
+        valid, invalid = validate_barcodes([label for _, _, label in rows])
+        existing = set(Box.objects.filter(label__in=valid).values_list('label', flat=True))
+
+        for pending in self._pending.values():
+            pending.clear()
+        with transaction.atomic():
+            self._write_batch(rows, invalid, existing)
+            if self.on_batch:
+                self.on_batch(self)
+        # Erst jetzt gibt es die neuen Lagerorte/Kategorien sicher (bei einem
+        # Rollback würden spätere Stapel sonst auf nicht vorhandene IDs zeigen)
+        self._locations.update(self._pending[Location])
+        self._categories.update(self._pending[Category])
+
+    def _write_batch(self, rows, invalid, existing):
+        """Prüft die Zeilen eines Stapels und schreibt die gültigen (in dessen Transaktion)."""
+        boxes = []
+        category_ids = []
+        for number, row, raw_label in rows:
+            if not raw_label:
+                self.error(number, "Barcode fehlt.")
+                continue
+            if raw_label in invalid:
+                self.error(number, invalid[raw_label])
+                continue
+            label = normalize_label(raw_label)
+            if label in existing:
+                self.error(number, f"Box {label} existiert bereits.")
+                continue
+            if label in self._seen:
+                self.error(number, f"Box {label} steht mehrfach in der Datei.")
+                continue
+
+            location_name = str(row.get('location') or '').strip()
+            if not location_name:
+                self.error(number, "Lagerort fehlt.")
+                continue
+            location_id, error = self._resolve(self._locations, Location, location_name, 100)
+            if error:
+                self.error(number, error)
+                continue
+
+            status_value = str(row.get('status') or '').strip()
+            status = self._statuses.get(status_value.casefold(), None) if status_value else 'STORED'
+            if status is None:
+                self.error(number, f"Unbekannter Status '{status_value}'.")
+                continue
+
+            ids = []
+            category_error = None
+            for name in _split_categories(row.get('categories')):
+                category_id, category_error = self._resolve(self._categories, Category, name, 50)
+                if category_error:
+                    break
+                ids.append(category_id)
+            if category_error:
+                self.error(number, category_error)
+                continue
+
+            self._seen.add(label)
+            box = Box(label=label, location_id=location_id, status=status, description=str(row.get('description') or ''))
+            box._change_reason = IMPORT_REASON
+            boxes.append(box)
+            category_ids.append(ids)
+
+        if self.dry_run or not boxes:
+            self.created += len(boxes)
+            return
+
+        Box.objects.bulk_create(boxes, batch_size=self.batch_size)
+        through = Box.categories.through
+        through.objects.bulk_create([
+            through(box_id=box.pk, category_id=category_id)
+            for box, ids in zip(boxes, category_ids)
+            for category_id in dict.fromkeys(ids)
+        ], batch_size=self.batch_size)
+        bulk_create_history(boxes, user=self.user, history_type='+')
+        update_search_vectors([box.pk for box in boxes])
+        self.created += len(boxes)
+
+
+def export_rows(queryset=None, batch_size=BATCH_SIZE):
+    """
+    Alle Boxen als dicts (Namen statt IDs), in Stapeln nach ID gelesen,
+    damit auch große Bestände mit konstantem Speicher exportiert werden.
+    """
+    queryset = Box.objects.all() if queryset is None else queryset
+    location_names = {pk: row['name'] for pk, row in locations().items()}
+    category_names = {pk: row['name'] for pk, row in categories().items()}
+    through = Box.categories.through
+
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('pk', 'label', 'location_id', 'status', 'description')[:batch_size]
+        )
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+
+        categories_by_box = {}
+        for box_id, category_id in (
+            through.objects.filter(box_id__in=[row[0] for row in batch])
+            .order_by('id').values_list('box_id', 'category_id')
+        ):
+            categories_by_box.setdefault(box_id, []).append(category_names.get(category_id, ''))
+
+        for pk, label, location_id, status, description in batch:
+            yield {
+                'label': label,
+                'location': location_names.get(location_id, ''),
+                'status': status,
+                'description': description,
+                'categories': categories_by_box.get(pk, []),
+            }
+
+
+def write_rows(rows, stream, file_format, delimiter=','):
+    """Schreibt export_rows() als CSV oder JSONL. Gibt die Anzahl zurück."""
+    count = 0
+    if file_format == 'jsonl':
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+        return count
+
+    writer = csv.writer(stream, delimiter=delimiter)
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow([
+            row['label'], row['location'], row['status'], row['description'],
+            CATEGORY_SEPARATOR.join(row['categories']),
+        ])
+        count += 1
+    return count
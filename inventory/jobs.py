@@ -0,0 +1,293 @@
+import io
+import os
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import bump_box_versions
+from .history import image_history_batch
+from .images import generate_variants, verify_image
+from .importexport import BoxImporter, detect_format, read_rows
+from .models import BoxImage, Job
+from .retention import run_history_maintenance
+
+
+# --- Hintergrund-Aufgaben (Warteschlange in der Datenbank) ---
+# Views legen nur einen Job an und antworten sofort. Der Worker
+# (manage.py run_worker) holt wartende Jobs per SELECT ... FOR UPDATE SKIP LOCKED,
+# damit auch mehrere Worker parallel laufen können, ohne sich zu blockieren.
+#
+# Mit BEBO_JOBS_SYNC=True (z.B. lokal ohne Worker) laufen Jobs direkt nach
+# dem Commit im Request.
+
+MAX_ATTEMPTS = 3
+
+# Hochgeladene Dateien liegen hier, bis der Worker sie übernimmt
+INCOMING_DIR = 'box_images/incoming'
+IMPORT_DIR = 'imports'
+
+# So viele Fehlerzeilen eines Imports bleiben am Job stehen
+IMPORT_ERRORS_SHOWN = 100
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind, atomic=True):
+    """
+    Registriert eine Funktion als Handler für Jobs der Art `kind`.
+    Normalerweise läuft der Handler komplett in einer Transaktion; mit
+    atomic=False committet er selbst (z.B. stapelweise bei langen Importen).
+    """
+    def register(func):
+        func.atomic = atomic
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload, box=None, user=None, description=''):
+    """Legt einen neuen Job an (Teil der laufenden Transaktion)."""
+    job = Job.objects.create(
+        kind=kind,
+        payload=payload,
+        box=box,
+        created_by=user if user is not None and user.is_authenticated else None,
+        description=description,
+    )
+    if getattr(settings, 'BEBO_JOBS_SYNC', False):
+        transaction.on_commit(lambda: run_next_job(job_id=job.pk))
+    return job
+
+
+def claim_job(job_id=None):
+    """
+    Holt den ältesten wartenden Job und markiert ihn als RUNNING.
+    Gibt None zurück, wenn nichts zu tun ist.
+    """
+    with transaction.atomic():
+        jobs = Job.objects.select_for_update(skip_locked=True).filter(status='PENDING')
+        if job_id is not None:
+            jobs = jobs.filter(pk=job_id)
+        job = jobs.order_by('created_at', 'id').first()
+        if job is None:
+            return None
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at'])
+    return job
+
+
+def run_job(job):
+    """
+    Führt einen (bereits übernommenen) Job aus. Fehler landen im Job;
+    bis MAX_ATTEMPTS wird er danach erneut eingeplant.
+    """
+    handler = JOB_HANDLERS.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"Unbekannte Job-Art: {job.kind}")
+        if handler.atomic:
+            with transaction.atomic():
+                handler(job)
+        else:
+            handler(job)
+    except Exception:
+        job.error = traceback.format_exc()
+        job.status = 'PENDING' if handler is not None and job.attempts < MAX_ATTEMPTS else 'FAILED'
+    else:
+        job.error = ''
+        job.status = 'DONE'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def run_next_job(job_id=None):
+    """Übernimmt und startet den nächsten Job. Gibt ihn zurück (oder None)."""
+    job = claim_job(job_id)
+    if job is not None:
+        run_job(job)
+    return job
+
+
+def requeue_stale_jobs(timeout=timedelta(minutes=15)):
+    """
+    Stellt Jobs zurück, die seit `timeout` als RUNNING markiert sind
+    (z.B. weil der Worker abgestürzt ist). Lange Jobs setzen started_at
+    zwischendurch neu (siehe import_boxes), damit sie nicht doppelt laufen.
+    """
+    return Job.objects.filter(status='RUNNING', started_at__lt=timezone.now() - timeout).update(status='PENDING')
+
+
+def purge_finished_jobs(older_than=timedelta(days=7)):
+    """Löscht erledigte Jobs nach einer Woche (fehlgeschlagene bleiben sichtbar)."""
+    deleted, _ = Job.objects.filter(status='DONE', finished_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+# --- Job-Arten ---
+
+def stage_uploads(files):
+    """
+    Speichert hochgeladene Dateien nur zwischen (schneller Dateischreibvorgang
+    im Request) und gibt die Angaben für den Job zurück.
+    """
+    staged = []
+    for upload in files:
+        name = os.path.basename(upload.name)
+        path = default_storage.save(f"{INCOMING_DIR}/{uuid.uuid4().hex}_{name}", upload)
+        staged.append({'path': path, 'name': name})
+    return staged
+
+
+def enqueue_image_ingest(box, files, user=None):
+    """Zwischenspeichern + Job anlegen. Gibt None zurück, wenn keine Dateien da sind."""
+    if not files:
+        return None
+    staged = stage_uploads(files)
+    count = len(staged)
+    description = "1 Bild verarbeiten" if count == 1 else f"{count} Bilder verarbeiten"
+    return enqueue('ingest_images', {'files': staged}, box=box, user=user, description=description)
+
+
+@job_handler('ingest_images')
+def ingest_images(job):
+    """
+    Übernimmt zwischengespeicherte Uploads als BoxImage. Die Signale erzeugen
+    dabei Varianten und den History-Eintrag (mit dem Benutzer aus dem Request).
+    Bereits übernommene Dateien fehlen im Eingangsordner und werden bei einem
+    erneuten Versuch übersprungen. Dateien, die kein lesbares Bild sind, werden
+    verworfen und in job.payload['rejected'] vermerkt.
+    """
+    box = job.box
+    if box is None:  # Box inzwischen gelöscht
+        return
+    box._history_user = job.created_by
+
+    rejected = []
+    # Alle Bilder des Jobs ergeben einen gemeinsamen History-Eintrag
+    with image_history_batch():
+        for entry in job.payload.get('files', []):
+            path = entry['path']
+            if not default_storage.exists(path):
+                continue
+            with default_storage.open(path, 'rb') as f:
+                if verify_image(f):
+                    BoxImage.objects.create(box=box, image=File(f, name=entry['name']))
+                else:
+                    rejected.append(entry['name'])
+            transaction.on_commit(lambda path=path: default_storage.delete(path))
+
+    if rejected:
+        job.payload = {**job.payload, 'rejected': rejected}
+        Job.objects.filter(pk=job.pk).update(payload=job.payload)
+
+
+def enqueue_missing_variants(box, images):
+    """
+    Plant fehlende Varianten (ältere Uploads) als Job ein, statt sie beim
+    Anzeigen der Detailseite zu erzeugen; bis dahin zeigt sie die Originale.
+    Wartet für die Box schon ein solcher Job, wird kein zweiter angelegt.
+    """
+    missing = [box_image.pk for box_image in images if not box_image.variants]
+    if not missing:
+        return None
+    if Job.objects.filter(kind='image_variants', box=box, status__in=['PENDING', 'RUNNING']).exists():
+        return None
+    return enqueue('image_variants', {'images': missing}, box=box, description="Bild-Varianten erzeugen")
+
+
+@job_handler('image_variants')
+def image_variants(job):
+    """Erzeugt die Varianten (unlesbare Originale werden dabei vermerkt, siehe generate_variants)."""
+    for box_image in BoxImage.objects.filter(pk__in=job.payload.get('images', [])):
+        generate_variants(box_image)
+    # Gecachte Detailseiten zeigen sonst weiter die Originale
+    if job.box_id:
+        bump_box_versions([job.box_id])
+
+
+def enqueue_box_import(upload, user=None, create_missing=False):
+    """Import-Datei zwischenspeichern + Job anlegen (Admin-Upload)."""
+    name = os.path.basename(upload.name)
+    path = default_storage.save(f"{IMPORT_DIR}/{uuid.uuid4().hex}_{name}", upload)
+    return enqueue(
+        'import_boxes',
+        {'path': path, 'name': name, 'create_missing': create_missing},
+        user=user,
+        description=f"Boxen importieren: {name}"[:200],
+    )
+
+
+@job_handler('import_boxes', atomic=False)
+def import_boxes(job):
+    """
+    Importiert eine hochgeladene CSV/JSONL-Datei (siehe inventory/importexport.py).
+    Zusammenfassung und die ersten Fehlerzeilen landen in job.payload['result'].
+
+    Läuft ohne umschließende Transaktion: jeder Stapel wird zusammen mit dem
+    Zwischenstand (job.payload['progress']) committet. Ein erneuter Versuch
+    überspringt die schon importierten Zeilen.
+    """
+    path = job.payload['path']
+    if not default_storage.exists(path):
+        return
+
+    def save_progress(importer):
+        job.payload = {**job.payload, 'progress': importer.state()}
+        # started_at dient als Lebenszeichen für requeue_stale_jobs()
+        Job.objects.filter(pk=job.pk).update(payload=job.payload, started_at=timezone.now())
+
+    importer = BoxImporter(
+        user=job.created_by,
+        create_missing=job.payload.get('create_missing', False),
+        max_errors=IMPORT_ERRORS_SHOWN,
+        on_batch=save_progress,
+    )
+    importer.restore(job.payload.get('progress', {}))
+    done = importer.last_line
+
+    with default_storage.open(path, 'rb') as f:
+        text = io.TextIOWrapper(f, encoding='utf-8-sig', newline='')
+        rows = read_rows(text, detect_format(job.payload.get('name', path)))
+        summary = importer.run(entry for entry in rows if entry[0] > done)
+
+    payload = {key: value for key, value in job.payload.items() if key != 'progress'}
+    job.payload = {
+        **payload,
+        'result': {**summary, 'error_lines': [f"Zeile {number}: {message}" for number, message in importer.errors]},
+    }
+    Job.objects.filter(pk=job.pk).update(payload=job.payload)
+    default_storage.delete(path)
+
+
+def enqueue_history_maintenance(older_than_days):
+    """
+    Plant Kompaktieren + Archivieren der History ein (Worker, einmal am Tag).
+    Wartet oder läuft schon ein Durchgang, wird kein zweiter angelegt.
+    """
+    if Job.objects.filter(kind='history_maintenance', status__in=['PENDING', 'RUNNING']).exists():
+        return None
+    return enqueue(
+        'history_maintenance',
+        {'days': older_than_days},
+        description=f"History kompaktieren, älter als {older_than_days} Tage archivieren",
+    )
+
+
+@job_handler('history_maintenance', atomic=False)
+def history_maintenance(job):
+    """
+    Siehe inventory/retention.py. Beide Schritte committen stapelweise, ein
+    erneuter Versuch macht dort weiter, wo der vorige aufgehört hat.
+    """
+    removed, archived, segments = run_history_maintenance(job.payload['days'])
+    job.payload = {**job.payload, 'result': {'removed': removed, 'archived': archived, 'segments': segments}}
+    Job.objects.filter(pk=job.pk).update(payload=job.payload)
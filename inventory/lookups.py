@@ -0,0 +1,134 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .caching import LOCAL_CACHE_TIMEOUT, cache_is_shared
+from .models import Category, Location
+
+
+# --- Lagerorte und Kategorien aus dem Cache ---
+# Beide Tabellen sind klein und ändern sich selten, werden aber fast überall
+# gebraucht (Formulare, Dashboard-Filter, Verlauf). Statt sie jedes Mal
+# abzufragen und nach Lower('name') zu sortieren, liegen sie als Dictionaries
+# im Django-Cache (für alle Prozesse) und zusätzlich im Speicher des Prozesses.
+#
+# Gültig ist immer der Stand zur aktuellen Versionsnummer im Cache. Jede
+# Änderung an einem Lagerort oder einer Kategorie erhöht sie (Signale in
+# inventory/signals.py), alle Prozesse laden danach einmal neu. Ohne
+# gemeinsamen Cache läuft die Versionsnummer nach LOCAL_CACHE_TIMEOUT ab
+# (andere Prozesse sehen die Erhöhung sonst nie).
+#
+# Innerhalb eines Requests wird die Versionsnummer nur einmal gelesen
+# (LookupsMiddleware), nicht bei jedem |location_name im Template.
+
+VERSION_KEY = 'bebo:lookups:version'
+LOOKUP_TIMEOUT = 60 * 60 * 24
+
+# (Version, Daten) des Prozesses - als ein Tupel, damit Threads nie eine
+# halb aktualisierte Kombination sehen
+_local = (None, None)
+
+# Versionsnummer des laufenden Requests (dict, solange request_lookups() aktiv ist)
+_request_version = ContextVar('lookups_request_version', default=None)
+
+
+def _new_version():
+    # Zeitbasiert statt bei 1 beginnend: fällt der Zähler aus dem Cache,
+    # passt die neue Nummer nicht zufällig zu alten Daten
+    return int(time.time() * 1000)
+
+
+def _version_timeout():
+    return None if cache_is_shared() else LOCAL_CACHE_TIMEOUT
+
+
+@contextmanager
+def request_lookups():
+    """Liest die Versionsnummer innerhalb des Blocks höchstens einmal aus dem Cache."""
+    token = _request_version.set({})
+    try:
+        yield
+    finally:
+        _request_version.reset(token)
+
+
+def lookups_version():
+    """Aktuelle Versionsnummer (z.B. als Teil von Cache-Schlüsseln und ETags)."""
+    memo = _request_version.get()
+    if memo and 'version' in memo:
+        return memo['version']
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), _version_timeout())
+        version = cache.get(VERSION_KEY)
+    if memo is not None:
+        memo['version'] = version
+    return version
+
+
+def _load():
+    return {
+        'locations': {
+            row['id']: row
+            for row in Location.objects.order_by(Lower('name'), 'pk').values('id', 'name', 'is_external')
+        },
+        'categories': {
+            row['id']: row
+            for row in Category.objects.order_by(Lower('name'), 'pk').values('id', 'name', 'color')
+        },
+    }
+
+
+def _lookups():
+    global _local
+    version = lookups_version()
+    local_version, data = _local
+    if version is not None and version == local_version:
+        return data
+
+    key = f'bebo:lookups:{version}'
+    data = cache.get(key) if version is not None else None
+    if data is None:
+        data = _load()
+        if version is not None:
+            cache.set(key, data, LOOKUP_TIMEOUT)
+    _local = (version, data)
+    return data
+
+
+def locations():
+    """
+    Alle Lagerorte als {id: {'id', 'name', 'is_external'}}, nach Namen sortiert.
+    Die Dictionaries werden geteilt - nicht verändern.
+    """
+    return _lookups()['locations']
+
+
+def categories():
+    """Alle Kategorien als {id: {'id', 'name', 'color'}}, nach Namen sortiert."""
+    return _lookups()['categories']
+
+
+def location_choices():
+    return [(pk, row['name']) for pk, row in locations().items()]
+
+
+def category_choices():
+    return [(pk, row['name']) for pk, row in categories().items()]
+
+
+def invalidate_lookups():
+    """Neue Versionsnummer nach dem Commit -> alle Prozesse laden neu."""
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:  # Zähler (noch) nicht im Cache
+            cache.set(VERSION_KEY, _new_version(), _version_timeout())
+        memo = _request_version.get()
+        if memo:
+            memo.pop('version', None)
+    transaction.on_commit(bump)
@@ -0,0 +1,72 @@
+import os
+from functools import partial
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.caching import bump_box_versions
+from inventory.images import generate_variants, variant_files
+from inventory.models import BoxImage
+from inventory.storage import content_digest, image_storage
+
+
+def remove_legacy_files(old_name, old_variants):
+    """Alte Datei (falls nicht mehr verwendet) und alte Varianten löschen."""
+    for name in old_variants.values():
+        default_storage.delete(name)
+    if not BoxImage.objects.filter(image=old_name).exists():
+        image_storage.delete(old_name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Überführt vorhandene Box-Bilder in die inhaltsadressierte Ablage "
+        "(Dateiname = Hash des Inhalts, gleiche Fotos teilen sich eine Datei)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Nur zählen, nichts verschieben.")
+
+    def handle(self, *args, **options):
+        legacy = [
+            box_image for box_image in BoxImage.objects.order_by('pk').iterator(chunk_size=100)
+            if not content_digest(box_image.image.name)
+        ]
+        if options['dry_run']:
+            self.stdout.write(f"{len(legacy)} Bilder noch nicht umgestellt.")
+            return
+
+        moved = missing = 0
+        for box_image in legacy:
+            old_name = box_image.image.name
+            if not image_storage.exists(old_name):
+                missing += 1
+                self.stderr.write(f"Datei fehlt: {old_name}")
+                continue
+
+            # Pro Bild eine Transaktion: die Sperre aus lock_content() (beim
+            # Speichern) hält bis zum Commit, bis dahin kann release_image_files
+            # die neue Datei nicht löschen, weil der Verweis noch fehlt
+            with transaction.atomic():
+                with image_storage.open(old_name, 'rb') as f:
+                    new_name = image_storage.save(f"box_images/{os.path.basename(old_name)}", f)
+
+                old_variants = variant_files(box_image.variants)
+                BoxImage.objects.filter(pk=box_image.pk).update(image=new_name, variants={})
+                box_image.image.name = new_name
+                box_image.variants = {}
+                # Hat ein gleiches Foto schon Varianten, werden diese übernommen
+                generate_variants(box_image)
+
+                # Alte Dateien erst nach dem Commit löschen (ein Rollback behält den alten Verweis)
+                transaction.on_commit(partial(remove_legacy_files, old_name, old_variants))
+                # Gecachte Detailseiten zeigen sonst noch die alten URLs
+                bump_box_versions([box_image.box_id])
+            moved += 1
+
+        files = BoxImage.objects.values('image').distinct().count()
+        self.stdout.write(self.style.SUCCESS(
+            f"{moved} Bilder umgestellt, {missing} fehlende Dateien. "
+            f"{BoxImage.objects.count()} Bilder liegen jetzt in {files} Dateien."
+        ))
@@ -0,0 +1,37 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importexport import FORMATS, detect_format, export_rows, write_rows
+from inventory.models import Box
+
+
+class Command(BaseCommand):
+    help = "Exportiert alle Boxen als CSV oder JSONL (gleiches Format wie import_boxes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=FORMATS, help="Dateiformat (Standard: an der Endung von --output erkennen, sonst csv)")
+        parser.add_argument('--output', help="In Datei schreiben statt auf die Konsole")
+        parser.add_argument('--delimiter', default=',', help="Trennzeichen für CSV (Standard: ,)")
+        parser.add_argument('--location', help="Nur Boxen an diesem Lagerort (Name)")
+
+    def handle(self, *args, **options):
+        if len(options['delimiter']) != 1:
+            raise CommandError("--delimiter muss genau ein Zeichen sein.")
+
+        queryset = Box.objects.all()
+        if options['location']:
+            queryset = queryset.filter(location__name__iexact=options['location'])
+
+        output = options['output']
+        file_format = options['format'] or (detect_format(output) if output else 'csv')
+        rows = export_rows(queryset)
+        if output:
+            try:
+                with open(output, 'w', encoding='utf-8', newline='') as f:
+                    count = write_rows(rows, f, file_format, delimiter=options['delimiter'])
+            except OSError as e:
+                raise CommandError(str(e))
+            self.stderr.write(self.style.SUCCESS(f"{count} Boxen nach {output} geschrieben."))
+        else:
+            write_rows(rows, sys.stdout, file_format, delimiter=options['delimiter'])
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.barcodes import format_label, generate_labels
+from inventory.models import Box
+
+
+class Command(BaseCommand):
+    help = (
+        "Erzeugt fortlaufende Barcodes (94.xxxxxxxxx.p) inkl. Prüfziffer, z.B. für einen Etiketten-Druck. "
+        "Mit --allocate wird der erste freie zusammenhängende Bereich aus der Datenbank gewählt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help="Anzahl der Barcodes")
+        parser.add_argument('--start', type=int, default=1, help="Erste laufende Nummer (Standard: 1)")
+        parser.add_argument('--allocate', action='store_true', help="Ersten freien Bereich ab --start in der Datenbank suchen")
+        parser.add_argument('--plain', action='store_true', help="Ohne Punkte ausgeben (940000000017 statt 94.000000001.7)")
+        parser.add_argument('--output', help="In Datei schreiben statt auf die Konsole")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        start = options['start']
+        if count < 1:
+            raise CommandError("Anzahl muss mindestens 1 sein.")
+
+        try:
+            if options['allocate']:
+                start = Box.objects.free_label_range(count, start=start)
+            labels = generate_labels(start, count)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = labels if options['plain'] else [format_label(label) for label in labels]
+        text = "\n".join(lines) + "\n"
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+            self.stderr.write(self.style.SUCCESS(
+                f"{count} Barcodes ({format_label(labels[0])} bis {format_label(labels[-1])}) nach {options['output']} geschrieben."
+            ))
+        else:
+            self.stdout.write(text, ending='')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from inventory.images import generate_variants
+from inventory.models import BoxImage
+
+
+class Command(BaseCommand):
+    help = "Erzeugt die verkleinerten Bild-Varianten (Thumbnails, WebP) für vorhandene Box-Bilder."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Auch vorhandene Varianten neu erzeugen (z.B. nach geänderten Größen).")
+
+    def handle(self, *args, **options):
+        images = BoxImage.objects.order_by('pk')
+        if not options['force']:
+            images = images.filter(variants={})
+
+        done = failed = 0
+        for box_image in images.iterator(chunk_size=100):
+            if generate_variants(box_image, force=options['force']):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f"Nicht lesbar: {box_image.image.name}")
+
+        self.stdout.write(self.style.SUCCESS(f"{done} Bilder verarbeitet, {failed} Fehler."))
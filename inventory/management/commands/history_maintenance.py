@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.retention import archive_history, compact_history
+
+
+class Command(BaseCommand):
+    help = (
+        "Hält die Box-History klein: löscht Einträge ohne Änderung und archiviert "
+        "alte Einträge komprimiert (HistoryArchive). Der Verlauf der Detailseite "
+        "lädt archivierte Einträge bei Bedarf nach."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help="Einträge älter als so viele Tage archivieren (Standard: BEBO_HISTORY_RETENTION_DAYS).")
+        parser.add_argument('--no-compact', action='store_true', help="Einträge ohne Änderung nicht löschen.")
+        parser.add_argument('--no-archive', action='store_true', help="Nichts archivieren, nur kompaktieren.")
+        parser.add_argument('--dry-run', action='store_true', help="Nur anzeigen, was passieren würde.")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.BEBO_HISTORY_RETENTION_DAYS
+        dry_run = options['dry_run']
+        prefix = "[Testlauf] " if dry_run else ""
+
+        if not options['no_compact']:
+            removed = compact_history(dry_run=dry_run)
+            self.stdout.write(f"{prefix}{removed} Einträge ohne Änderung entfernt.")
+
+        if not options['no_archive']:
+            if days <= 0:
+                raise CommandError("Keine Aufbewahrungsdauer: --days angeben oder BEBO_HISTORY_RETENTION_DAYS setzen.")
+            archived, segments = archive_history(days, dry_run=dry_run)
+            self.stdout.write(f"{prefix}{archived} Einträge älter als {days} Tage archiviert ({segments} Boxen).")
+
+        self.stdout.write(self.style.SUCCESS("Fertig."))
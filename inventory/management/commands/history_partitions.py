@@ -0,0 +1,38 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.partitions import (
+    MONTHS_AHEAD, detach_history_partitions, ensure_history_partitions,
+    history_is_partitioned, history_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = "Verwaltet die Monats-Partitionen der Box-History: anlegen, auflisten, alte Monate abhängen."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=MONTHS_AHEAD, help=f"Partitionen für so viele Monate im Voraus anlegen (Standard: {MONTHS_AHEAD}).")
+        parser.add_argument('--detach-before', metavar='JJJJ-MM', help="Partitionen vor diesem Monat abhängen (bleiben als eigene Tabellen erhalten).")
+        parser.add_argument('--list', action='store_true', help="Vorhandene Partitionen anzeigen.")
+
+    def handle(self, *args, **options):
+        if not history_is_partitioned():
+            raise CommandError("Die History-Tabelle ist nicht partitioniert (Migration 0012 fehlt?).")
+
+        for name in ensure_history_partitions(options['ahead']):
+            self.stdout.write(f"Angelegt: {name}")
+
+        if options['detach_before']:
+            try:
+                before = datetime.datetime.strptime(options['detach_before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError("--detach-before erwartet JJJJ-MM, z.B. 2024-01.")
+            for name in detach_history_partitions(before):
+                self.stdout.write(f"Abgehängt: {name}")
+
+        if options['list']:
+            for month, name, rows in history_partitions():
+                self.stdout.write(f"{month:%Y-%m}  {name}  ~{rows} Zeilen")
+
+        self.stdout.write(self.style.SUCCESS("Fertig."))
@@ -0,0 +1,66 @@
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.importexport import BATCH_SIZE, FORMATS, BoxImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Importiert Boxen aus einer CSV- oder JSONL-Datei ('-' für stdin) in Stapeln. "
+        "Fehlerhafte Zeilen werden mit Zeilennummer gemeldet, alle anderen angelegt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="CSV/JSONL-Datei oder '-' für stdin")
+        parser.add_argument('--format', choices=FORMATS, help="Dateiformat (Standard: an der Endung erkennen, sonst csv)")
+        parser.add_argument('--create-missing', action='store_true', help="Unbekannte Lagerorte und Kategorien anlegen")
+        parser.add_argument('--user', help="Benutzername für die History-Einträge")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f"Zeilen pro Stapel (Standard: {BATCH_SIZE})")
+        parser.add_argument('--dry-run', action='store_true', help="Nur prüfen, nichts speichern")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size muss mindestens 1 sein.")
+
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Benutzer '{options['user']}' gibt es nicht.")
+
+        importer = BoxImporter(
+            user=user,
+            create_missing=options['create_missing'],
+            dry_run=options['dry_run'],
+            batch_size=options['batch_size'],
+            on_error=lambda number, message: self.stdout.write(f"Zeile {number}: {message}"),
+            max_errors=0,
+        )
+
+        path = options['file']
+        file_format = options['format'] or ('csv' if path == '-' else detect_format(path))
+        started = time.monotonic()
+        if path == '-':
+            summary = importer.run(read_rows(sys.stdin, file_format))
+        else:
+            try:
+                # utf-8-sig: Excel schreibt ein BOM vor die Kopfzeile
+                with open(path, encoding='utf-8-sig', newline='') as f:
+                    summary = importer.run(read_rows(f, file_format))
+            except OSError as e:
+                raise CommandError(str(e))
+        elapsed = time.monotonic() - started
+
+        verb = "würden angelegt" if summary['dry_run'] else "angelegt"
+        text = (
+            f"{summary['rows']} Zeilen in {elapsed:.1f} s: {summary['created']} Boxen {verb}, "
+            f"{summary['errors']} fehlerhaft."
+        )
+        if summary['errors']:
+            self.stderr.write(self.style.ERROR(text))
+        else:
+            self.stderr.write(self.style.SUCCESS(text))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from inventory.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Berechnet die Volltext-Suchvektoren aller Boxen neu (z.B. nach Massenänderungen per SQL)."
+
+    def handle(self, *args, **options):
+        update_search_vectors()
+        self.stdout.write(self.style.SUCCESS("Suchindex neu aufgebaut."))
@@ -0,0 +1,61 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from inventory.jobs import enqueue_history_maintenance, purge_finished_jobs, requeue_stale_jobs, run_next_job
+from inventory.partitions import ensure_history_partitions
+from inventory.uploads import purge_stale_uploads
+
+
+class Command(BaseCommand):
+    help = "Arbeitet die Hintergrund-Aufgaben (Bilder verarbeiten usw.) aus der Datenbank-Warteschlange ab."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Alle wartenden Jobs abarbeiten und dann beenden.")
+        parser.add_argument('--sleep', type=float, default=2.0, help="Wartezeit in Sekunden, wenn nichts zu tun ist (Standard: 2).")
+
+    def handle(self, *args, **options):
+        requeue_stale_jobs()
+        last_cleanup = timezone.now()
+        last_maintenance = None
+        self.stdout.write("Worker gestartet.")
+
+        try:
+            while True:
+                close_old_connections()
+                job = run_next_job()
+                if job is not None:
+                    style = self.style.SUCCESS if job.status == 'DONE' else self.style.WARNING
+                    self.stdout.write(style(f"Job {job.pk} ({job.kind}): {job.get_status_display()}"))
+                    continue
+
+                if options['once']:
+                    break
+
+                # Aufräumen höchstens einmal pro Stunde
+                if timezone.now() - last_cleanup > timedelta(hours=1):
+                    requeue_stale_jobs()
+                    purge_finished_jobs()
+                    purge_stale_uploads()
+                    last_cleanup = timezone.now()
+
+                # Einmal pro Tag: Partitionen für die nächsten Monate anlegen,
+                # History kompaktieren/archivieren (falls eingestellt) als Job einplanen:
+                # läuft nur bei einem Worker und wird nach einem Absturz erneut versucht
+                if last_maintenance is None or timezone.now() - last_maintenance > timedelta(days=1):
+                    for name in ensure_history_partitions():
+                        self.stdout.write(f"History-Partition angelegt: {name}")
+                    days = settings.BEBO_HISTORY_RETENTION_DAYS
+                    if days > 0:
+                        job = enqueue_history_maintenance(days)
+                        if job is not None:
+                            self.stdout.write(f"History-Wartung eingeplant (Job {job.pk}).")
+                    last_maintenance = timezone.now()
+
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker beendet.")
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from inventory.barcodes import validate_barcodes
+
+
+class Command(BaseCommand):
+    help = "Prüft Barcodes aus einer Datei (ein Code pro Zeile, '-' für stdin) und listet alle Fehler auf einmal."
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help="Datei mit Barcodes oder '-' für stdin")
+        parser.add_argument('--existing', action='store_true', help="Zusätzlich melden, welche gültigen Codes schon als Box existieren")
+
+    def handle(self, *args, **options):
+        if options['file'] == '-':
+            values = [line.strip() for line in sys.stdin]
+        else:
+            try:
+                with open(options['file'], encoding='utf-8') as f:
+                    values = [line.strip() for line in f]
+            except OSError as e:
+                raise CommandError(str(e))
+        values = [v for v in values if v]
+
+        valid, errors = validate_barcodes(values)
+
+        for value, error in errors.items():
+            self.stdout.write(f"{value}: {error}")
+
+        if options['existing'] and valid:
+            from inventory.models import Box
+            existing = set()
+            # In Blöcken abfragen, damit die IN-Liste nicht ausufert
+            for i in range(0, len(valid), 5000):
+                existing.update(Box.objects.filter(label__in=valid[i:i + 5000]).values_list('label', flat=True))
+            for label in sorted(existing):
+                self.stdout.write(f"{label}: existiert bereits")
+
+        summary = f"{len(values)} geprüft, {len(valid)} gültig, {len(errors)} fehlerhaft."
+        if errors:
+            self.stderr.write(self.style.ERROR(summary))
+        else:
+            self.stderr.write(self.style.SUCCESS(summary))
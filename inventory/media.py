@@ -0,0 +1,165 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required, permission_required
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .asgi import is_asgi, stream_in_thread
+from .jobs import INCOMING_DIR
+from .storage import content_digest
+
+
+# --- Bilder (Media-Dateien) ausliefern ---
+# Früher lief jedes Foto über django.views.static.serve durch einen
+# Gunicorn-Worker: ohne Range-Requests, ohne Caching, ohne Login-Prüfung.
+# serve_media prüft Login + Berechtigung und überlässt das eigentliche
+# Senden dann je nach BEBO_MEDIA_ACCEL:
+#
+#   'nginx'    -> X-Accel-Redirect auf eine interne Nginx-Location
+#                 (BEBO_MEDIA_ACCEL_PREFIX, z.B. /protected-media/)
+#   'sendfile' -> X-Sendfile mit dem Dateipfad (Apache mod_xsendfile, lighttpd)
+#   ''         -> Django selbst: FileResponse (sendfile über wsgi.file_wrapper)
+#                 mit Range-Unterstützung, ETag und Last-Modified; unter ASGI
+#                 blockweise über stream_in_thread (siehe inventory/asgi.py)
+#
+# Ausgeliefert werden nur Box-Bilder (MEDIA_DIR), nicht die Eingangsordner
+# (INCOMING_DIR: Uploads vor der Verarbeitung, Teil-Uploads) und nichts sonst
+# unter MEDIA_ROOT (z.B. hochgeladene Importdateien).
+#
+# Inhaltsadressierte Originale (Name = SHA-256, siehe inventory/storage.py)
+# ändern ihren Inhalt nie und dürfen vom Browser ein Jahr lang ohne Nachfrage
+# verwendet werden. Varianten nicht: generate_variants(force=True) schreibt
+# sie unter demselben Namen neu.
+
+CHUNK_SIZE = 64 * 1024
+
+MEDIA_DIR = 'box_images'
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+DEFAULT_MAX_AGE = 60 * 60
+
+
+def media_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def is_served(path):
+    """Nur Dateien unter MEDIA_DIR, aber nicht unter INCOMING_DIR."""
+    return path.startswith(f'{MEDIA_DIR}/') and not path.startswith(f'{INCOMING_DIR}/')
+
+
+def parse_range(header, size):
+    """
+    Ein einzelner Byte-Bereich aus dem Range-Header als (start, ende inkl.).
+    None: kein/unbekannter Header (ganze Datei). ValueError: nicht erfüllbar.
+    Mehrere Bereiche (bytes=0-1,5-6) werden wie kein Header behandelt.
+    """
+    match = RANGE_HEADER.match(header or '')
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # bytes=-500 -> die letzten 500 Bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _file_chunks(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _send_file(request, full_path, stat, content_type):
+    """Auslieferung durch Django (ganze Datei oder ein Byte-Bereich)."""
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    # If-Range: Bereich nur, wenn die Datei seitdem unverändert ist
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range not in (media_etag(stat), http_date(stat.st_mtime)):
+        byte_range = None
+
+    if byte_range is None and is_asgi(request):
+        # FileResponse würde unter ASGI erst komplett in den Speicher gelesen
+        response = StreamingHttpResponse(stream_in_thread(_file_chunks(full_path, 0, stat.st_size)), content_type=content_type)
+        response.headers['Content-Length'] = str(stat.st_size)
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        chunks = _file_chunks(full_path, start, length)
+        if is_asgi(request):
+            chunks = stream_in_thread(chunks)
+        response = StreamingHttpResponse(chunks, status=206, content_type=content_type)
+        response.headers['Content-Length'] = str(length)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+@login_required
+@permission_required('inventory.view_box', raise_exception=True)
+def serve_media(request, path):
+    """Liefert ein Box-Bild aus MEDIA_ROOT aus (siehe oben)."""
+    # '..' auflösen, bevor der Ordner geprüft wird (box_images/../imports/...)
+    path = posixpath.normpath(path)
+    if not is_served(path):
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError):  # ValueError: Pfad außerhalb von MEDIA_ROOT
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    etag = media_etag(stat)
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        accel = getattr(settings, 'BEBO_MEDIA_ACCEL', '')
+        if accel == 'nginx':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Accel-Redirect'] = settings.BEBO_MEDIA_ACCEL_PREFIX + quote(path)
+        elif accel == 'sendfile':
+            response = HttpResponse(content_type=content_type)
+            response.headers['X-Sendfile'] = full_path
+        else:
+            response = _send_file(request, full_path, stat, content_type)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    # Nur für angemeldete Benutzer -> nie in geteilten Caches (private)
+    if content_digest(path):
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, max_age=DEFAULT_MAX_AGE)
+    return response
@@ -0,0 +1,86 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .history import aimage_history_batch, image_history_batch
+from .lookups import request_lookups
+
+
+class ImageHistoryMiddleware:
+    """
+    Fasst alle Bild-Aktionen eines Requests (Upload, Löschen, Admin-Inline)
+    zu einem History-Eintrag pro Box zusammen.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with image_history_batch():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        async with aimage_history_batch():
+            return await self.get_response(request)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, das auch unter ASGI async bleibt. WhiteNoiseMiddleware ist
+    nur synchron - Django würde sonst jeden Request (auch die async Views
+    dahinter) komplett in einem Thread abarbeiten.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Statische Dateien sind klein, Django liest sie unter ASGI komplett ein
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class LookupsMiddleware:
+    """
+    Versionsnummer der Lagerorte/Kategorien (inventory/lookups.py) nur
+    einmal pro Request aus dem Cache lesen.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with request_lookups():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with request_lookups():
+            return await self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_historicalbox_categories'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='box',
+            index=models.Index(fields=['-updated_at', '-id'], name='box_updated_id_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:50
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+# Suchvektoren in einer eigenen Tabelle (BoxSearchDocument, 1:1 zur Box),
+# damit der tsvector weder in die History kopiert noch mit jeder Box geladen wird.
+# Einmaliges Befüllen für bestehende Boxen
+# (entspricht inventory.search.update_search_vectors()).
+FILL_SEARCH_VECTORS = """
+    INSERT INTO inventory_boxsearchdocument (box_id, vector)
+    SELECT b.id,
+        setweight(to_tsvector('german', coalesce(b.description, '')), 'A') ||
+        setweight(to_tsvector('german', coalesce(l.name, '')), 'B') ||
+        setweight(to_tsvector('german', coalesce((
+            SELECT string_agg(c.name, ' ')
+            FROM inventory_box_categories AS bc
+            JOIN inventory_category AS c ON c.id = bc.category_id
+            WHERE bc.box_id = b.id
+        ), '')), 'B')
+    FROM inventory_box AS b
+    JOIN inventory_location AS l ON l.id = b.location_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_box_updated_id_idx'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.CreateModel(
+            name='BoxSearchDocument',
+            fields=[
+                ('box', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='inventory.box')),
+                ('vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+            ],
+        ),
+        migrations.RunSQL(FILL_SEARCH_VECTORS, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='boxsearchdocument',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['vector'], name='box_search_vector_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='box',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['label'], name='box_label_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
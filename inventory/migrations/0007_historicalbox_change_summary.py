@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_box_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalbox',
+            name='change_summary',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Änderungen'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_historicalbox_change_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='boximage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Varianten'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_boximage_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50, verbose_name='Art')),
+                ('description', models.CharField(blank=True, max_length=200, verbose_name='Beschreibung')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Daten')),
+                ('status', models.CharField(choices=[('PENDING', 'Wartend'), ('RUNNING', 'In Arbeit'), ('DONE', 'Erledigt'), ('FAILED', 'Fehlgeschlagen')], default='PENDING', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Versuche')),
+                ('error', models.TextField(blank=True, verbose_name='Fehler')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('box', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='inventory.box', verbose_name='Box')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Erstellt von')),
+            ],
+            options={
+                'verbose_name': 'Hintergrund-Aufgabe',
+                'verbose_name_plural': 'Hintergrund-Aufgaben',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['created_at', 'id'], name='job_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historicalbox',
+            index=models.Index(condition=models.Q(('history_user__isnull', False), ('history_change_reason__isnull', False), ('history_type__in', ['+', '-']), _connector='OR'), fields=['history_date', 'history_id'], name='hbox_feed_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalbox',
+            index=models.Index(condition=models.Q(('history_user__isnull', False), ('history_change_reason__isnull', False), ('history_type__in', ['+', '-']), _connector='OR'), fields=['history_user', 'history_date', 'history_id'], name='hbox_feed_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalbox',
+            index=models.Index(condition=models.Q(('history_user__isnull', False), ('history_change_reason__isnull', False), ('history_type__in', ['+', '-']), _connector='OR'), fields=['history_type', 'history_id'], name='hbox_feed_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalbox',
+            index=models.Index(condition=models.Q(('history_user__isnull', False), ('history_change_reason__isnull', False), ('history_type__in', ['+', '-']), _connector='OR'), fields=['label', 'history_id'], name='hbox_feed_label_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historicalbox',
+            index=models.Index(condition=models.Q(('history_user__isnull', False), ('history_change_reason__isnull', False), ('history_type__in', ['+', '-']), _connector='OR'), fields=['status', 'history_id'], name='hbox_feed_status_idx'),
+        ),
+    ]
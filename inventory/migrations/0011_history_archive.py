@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_history_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('box_id', models.BigIntegerField(verbose_name='Box-ID')),
+                ('first_date', models.DateTimeField(verbose_name='Ältester Eintrag')),
+                ('last_date', models.DateTimeField(verbose_name='Neuester Eintrag')),
+                ('entry_count', models.PositiveIntegerField(verbose_name='Anzahl Einträge')),
+                ('data', models.BinaryField(verbose_name='Daten (gzip, JSON-Zeilen)')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'History-Archiv',
+                'verbose_name_plural': 'History-Archive',
+                'indexes': [models.Index(fields=['box_id', '-last_date'], name='history_archive_box_idx')],
+            },
+        ),
+    ]
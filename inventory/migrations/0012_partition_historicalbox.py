@@ -0,0 +1,132 @@
+from django.db import migrations
+
+
+# Die History-Tabelle wird in eine nach Monat partitionierte Tabelle
+# (PARTITION BY RANGE (history_date)) umgebaut:
+# - Partitionen vom ältesten Eintrag bis 3 Monate in die Zukunft, dazu eine
+#   DEFAULT-Partition als Auffangbecken (weitere Monate legt der Worker bzw.
+#   manage.py history_partitions an, siehe inventory/partitions.py)
+# - Der Primärschlüssel muss die Partitionsspalte enthalten -> (history_id, history_date).
+#   history_id bekommt seine Werte aus einer Sequenz (IDENTITY-Spalten gehen auf
+#   partitionierten Tabellen erst ab Postgres 17).
+# - Indizes und Fremdschlüssel werden aus dem Katalog übernommen und auf der
+#   neuen Tabelle (und damit allen Partitionen) neu angelegt.
+# Für Django ändert sich am Model nichts.
+
+PARTITION_HISTORY = """
+DO $$
+DECLARE
+    r record;
+    definition text;
+    index_defs text[] := ARRAY[]::text[];
+    fk_defs text[] := ARRAY[]::text[];
+    month date;
+    last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'inventory_historicalbox'::regclass) THEN
+        RETURN;
+    END IF;
+
+    FOR r IN
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'inventory_historicalbox'
+          AND indexname <> 'inventory_historicalbox_pkey'
+    LOOP
+        index_defs := index_defs || r.indexdef;
+    END LOOP;
+    FOR r IN
+        SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+        WHERE conrelid = 'inventory_historicalbox'::regclass AND contype = 'f'
+    LOOP
+        fk_defs := fk_defs || format('ALTER TABLE inventory_historicalbox ADD CONSTRAINT %I %s', r.conname, r.def);
+    END LOOP;
+
+    CREATE TABLE inventory_historicalbox_partitioned (LIKE inventory_historicalbox INCLUDING DEFAULTS)
+        PARTITION BY RANGE (history_date);
+    -- Eine evtl. kopierte Sequenz-Vorgabe gehört noch zur alten Tabelle (wird unten neu gesetzt)
+    ALTER TABLE inventory_historicalbox_partitioned ALTER COLUMN history_id DROP DEFAULT;
+
+    SELECT date_trunc('month', coalesce(min(history_date), now()) AT TIME ZONE 'UTC')::date
+        INTO month FROM inventory_historicalbox;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF inventory_historicalbox_partitioned FOR VALUES FROM (%L) TO (%L)',
+            'inventory_historicalbox_p' || to_char(month, 'YYYY_MM'),
+            month::text || ' 00:00:00+00',
+            (month + interval '1 month')::date::text || ' 00:00:00+00'
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+    CREATE TABLE inventory_historicalbox_default PARTITION OF inventory_historicalbox_partitioned DEFAULT;
+
+    INSERT INTO inventory_historicalbox_partitioned SELECT * FROM inventory_historicalbox;
+    DROP TABLE inventory_historicalbox;
+    ALTER TABLE inventory_historicalbox_partitioned RENAME TO inventory_historicalbox;
+
+    CREATE SEQUENCE inventory_historicalbox_history_id_seq OWNED BY inventory_historicalbox.history_id;
+    PERFORM setval('inventory_historicalbox_history_id_seq', coalesce((SELECT max(history_id) FROM inventory_historicalbox), 0) + 1, false);
+    ALTER TABLE inventory_historicalbox ALTER COLUMN history_id SET DEFAULT nextval('inventory_historicalbox_history_id_seq');
+    ALTER TABLE inventory_historicalbox ADD CONSTRAINT inventory_historicalbox_pkey PRIMARY KEY (history_id, history_date);
+
+    FOREACH definition IN ARRAY index_defs LOOP
+        EXECUTE definition;
+    END LOOP;
+    FOREACH definition IN ARRAY fk_defs LOOP
+        EXECUTE definition;
+    END LOOP;
+END $$;
+"""
+
+# Rückweg: wieder eine normale Tabelle (abgehängte Partitionen bleiben außen vor)
+UNPARTITION_HISTORY = """
+DO $$
+DECLARE
+    r record;
+    definition text;
+    index_defs text[] := ARRAY[]::text[];
+    fk_defs text[] := ARRAY[]::text[];
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'inventory_historicalbox'::regclass) THEN
+        RETURN;
+    END IF;
+
+    FOR r IN
+        SELECT indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'inventory_historicalbox'
+          AND indexname <> 'inventory_historicalbox_pkey'
+    LOOP
+        index_defs := index_defs || r.indexdef;
+    END LOOP;
+    FOR r IN
+        SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint
+        WHERE conrelid = 'inventory_historicalbox'::regclass AND contype = 'f'
+    LOOP
+        fk_defs := fk_defs || format('ALTER TABLE inventory_historicalbox ADD CONSTRAINT %I %s', r.conname, r.def);
+    END LOOP;
+
+    CREATE TABLE inventory_historicalbox_plain (LIKE inventory_historicalbox INCLUDING DEFAULTS);
+    INSERT INTO inventory_historicalbox_plain SELECT * FROM inventory_historicalbox;
+    ALTER SEQUENCE inventory_historicalbox_history_id_seq OWNED BY inventory_historicalbox_plain.history_id;
+    DROP TABLE inventory_historicalbox;
+    ALTER TABLE inventory_historicalbox_plain RENAME TO inventory_historicalbox;
+    ALTER TABLE inventory_historicalbox ADD CONSTRAINT inventory_historicalbox_pkey PRIMARY KEY (history_id);
+
+    FOREACH definition IN ARRAY index_defs LOOP
+        EXECUTE definition;
+    END LOOP;
+    FOREACH definition IN ARRAY fk_defs LOOP
+        EXECUTE definition;
+    END LOOP;
+END $$;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_history_archive'),
+    ]
+
+    operations = [
+        migrations.RunSQL(PARTITION_HISTORY, UNPARTITION_HISTORY),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+import inventory.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_partition_historicalbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='boximage',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Dateiname'),
+        ),
+        migrations.AlterField(
+            model_name='boximage',
+            name='image',
+            field=models.ImageField(db_index=True, storage=inventory.storage.get_image_storage, upload_to='box_images/', verbose_name='Bild'),
+        ),
+        # Vorhandene Bilder: bisheriger Dateiname als Originalname
+        migrations.RunSQL(
+            "UPDATE inventory_boximage SET original_name = regexp_replace(image, '^.*/', '') WHERE original_name = ''",
+            migrations.RunSQL.noop,
+        ),
+    ]
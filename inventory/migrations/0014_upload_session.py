@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:21
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0013_content_addressed_images'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='Dateiname')),
+                ('size', models.BigIntegerField(verbose_name='Größe (Bytes)')),
+                ('received', models.BigIntegerField(default=0, verbose_name='Empfangen (Bytes)')),
+                ('status', models.CharField(choices=[('OPEN', 'Läuft'), ('COMPLETE', 'Vollständig')], default='OPEN', max_length=10, verbose_name='Status')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('box', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='inventory.box', verbose_name='Box')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Erstellt von')),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='inventory.job', verbose_name='Job')),
+            ],
+            options={
+                'verbose_name': 'Upload',
+                'verbose_name_plural': 'Uploads',
+            },
+        ),
+    ]
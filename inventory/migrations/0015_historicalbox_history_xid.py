@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+# Erst die Spalte ohne Default anlegen, dann den Default setzen: mit einem
+# Default (pg_current_xact_id() ist volatil) würde Postgres alle Partitionen
+# neu schreiben. Bestehende Einträge behalten NULL.
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0014_upload_session'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historicalbox',
+            name='history_xid',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='Transaktion'),
+        ),
+        migrations.AlterField(
+            model_name='historicalbox',
+            name='history_xid',
+            field=models.BigIntegerField(blank=True, db_default=django.db.models.functions.comparison.Cast(django.db.models.functions.comparison.Cast(models.Func(function='pg_current_xact_id'), models.TextField()), models.BigIntegerField()), db_index=True, editable=False, null=True, verbose_name='Transaktion'),
+        ),
+    ]
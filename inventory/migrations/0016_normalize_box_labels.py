@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+# Labels wurden bisher so gespeichert, wie sie eingegeben wurden - auch mit
+# Punkten ('94.000000001.7'). Nachschlagen (Scan-API, Sammel-Umzug, Import,
+# Sync) und free_label_range() erwarten die Form ohne Punkte
+# (barcodes.normalize_label), die Box.save() ab jetzt immer schreibt.
+#
+# Gibt es die Form ohne Punkte schon (zweite Box mit derselben Nummer), bleibt
+# das Label unverändert; solche Dubletten müssen von Hand aufgelöst werden.
+# Bei mehreren Schreibweisen derselben Nummer wird nur die älteste Box umbenannt.
+NORMALIZE_LABELS = """
+    UPDATE inventory_box AS b
+    SET label = btrim(replace(b.label, '.', '')), updated_at = now()
+    WHERE b.label <> btrim(replace(b.label, '.', ''))
+      AND NOT EXISTS (
+          SELECT 1 FROM inventory_box AS o WHERE o.label = btrim(replace(b.label, '.', ''))
+      )
+      AND b.id = (
+          SELECT min(d.id) FROM inventory_box AS d
+          WHERE btrim(replace(d.label, '.', '')) = btrim(replace(b.label, '.', ''))
+      )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_historicalbox_history_xid'),
+    ]
+
+    operations = [
+        migrations.RunSQL(NORMALIZE_LABELS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,57 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY
+from django.core.cache import caches
+from django.db import migrations
+from django.utils import timezone
+
+
+# Die Session merkt sich den Backend-Pfad, mit dem sich jemand angemeldet hat.
+# Steht er nicht mehr in AUTHENTICATION_BACKENDS, gilt die Session als
+# abgemeldet. Seit dem Berechtigungs-Cache heißt das Backend
+# CachedPermissionBackend - bestehende Sessions werden darauf umgeschrieben,
+# damit nach dem Update niemand neu anmelden muss.
+#
+# Nur für Sessions in der Datenbank (SESSION_ENGINE db/cached_db); bei
+# cached_db wird zusätzlich die Kopie im Cache verworfen.
+OLD_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+NEW_BACKEND = 'inventory.permissions.CachedPermissionBackend'
+DB_ENGINES = ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db')
+
+
+def rewrite_sessions(apps, old_backend, new_backend):
+    if settings.SESSION_ENGINE not in DB_ENGINES:
+        return
+    engine = import_module(settings.SESSION_ENGINE)
+    Session = apps.get_model('sessions', 'Session')
+    active = Session.objects.filter(expire_date__gt=timezone.now()).values_list('session_key', 'session_data')
+    for session_key, session_data in active.iterator(chunk_size=1000):
+        store = engine.SessionStore(session_key)
+        data = store.decode(session_data)
+        if data.get(BACKEND_SESSION_KEY) != old_backend:
+            continue
+        data[BACKEND_SESSION_KEY] = new_backend
+        Session.objects.filter(session_key=session_key).update(session_data=store.encode(data))
+        if settings.SESSION_ENGINE.endswith('cached_db'):
+            caches[settings.SESSION_CACHE_ALIAS].delete(store.cache_key)
+
+
+def forwards(apps, schema_editor):
+    rewrite_sessions(apps, OLD_BACKEND, NEW_BACKEND)
+
+
+def backwards(apps, schema_editor):
+    rewrite_sessions(apps, NEW_BACKEND, OLD_BACKEND)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0016_normalize_box_labels'),
+        ('sessions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
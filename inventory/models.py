@@ -1,7 +1,18 @@
-from django.db import models
+import os
+import uuid
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Cast, Lead, Substr
+from django.utils import timezone
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from simple_history.models import HistoricalRecords
 from django.core.exceptions import ValidationError
-from simple_history.utils import update_change_reason
+
+from .barcodes import MAX_PAYLOAD, PREFIX, barcode_error, normalize_label
+from .storage import get_image_storage
 
 # --- Hilfsfunktionen (Deine Prüfziffern-Logik) ---
 
@@ -9,45 +20,74 @@ def validate_barcode(value):
     """
     Prüft das Format 94.xxxxxxxxx.p
     und berechnet die Prüfziffer nach Bechtold-Algorithmus.
+    Die eigentliche Logik (tabellengesteuert, auch für Massenprüfungen)
+    steckt in inventory/barcodes.py.
     """
-    # 1. Format bereinigen (Punkte entfernen)
-    clean_code = value.replace('.', '')
-    
-    if not clean_code.startswith('94'):
-        raise ValidationError(f"Code muss mit 94 beginnen. Gegeben: {value}")
-    
-    if len(clean_code) != 12: # 94 + 9 Ziffern + 1 Prüfziffer
-        raise ValidationError(f"Code hat falsche Länge ({len(clean_code)}). Erwartet: 12 Ziffern (ohne Punkte).")
-        
-    if not clean_code.isdigit():
-        raise ValidationError("Code darf nur Ziffern enthalten.")
-
-    # 2. Prüfziffer berechnen
-    # Wir nehmen die 9 Ziffern zwischen '94' und der letzten Ziffer
-    payload = clean_code[2:11] 
-    check_digit_input = int(clean_code[11])
-
-    # Gewichtung: 3, 1, 3, 1...
-    weights = [3, 1, 3, 1, 3, 1, 3, 1, 3]
-    total_sum = 0
-    
-    for i, digit in enumerate(payload):
-        total_sum += int(digit) * weights[i]
-        
-    # Modulo 10
-    remainder = total_sum % 10
-    
-    # Ergebnis: 10 - Rest
-    calculated_check_digit = (10 - remainder)
-    if calculated_check_digit == 10:
-        calculated_check_digit = 0 
-
-    if check_digit_input != calculated_check_digit:
-        raise ValidationError(f"Prüfziffer falsch! Erwartet: {calculated_check_digit}, Gelesen: {check_digit_input}")
+    error = barcode_error(value)
+    if error:
+        raise ValidationError(error)
 
 
 # --- Datenbank Tabellen ---
 
+# Einträge, die der globale Aktivitäten-Feed zeigt: mit Benutzer, mit Text
+# oder Erstellen/Löschen. Steht hier, weil die Teil-Indizes der History-Tabelle
+# (siehe BoxHistoricalRecords) exakt dieselbe Bedingung brauchen.
+ACTIVITY_ENTRY = (
+    models.Q(history_user__isnull=False) |
+    models.Q(history_change_reason__isnull=False) |
+    models.Q(history_type__in=['+', '-'])
+)
+
+
+class BoxHistoricalRecords(HistoricalRecords):
+    """
+    HistoricalRecords mit zusätzlichen Indizes für den Aktivitäten-Feed
+    (simple_history bietet dafür keine eigene Option).
+
+    Teil-Indizes nur über die angezeigten Einträge, je einer pro
+    Sortierung; die ID als letzte Spalte passt zur Keyset-Paginierung.
+    Postgres liest die Indizes auch rückwärts, daher reicht je einer für
+    auf- und absteigend.
+    """
+    FEED_INDEXES = [
+        (['history_date', 'history_id'], 'hbox_feed_date_idx'),
+        (['history_user', 'history_date', 'history_id'], 'hbox_feed_user_idx'),
+        (['history_type', 'history_id'], 'hbox_feed_type_idx'),
+        (['label', 'history_id'], 'hbox_feed_label_idx'),
+        (['status', 'history_id'], 'hbox_feed_status_idx'),
+    ]
+
+    def get_meta_options(self, model):
+        meta = super().get_meta_options(model)
+        meta['indexes'] = [
+            *meta.get('indexes', ()),
+            *(models.Index(fields=fields, name=name, condition=ACTIVITY_ENTRY) for fields, name in self.FEED_INDEXES),
+        ]
+        return meta
+
+
+class HistoricalBoxChanges(models.Model):
+    """
+    Zusatzfelder für die History-Tabelle der Boxen (über bases= an simple_history).
+
+    change_summary enthält die bereits "übersetzten" Feldänderungen gegenüber
+    dem vorherigen Eintrag, z.B. [{"field": "Lagerort", "old": "Keller", "new": "Garage"}].
+    Wird beim Schreiben des Eintrags berechnet; NULL haben nur ältere Einträge
+    (wird beim ersten Anzeigen nachgeholt, siehe inventory/history.py).
+    """
+    change_summary = models.JSONField("Änderungen", null=True, blank=True, editable=False)
+    # Transaktion, die den Eintrag geschrieben hat (Delta-Sync, siehe inventory/sync.py).
+    # Setzt die Datenbank selbst; ältere Einträge haben NULL.
+    history_xid = models.BigIntegerField(
+        "Transaktion", null=True, blank=True, editable=False, db_index=True,
+        db_default=Cast(Cast(models.Func(function='pg_current_xact_id'), models.TextField()), models.BigIntegerField()),
+    )
+
+    class Meta:
+        abstract = True
+
+
 class Location(models.Model):
     name = models.CharField("Name", max_length=100)
     description = models.TextField("Beschreibung", blank=True)
@@ -71,6 +111,102 @@ class Category(models.Model):
         verbose_name = "Kategorie"
         verbose_name_plural = "Kategorien"
 
+class BoxQuerySet(models.QuerySet):
+
+    def move(self, location=None, status=None, user=None, batch_size=1000):
+        """
+        Setzt Lagerort und/oder Status für alle Boxen des Querysets in Stapeln.
+
+        Pro Stapel gibt es ein UPDATE für die Boxen und einen Bulk-Insert für die
+        History (inkl. "Status geändert: X → Y" und history_user), statt
+        Box.save() pro Box. Alles läuft in einer Transaktion.
+        Gibt die Anzahl tatsächlich geänderter Boxen zurück.
+        """
+        # Lokale Imports vermeiden zirkuläre Abhängigkeiten (history/search importieren models)
+        from .history import bulk_create_history
+        from .search import update_search_vectors
+
+        values = {}
+        differs = models.Q()
+        if location is not None:
+            values['location'] = location
+            differs |= ~models.Q(location=location)
+        if status is not None:
+            values['status'] = status
+            differs |= ~models.Q(status=status)
+        if not values:
+            return 0
+
+        changed = 0
+        now = timezone.now()
+
+        def write(batch):
+            ids = [box.pk for box in batch]
+            # Alle Boxen bekommen dieselben Werte -> ein einfaches UPDATE reicht
+            Box.objects.filter(pk__in=ids).update(updated_at=now, **values)
+            for box in batch:
+                if status is not None and box.status != status:
+                    box._change_reason = Box.status_change_reason(box.status, status)
+                for name, value in values.items():
+                    setattr(box, name, value)
+                box.updated_at = now
+            bulk_create_history(batch, user=user)
+            if location is not None:
+                update_search_vectors(ids)
+            return len(batch)
+
+        with transaction.atomic():
+            batch = []
+            for box in self.filter(differs).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(box)
+                if len(batch) >= batch_size:
+                    changed += write(batch)
+                    batch = []
+            if batch:
+                changed += write(batch)
+        return changed
+
+    def free_label_range(self, count, start=1):
+        """
+        Sucht die erste freie, zusammenhängende Nummernfolge für `count` neue
+        Labels ab der laufenden Nummer `start` und gibt deren Startnummer zurück.
+
+        Die Lücken werden per Window-Funktion (LEAD) in der Datenbank gesucht,
+        statt jedes Label einzeln abzufragen. Reserviert nichts: wer parallel
+        Boxen anlegt, muss Kollisionen beim Speichern (unique) behandeln.
+        """
+        payload = Cast(Substr('label', len(PREFIX) + 1, 9), models.BigIntegerField())
+        numbered = (
+            self.filter(label__regex=rf'^{PREFIX}[0-9]{{10}}$', label__gte=f"{PREFIX}{start:09d}")
+            .annotate(payload=payload)
+        )
+
+        first = numbered.aggregate(first=models.Min('payload'))['first']
+        if first is None or first - start >= count:
+            candidate = start
+        else:
+            # Erste Lücke hinter einer belegten Nummer, die groß genug ist
+            gap = (
+                numbered
+                .annotate(next_payload=Window(Lead('payload'), order_by=F('payload').asc()))
+                .filter(models.Q(next_payload__gt=F('payload') + count) | models.Q(next_payload__isnull=True))
+                .order_by('payload')
+                .values_list('payload', flat=True)
+                .first()
+            )
+            candidate = gap + 1
+
+        if candidate + count - 1 > MAX_PAYLOAD:
+            raise ValueError(f"Kein freier Bereich für {count} Labels mehr vorhanden.")
+        return candidate
+
+    def update_status(self, status, user=None, batch_size=1000):
+        """
+        Setzt den Status für alle Boxen des Querysets (siehe move()).
+        """
+        return self.move(status=status, user=user, batch_size=batch_size)
+
+
 class Box(models.Model):
     STATUS_CHOICES = [
         ('STORED', 'Gelagert'),
@@ -88,30 +224,72 @@ class Box(models.Model):
     categories = models.ManyToManyField(Category, blank=True, verbose_name="Kategorien")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    history = HistoricalRecords(m2m_fields=[categories])
+    history = BoxHistoricalRecords(
+        m2m_fields=[categories],
+        bases=[HistoricalBoxChanges],
+    )
+
+    objects = BoxQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Merkt sich die Werte beim Laden aus der Datenbank. Damit erkennt save()
+        Status-Änderungen ohne erneutes SELECT.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    @classmethod
+    def status_change_reason(cls, old_status, new_status):
+        """Verständlicher History-Text für einen Statuswechsel."""
+        choices = dict(cls.STATUS_CHOICES)
+        return f"Status geändert: {choices.get(old_status, old_status)} → {choices.get(new_status, new_status)}"
+
+    def _loaded_status(self):
+        """Status laut Datenbank, möglichst aus dem Snapshot von from_db()."""
+        loaded = getattr(self, '_loaded_values', {})
+        if 'status' in loaded:
+            return loaded['status']
+        # Objekt wurde nicht aus der DB geladen (z.B. Box(pk=...)) -> einmal nachlesen
+        return Box.objects.filter(pk=self.pk).values_list('status', flat=True).first()
+
+    def clean(self):
+        # Vor der Unique-Prüfung: '94.000000001.7' und '940000000017' sind dieselbe Box
+        self.label = normalize_label(self.label)
 
     def save(self, *args, **kwargs):
         """
         Ergänzt bei Status-Änderungen einen verständlichen History-Text.
+        Das Label wird immer ohne Punkte gespeichert (normalize_label).
         """
-        change_reason = None
-
+        self.label = normalize_label(self.label)
         if self.pk:  # nur bei Updates vergleichen
-            try:
-                old = Box.objects.get(pk=self.pk)
-            except Box.DoesNotExist:
-                old = None
+            old_status = self._loaded_status()
+            if old_status is not None and old_status != self.status:
+                reason = self.status_change_reason(old_status, self.status)
+                # Schon gesetzten Text (z.B. Bild-Aktion) nicht überschreiben, sondern ergänzen
+                existing = getattr(self, '_change_reason', None)
+                self._change_reason = f"{existing}; {reason}" if existing else reason
 
-            if old and old.status != self.status:
-                old_status = old.get_status_display()
-                new_status = self.get_status_display()
-                change_reason = f"Status geändert: {old_status} → {new_status}"
+        # Beim Speichern legt simple_history den Eintrag an und übernimmt
+        # _change_reason direkt (kein nachträgliches update_change_reason nötig)
+        try:
+            super().save(*args, **kwargs)
+        finally:
+            # Text gilt nur für diesen einen Eintrag
+            self.__dict__.pop('_change_reason', None)
 
-        # Erst das eigentliche Speichern (hier legt simple_history den Eintrag an)
-        super().save(*args, **kwargs)
-        
-        if change_reason:
-            update_change_reason(self, change_reason)
+        # Snapshot aktualisieren, damit der nächste save() korrekt vergleicht
+        update_fields = kwargs.get('update_fields')
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if update_fields is None or field.name in update_fields or field.attname in update_fields:
+                loaded[field.attname] = getattr(self, field.attname)
 
     def __str__(self):
         return f"Box {self.label} ({self.location})"
@@ -119,11 +297,152 @@ class Box(models.Model):
     class Meta:
         verbose_name = "Box"
         verbose_name_plural = "Boxen"
+        indexes = [
+            # Passt zur Dashboard-Sortierung (-updated_at, -id) und deren Keyset-Paginierung
+            models.Index(fields=['-updated_at', '-id'], name='box_updated_id_idx'),
+            # Barcode-Fragmente (LIKE '%123%') über Trigramme
+            GinIndex(fields=['label'], name='box_label_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
+
+class BoxSearchDocument(models.Model):
+    """
+    Volltext-Index einer Box (Beschreibung, Lagerort, Kategorien), gepflegt über
+    inventory/search.py. Eigene Tabelle statt Feld an der Box, damit der
+    tsvector weder in die History kopiert noch bei jedem History-Eintrag
+    nachgeladen werden muss.
+    """
+    box = models.OneToOneField(Box, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    vector = SearchVectorField(null=True)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['vector'], name='box_search_vector_idx'),
+        ]
+
+class HistoryArchive(models.Model):
+    """
+    Archivierte History-Einträge einer Box (ein Abschnitt pro Archivierungslauf).
+
+    Die Einträge liegen gzip-komprimiert als JSON-Zeilen in `data`, damit die
+    eigentliche History-Tabelle klein bleibt. Der Verlauf auf der Detailseite
+    lädt sie bei Bedarf nach (siehe inventory/retention.py).
+    """
+    # Keine ForeignKey: das Archiv bleibt auch für gelöschte Boxen erhalten
+    box_id = models.BigIntegerField("Box-ID")
+    first_date = models.DateTimeField("Ältester Eintrag")
+    last_date = models.DateTimeField("Neuester Eintrag")
+    entry_count = models.PositiveIntegerField("Anzahl Einträge")
+    data = models.BinaryField("Daten (gzip, JSON-Zeilen)")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archiv Box {self.box_id}: {self.entry_count} Einträge bis {self.last_date:%d.%m.%Y}"
+
+    class Meta:
+        verbose_name = "History-Archiv"
+        verbose_name_plural = "History-Archive"
+        indexes = [
+            models.Index(fields=['box_id', '-last_date'], name='history_archive_box_idx'),
+        ]
 
 class BoxImage(models.Model):
     box = models.ForeignKey(Box, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField("Bild", upload_to='box_images/')
+    # Abgelegt unter dem Hash des Inhalts (inventory/storage.py); gleiche Fotos
+    # teilen sich eine Datei, der Index hilft beim Zählen der Verweise
+    image = models.ImageField("Bild", upload_to='box_images/', storage=get_image_storage, db_index=True)
+    # Dateiname beim Hochladen (für Verlauf und Anzeige)
+    original_name = models.CharField("Dateiname", max_length=255, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Verkleinerte Varianten, z.B. {"thumb": "box_images/variants/...jpg", "thumb_webp": ...}
+    # (erzeugt in inventory/images.py); {"error": ...} bei unlesbarem Original
+    variants = models.JSONField("Varianten", default=dict, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        # Vor dem Speichern ist image.name noch der hochgeladene Name
+        if self.image and not self.image._committed and not self.original_name:
+            self.original_name = os.path.basename(self.image.name)[:255]
+        super().save(*args, **kwargs)
+
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.image.name)
+
+    def variant_url(self, key):
+        """URL einer Variante; solange es sie nicht gibt, die des Originals."""
+        name = (self.variants or {}).get(key)
+        if name:
+            return self.image.storage.url(name)
+        return self.image.url
+
+    def __str__(self):
+        return f"Bild für {self.box.label}"
+
+class Job(models.Model):
+    """
+    Hintergrund-Aufgabe (z.B. hochgeladene Bilder verarbeiten).
+
+    Die Warteschlange liegt direkt in der Datenbank, ohne externen Broker.
+    Abgearbeitet wird sie vom Worker-Prozess (manage.py run_worker),
+    siehe inventory/jobs.py.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Wartend'),
+        ('RUNNING', 'In Arbeit'),
+        ('DONE', 'Erledigt'),
+        ('FAILED', 'Fehlgeschlagen'),
+    ]
+
+    kind = models.CharField("Art", max_length=50)
+    description = models.CharField("Beschreibung", max_length=200, blank=True)
+    payload = models.JSONField("Daten", default=dict, blank=True)
+    status = models.CharField("Status", max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    box = models.ForeignKey(Box, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs', verbose_name="Box")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Erstellt von")
+    attempts = models.PositiveSmallIntegerField("Versuche", default=0)
+    error = models.TextField("Fehler", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.description or self.kind} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Hintergrund-Aufgabe"
+        verbose_name_plural = "Hintergrund-Aufgaben"
+        indexes = [
+            # Der Worker sucht nur wartende Jobs -> kleiner Teil-Index
+            models.Index(fields=['created_at', 'id'], condition=models.Q(status='PENDING'), name='job_pending_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    Ein Bild, das in Stücken hochgeladen wird (siehe inventory/uploads.py).
+
+    Die Stücke landen direkt in einer Teildatei; `received` zählt die bereits
+    geschriebenen Bytes, damit ein abgebrochener Upload an dieser Stelle
+    weitermachen kann. Ist die Datei vollständig, übernimmt ein Job sie als BoxImage.
+    """
+    STATUS_CHOICES = [
+        ('OPEN', 'Läuft'),
+        ('COMPLETE', 'Vollständig'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    box = models.ForeignKey(Box, on_delete=models.CASCADE, related_name='uploads', verbose_name="Box")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Erstellt von")
+    filename = models.CharField("Dateiname", max_length=255)
+    size = models.BigIntegerField("Größe (Bytes)")
+    received = models.BigIntegerField("Empfangen (Bytes)", default=0)
+    status = models.CharField("Status", max_length=10, choices=STATUS_CHOICES, default='OPEN')
+    job = models.ForeignKey(Job, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Job")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Bild für {self.box.label}"
\ No newline at end of file
+        return f"{self.filename} ({self.received}/{self.size} Bytes)"
+
+    class Meta:
+        verbose_name = "Upload"
+        verbose_name_plural = "Uploads"
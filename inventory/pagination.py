@@ -0,0 +1,257 @@
+import base64
+import json
+
+from django.db import connections
+from django.db.models import Q
+
+
+# --- Keyset-Paginierung (Cursor statt Seitenzahl) ---
+# Django's Paginator arbeitet mit OFFSET/LIMIT und einem COUNT(*). Bei tiefen
+# Seiten muss die Datenbank alle vorherigen Zeilen lesen und verwerfen.
+# Hier merken wir uns stattdessen die Sortierwerte der letzten/ersten Zeile
+# einer Seite und lesen ab dort weiter ("WHERE (updated_at, id) < (...)").
+# So kostet Seite 500 genauso viel wie Seite 1.
+
+
+def _json_default(value):
+    # Datums-/Zeitwerte als ISO-String, alles andere (Decimal, UUID, ...) als Text
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(direction, values):
+    """
+    Baut aus Richtung ('n' = weiter, 'p' = zurück) und den Sortierwerten
+    einen URL-tauglichen Token.
+    """
+    payload = json.dumps({'d': direction, 'v': values}, separators=(',', ':'), default=_json_default)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Gegenstück zu encode_cursor(). Gibt (direction, values) zurück
+    oder None, wenn der Token kaputt oder manipuliert ist.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = payload['d']
+        values = payload['v']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+    if direction not in ('n', 'p') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class KeysetPage:
+    """
+    Eine Seite der Keyset-Paginierung. Bietet die Attribute, die die
+    Templates von Djangos Page-Objekt kennen (has_next, has_previous, ...),
+    liefert aber Cursor-Tokens statt Seitenzahlen.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """
+    Paginiert ein Queryset anhand einer eindeutigen Sortierung.
+
+    Die letzte Sortierspalte muss eindeutig sein (typisch: '-id'), damit
+    es bei gleichen Zeitstempeln keine doppelten oder fehlenden Zeilen gibt.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.fields = [o.lstrip('-') for o in self.ordering]
+        resolved = [self._resolve_field(f) for f in self.fields]
+        self.model_fields = [field for field, _ in resolved]
+        self.nullable = [nullable for _, nullable in resolved]
+
+    def _resolve_field(self, field_path):
+        """
+        Findet das Model-Feld zu einem Pfad wie 'history_user__username'.
+        Gibt (feld, kann_null_sein) zurück; über eine nullable Relation
+        (LEFT JOIN) kann auch ein NOT-NULL-Feld NULL liefern.
+        Annotationen (z.B. 'rank' der Suche) haben kein Feld -> (None, True).
+        """
+        if field_path in self.queryset.query.annotations:
+            return None, True
+        current = self.queryset.model
+        field = None
+        nullable = False
+        for part in field_path.split('__'):
+            field = current._meta.get_field(part)
+            nullable = nullable or field.null
+            if field.is_relation and field.related_model:
+                current = field.related_model
+        return field, nullable
+
+    def _reverse_ordering(self):
+        return [o[1:] if o.startswith('-') else f'-{o}' for o in self.ordering]
+
+    def _values_for(self, obj):
+        """Sortierwerte eines Objekts (auch über Relationen wie 'history_user__username')."""
+        values = []
+        for field in self.fields:
+            value = obj
+            for part in field.split('__'):
+                if value is None:
+                    break
+                value = getattr(value, part, None)
+            # Bei ForeignKeys nicht das Objekt, sondern dessen PK vergleichen
+            if hasattr(value, 'pk'):
+                value = value.pk
+            values.append(value)
+        return values
+
+    def _to_python(self, values):
+        """Wandelt die JSON-Werte aus dem Cursor zurück in Python-Typen."""
+        converted = []
+        for field, value in zip(self.model_fields, values):
+            if value is not None and field is not None:
+                if field.is_relation:
+                    field = field.target_field
+                value = field.to_python(value)
+            converted.append(value)
+        return converted
+
+    def _seek_filter(self, ordering, values):
+        """
+        Baut die Bedingung "liegt in Sortierrichtung hinter values".
+        Für (a DESC, b DESC) ergibt das: a < x OR (a = x AND b < y).
+
+        NULL-Werte folgen der Postgres-Reihenfolge (ASC: NULLS LAST,
+        DESC: NULLS FIRST), damit auch nullable Spalten sauber blättern.
+        """
+        condition = Q()
+        equal_prefix = Q()
+        for order, field, nullable, value in zip(ordering, self.fields, self.nullable, values):
+            descending = order.startswith('-')
+            if value is None:
+                after = Q(**{f'{field}__isnull': False}) if descending else None
+                equal = Q(**{f'{field}__isnull': True})
+            else:
+                after = Q(**{f'{field}__lt' if descending else f'{field}__gt': value})
+                if not descending and nullable:
+                    after |= Q(**{f'{field}__isnull': True})
+                equal = Q(**{field: value})
+            if after is not None:
+                condition |= equal_prefix & after
+            equal_prefix &= equal
+        return condition
+
+    def _page_query(self, token):
+        """
+        Queryset für die Seite zum Cursor-Token (eine Zeile mehr als per_page)
+        und (richtung, hat_cursor). Ungültige Tokens führen (wie bei
+        Paginator.get_page) einfach zur ersten Seite.
+        """
+        cursor = decode_cursor(token)
+        if cursor is not None and len(cursor[1]) != len(self.fields):
+            cursor = None
+
+        if cursor is not None:
+            try:
+                values = self._to_python(cursor[1])
+            except Exception:
+                cursor = None
+
+        if cursor is None:
+            direction = 'n'
+            queryset = self.queryset.order_by(*self.ordering)
+        else:
+            direction = cursor[0]
+            ordering = self.ordering if direction == 'n' else self._reverse_ordering()
+            queryset = self.queryset.filter(self._seek_filter(ordering, values)).order_by(*ordering)
+
+        # Eine Zeile mehr holen, um zu wissen, ob es weitergeht (spart das COUNT)
+        return queryset[:self.per_page + 1], direction, cursor is not None
+
+    def _make_page(self, rows, direction, has_cursor):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'p':
+            rows.reverse()
+            has_next = True
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = has_cursor
+
+        next_cursor = None
+        previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor('n', self._values_for(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor('p', self._values_for(rows[0]))
+
+        return KeysetPage(rows, self, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+    def get_page(self, token):
+        """Liefert die Seite zum Cursor-Token."""
+        queryset, direction, has_cursor = self._page_query(token)
+        return self._make_page(list(queryset), direction, has_cursor)
+
+    async def aget_page(self, token):
+        """get_page() für async Views (async ORM, Prefetches inklusive)."""
+        queryset, direction, has_cursor = self._page_query(token)
+        return self._make_page([row async for row in queryset], direction, has_cursor)
+
+
+# Bis zu dieser Größe wird genau gezählt, darüber nur geschätzt
+EXACT_COUNT_LIMIT = 10000
+
+
+def estimated_count(queryset):
+    """
+    Anzahl der Zeilen eines Querysets, ohne COUNT(*) über große Tabellen.
+
+    Nimmt die Schätzung des Postgres-Planers (EXPLAIN, ohne Ausführung).
+    Liegt sie unter EXACT_COUNT_LIMIT, wird doch genau gezählt, weil das dann
+    billig ist. Gibt (anzahl, ist_geschätzt) zurück.
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate > EXACT_COUNT_LIMIT:
+            return estimate, True
+    return queryset.count(), False
@@ -0,0 +1,139 @@
+import datetime
+import re
+
+from django.db import connection, transaction
+
+
+# --- Monats-Partitionen der History-Tabelle ---
+# Seit Migration 0012 ist inventory_historicalbox nach history_date
+# partitioniert (ein Monat pro Partition + DEFAULT-Partition). Abfragen auf die
+# letzten Wochen lesen so nur die jüngsten Partitionen, alte Monate lassen sich
+# per DETACH in Sekunden abhängen (z.B. zum Sichern und Löschen).
+
+HISTORY_TABLE = 'inventory_historicalbox'
+DEFAULT_PARTITION = f'{HISTORY_TABLE}_default'
+PARTITION_PATTERN = re.compile(rf'^{HISTORY_TABLE}_p(\d{{4}})_(\d{{2}})$')
+
+# So viele Monate im Voraus werden Partitionen angelegt
+MONTHS_AHEAD = 3
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month):
+    # Grenzen immer in UTC, unabhängig von der Zeitzone der Verbindung
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def partition_name(month):
+    return f"{HISTORY_TABLE}_p{month:%Y_%m}"
+
+
+def history_is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+            [HISTORY_TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def history_partitions():
+    """
+    Angehängte Monats-Partitionen als Liste von (monat, name, geschätzte_zeilen),
+    älteste zuerst. Die DEFAULT-Partition ist nicht enthalten.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, child.reltuples
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            """,
+            [HISTORY_TABLE],
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, estimated_rows in rows:
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            month = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append((month, name, max(int(estimated_rows), 0)))
+    return sorted(partitions)
+
+
+def create_history_partition(month):
+    """
+    Legt die Partition für einen Monat an. Zeilen dieses Monats, die bisher in
+    der DEFAULT-Partition gelandet sind, werden dabei mit umgezogen
+    (sonst würde Postgres das Anhängen verweigern).
+    """
+    name = partition_name(month)
+    quote = connection.ops.quote_name
+    start, end = _bound(month), _bound(_add_months(month, 1))
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(HISTORY_TABLE)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {quote(DEFAULT_PARTITION)}
+                WHERE history_date >= %s AND history_date < %s
+                RETURNING *
+            )
+            INSERT INTO {quote(name)} SELECT * FROM moved
+            """,
+            [start, end],
+        )
+        # Indizes der Haupttabelle werden beim Anhängen automatisch angelegt
+        cursor.execute(
+            f"ALTER TABLE {quote(HISTORY_TABLE)} ATTACH PARTITION {quote(name)} FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return name
+
+
+def ensure_history_partitions(months_ahead=MONTHS_AHEAD):
+    """
+    Sorgt dafür, dass es für den aktuellen und die nächsten `months_ahead`
+    Monate Partitionen gibt. Gibt die Namen der neu angelegten zurück.
+    """
+    if not history_is_partitioned():
+        return []
+
+    existing = {month for month, _, _ in history_partitions()}
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    current = today.replace(day=1)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = _add_months(current, offset)
+        if month not in existing:
+            created.append(create_history_partition(month))
+    return created
+
+
+def detach_history_partitions(before):
+    """
+    Hängt alle Monats-Partitionen vor dem Monat `before` ab. Die Tabellen
+    bleiben als normale Tabellen erhalten (sichern/löschen per Hand), ihre
+    Einträge erscheinen aber nicht mehr im Verlauf. Gibt die Namen zurück.
+    """
+    quote = connection.ops.quote_name
+    before = before.replace(day=1)
+    detached = []
+    for month, name, _ in history_partitions():
+        if month >= before:
+            break
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {quote(HISTORY_TABLE)} DETACH PARTITION {quote(name)}")
+            # Abgehängte Tabelle soll nicht mehr an der ID-Sequenz der History hängen
+            cursor.execute(f"ALTER TABLE {quote(name)} ALTER COLUMN history_id DROP DEFAULT")
+        detached.append(name)
+    return detached
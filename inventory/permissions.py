@@ -0,0 +1,83 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .caching import LOCAL_CACHE_TIMEOUT, cache_is_shared
+
+
+# --- Berechtigungs-Cache ---
+# Jede View prüft per PermissionRequiredMixin eine Berechtigung. Der
+# ModelBackend lädt dafür bei jedem Request die Benutzer- und Gruppenrechte
+# (zwei Abfragen) und merkt sie sich nur am User-Objekt des Requests.
+# CachedPermissionBackend legt die Rechte zusätzlich im Django-Cache ab.
+# Ändern sich Gruppen, Rechte oder der Benutzer selbst, löschen die Signale in
+# inventory/signals.py die betroffenen Einträge (siehe invalidate_permissions).
+#
+# Ohne gemeinsamen Cache (REDIS_URL) hat jeder Gunicorn-Worker seinen eigenen
+# Speicher und sieht die Invalidierung der anderen nicht - dort gelten die
+# Rechte deshalb nur LOCAL_CACHE_TIMEOUT Sekunden.
+
+PERMISSION_CACHE_TIMEOUT = 300
+
+
+def permission_cache_timeout():
+    return PERMISSION_CACHE_TIMEOUT if cache_is_shared() else LOCAL_CACHE_TIMEOUT
+
+
+def permission_cache_key(user_id):
+    return f"bebo:perms:{user_id}"
+
+
+class CachedPermissionBackend(ModelBackend):
+    """ModelBackend, der die Rechte eines Benutzers im Cache ablegt."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk)
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, permission_cache_timeout())
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+    async def aget_all_permissions(self, user_obj, obj=None):
+        # Für async Views (ahas_perm); ModelBackend selbst cacht hier nichts
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permission_cache_key(user_obj.pk)
+            perms = await cache.aget(key)
+            if perms is None:
+                perms = await super().aget_all_permissions(user_obj)
+                await cache.aset(key, perms, permission_cache_timeout())
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
+
+
+def invalidate_permissions(user_ids):
+    """
+    Verwirft die gecachten Rechte der Benutzer - erst nach dem Commit, damit
+    kein paralleler Request zwischendurch den alten Stand wieder einträgt.
+    """
+    keys = [permission_cache_key(pk) for pk in set(user_ids)]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def users_of_groups(group_ids):
+    return get_user_model().objects.filter(groups__in=group_ids).values_list('pk', flat=True).distinct()
+
+
+def users_with_permissions(permission_ids):
+    """Benutzer, die eine der Berechtigungen direkt oder über eine Gruppe haben."""
+    return (
+        get_user_model().objects
+        .filter(Q(user_permissions__in=permission_ids) | Q(groups__permissions__in=permission_ids))
+        .values_list('pk', flat=True)
+        .distinct()
+    )
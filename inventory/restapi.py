@@ -0,0 +1,354 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date
+from django.views import View
+
+from .asgi import AsyncPermissionRequiredMixin
+from .caching import box_version, box_versions, make_etag
+from .history import HistoricalBox, ensure_change_summaries
+from .images import variant_files
+from .lookups import categories, locations, lookups_version
+from .models import ACTIVITY_ENTRY, Box, BoxImage, Category
+from .pagination import KeysetPaginator
+
+
+# --- Lese-API (JSON, versioniert unter /api/v1/) ---
+# Für Integrationen statt das Dashboard-HTML auszulesen. Alle Listen:
+#
+#   ?fields=label,status,location   nur diese Felder (Standard: DEFAULT_FIELDS)
+#   ?limit=100&cursor=...           Keyset-Paginierung (siehe pagination.py),
+#                                   Links in "next"/"previous"
+#
+# Pro Anfrage werden nur die Spalten gelesen, die die Felder brauchen
+# (only()), JOINs/Prefetches gibt es nur für angeforderte Relationen.
+# Lagerorte und Kategorien kommen aus dem Lookup-Cache (kein JOIN).
+#
+# Jede Antwort hat ein ETag (aus updated_at bzw. der Versionsnummer der Box,
+# siehe caching.py); mit If-None-Match gibt es 304 ohne Body. Bei einzelnen
+# Boxen wird das vor dem Laden der Relationen geprüft.
+#
+# Die Views sind async (siehe inventory/asgi.py): Abfragen über das async ORM,
+# Serialisieren (Lookup-Cache, Versionsnummern) gesammelt im Sync-Thread.
+
+API_VERSION = 1
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiField:
+    """
+    Ein Feld der API: wie der Wert entsteht und was die Abfrage dafür braucht
+    (Spalten für only(), select_related, Prefetches).
+    """
+
+    def __init__(self, value, columns=(), select=(), prefetch=()):
+        self.value = value
+        self.columns = columns
+        self.select = select
+        self.prefetch = prefetch
+
+
+def _location(location_id):
+    row = locations().get(location_id)
+    return {'id': location_id, 'name': row['name'] if row else None}
+
+
+def _date(value):
+    return value.isoformat() if value else None
+
+
+def image_as_json(image):
+    return {
+        'id': image.pk,
+        'name': image.display_name,
+        'url': image.image.url,
+        'variants': {key: image.image.storage.url(name) for key, name in variant_files(image.variants).items()},
+        'uploaded_at': _date(image.uploaded_at),
+    }
+
+
+IMAGE_COLUMNS = ('id', 'box_id', 'image', 'original_name', 'variants', 'uploaded_at')
+
+BOX_FIELDS = {
+    'id': ApiField(lambda box: box.pk, ['id']),
+    'label': ApiField(lambda box: box.label, ['label']),
+    'url': ApiField(lambda box: reverse('api_box', args=[box.label]), ['label']),
+    'status': ApiField(lambda box: box.status, ['status']),
+    'status_display': ApiField(lambda box: box.get_status_display(), ['status']),
+    'description': ApiField(lambda box: box.description, ['description']),
+    'location': ApiField(lambda box: _location(box.location_id), ['location_id']),
+    'categories': ApiField(
+        lambda box: [categories().get(c.pk) or {'id': c.pk} for c in box.categories.all()],
+        prefetch=[lambda: Prefetch('categories', queryset=Category.objects.only('id'))],
+    ),
+    'images': ApiField(
+        lambda box: [image_as_json(image) for image in box.images.all()],
+        prefetch=[lambda: Prefetch('images', queryset=BoxImage.objects.order_by('pk').only(*IMAGE_COLUMNS))],
+    ),
+    'created_at': ApiField(lambda box: _date(box.created_at), ['created_at']),
+    'updated_at': ApiField(lambda box: _date(box.updated_at), ['updated_at']),
+}
+BOX_DEFAULT_FIELDS = ['id', 'label', 'url', 'status', 'description', 'location', 'categories', 'updated_at']
+
+IMAGE_FIELDS = {
+    name: ApiField(lambda image, name=name: image_as_json(image)[name], IMAGE_COLUMNS)
+    for name in ('id', 'name', 'url', 'variants', 'uploaded_at')
+}
+
+HISTORY_FIELDS = {
+    'id': ApiField(lambda record: record.history_id, ['history_id']),
+    'date': ApiField(lambda record: _date(record.history_date), ['history_date']),
+    'type': ApiField(lambda record: record.history_type, ['history_type']),
+    'user': ApiField(
+        lambda record: record.history_user.username if record.history_user else None,
+        ['history_user__username'], select=['history_user'],
+    ),
+    'box': ApiField(lambda record: record.id, ['id']),
+    'label': ApiField(lambda record: record.label, ['label']),
+    'status': ApiField(lambda record: record.status, ['status']),
+    'location': ApiField(lambda record: _location(record.location_id), ['location_id']),
+    'description': ApiField(lambda record: record.description, ['description']),
+    'reason': ApiField(lambda record: record.history_change_reason, ['history_change_reason']),
+    'changes': ApiField(lambda record: record.change_summary, ['change_summary']),
+}
+HISTORY_DEFAULT_FIELDS = ['id', 'date', 'type', 'user', 'label', 'status', 'location', 'reason']
+
+LOCATION_FIELDS = ('id', 'name', 'is_external')
+CATEGORY_FIELDS = ('id', 'name', 'color')
+
+
+def parse_fields(request, available, default):
+    """Angeforderte Felder aus ?fields=..., unbekannte führen zu 400."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(default)
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ApiError(f"Unbekannte Felder: {', '.join(unknown)}. Möglich: {', '.join(available)}.")
+    return names
+
+
+def tailor(queryset, spec, fields, extra_columns=()):
+    """Schränkt ein Queryset auf das ein, was die Felder brauchen."""
+    columns = set(extra_columns)
+    select = []
+    prefetch = []
+    for name in fields:
+        field = spec[name]
+        columns.update(field.columns)
+        select.extend(field.select)
+        prefetch.extend(p() for p in field.prefetch)
+    # Vorherige select_related (z.B. aus activity_feed) passen nicht zu only()
+    queryset = queryset.select_related(None).only(*columns)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+def serialize(obj, spec, fields):
+    return {name: spec[name].value(obj) for name in fields}
+
+
+def serialize_all(objects, spec, fields):
+    return [serialize(obj, spec, fields) for obj in objects]
+
+
+def parse_limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ApiError("'limit' muss eine Zahl sein.")
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+class ApiView(AsyncPermissionRequiredMixin, View):
+    """Gemeinsame Basis: JSON-Fehler statt Redirects, ETags, kompaktes JSON."""
+    permission_required = 'inventory.view_box'
+    http_method_names = ['get', 'head', 'options']
+
+    def handle_no_permission(self):
+        if not self.request.user.is_authenticated:
+            return JsonResponse({'error': "Nicht angemeldet."}, status=401)
+        return JsonResponse({'error': "Keine Berechtigung."}, status=403)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+    def etag_for(self, *parts):
+        # Berechtigungen: gleiche URL, anderer Benutzer -> anderes ETag
+        return make_etag('api', API_VERSION, settings.BEBO_VERSION, self.request.user.pk, self.request.get_full_path(), *parts)
+
+    def respond(self, data, etag, last_modified=None):
+        response = get_conditional_response(self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = JsonResponse(data, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def page_link(self, cursor):
+        if not cursor:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        return f"{self.request.path}?{query.urlencode()}"
+
+    async def paginate(self, queryset, ordering):
+        page = await KeysetPaginator(queryset, ordering, per_page=parse_limit(self.request)).aget_page(self.request.GET.get('cursor'))
+        return page, {'next': self.page_link(page.next_cursor), 'previous': self.page_link(page.previous_cursor)}
+
+
+class ApiIndexView(ApiView):
+    async def get(self, request):
+        data = {
+            'version': API_VERSION,
+            'resources': {
+                'boxes': reverse('api_boxes'),
+                'locations': reverse('api_locations'),
+                'categories': reverse('api_categories'),
+                'history': reverse('api_history'),
+            },
+        }
+        return self.respond(data, self.etag_for())
+
+
+class BoxListApiView(ApiView):
+    """
+    /api/v1/boxes/ - neueste Änderungen zuerst (passt zum Index box_updated_id_idx).
+    Filter: ?location=<id>, ?status=<code>, ?category=<id>, ?updated_since=<ISO-Datum>
+    """
+    ordering = ['-updated_at', '-id']
+
+    def get_queryset(self):
+        queryset = Box.objects.all()
+        params = self.request.GET
+        try:
+            if params.get('location'):
+                queryset = queryset.filter(location_id=int(params['location']))
+            if params.get('category'):
+                queryset = queryset.filter(categories__id=int(params['category']))
+        except ValueError:
+            raise ApiError("'location' und 'category' erwarten eine ID.")
+        if params.get('status'):
+            queryset = queryset.filter(status=params['status'])
+        if params.get('updated_since'):
+            since = parse_datetime(params['updated_since'])
+            if since is None:
+                raise ApiError("'updated_since' erwartet ein ISO-Datum, z.B. 2025-01-31T12:00:00Z.")
+            queryset = queryset.filter(updated_at__gte=since)
+        return queryset
+
+    def serialize_page(self, page, fields):
+        versions = box_versions([box.pk for box in page])
+        etag = self.etag_for(lookups_version(), *((box.pk, box.updated_at.isoformat(), versions[box.pk]) for box in page))
+        return serialize_all(page, BOX_FIELDS, fields), etag
+
+    async def get(self, request):
+        fields = parse_fields(request, BOX_FIELDS, BOX_DEFAULT_FIELDS)
+        queryset = tailor(self.get_queryset(), BOX_FIELDS, fields, extra_columns=['id', 'updated_at'])
+        page, links = await self.paginate(queryset, self.ordering)
+
+        data, etag = await sync_to_async(self.serialize_page)(page, fields)
+        return self.respond({'data': data, **links}, etag)
+
+
+class BoxDetailApiView(ApiView):
+    """/api/v1/boxes/<label>/ - ETag wird vor dem Laden der Relationen geprüft."""
+
+    async def get(self, request, label):
+        fields = parse_fields(request, BOX_FIELDS, BOX_DEFAULT_FIELDS)
+        row = await aget_object_or_404(Box.objects.values('pk', 'updated_at'), label=label)
+        last_modified = int(row['updated_at'].timestamp())
+        etag = self.etag_for(lookups_version(), row['updated_at'].isoformat(), box_version(row['pk']))
+        if get_conditional_response(request, etag=etag, last_modified=last_modified) is not None:
+            return self.respond(None, etag, last_modified)
+
+        box = await tailor(Box.objects.filter(pk=row['pk']), BOX_FIELDS, fields, extra_columns=['id']).aget()
+        data = await sync_to_async(serialize)(box, BOX_FIELDS, fields)
+        return self.respond({'data': data}, etag, last_modified)
+
+
+class BoxImagesApiView(ApiView):
+    """/api/v1/boxes/<label>/images/ - alle Bilder einer Box (ohne Paginierung)."""
+
+    async def get(self, request, label):
+        fields = parse_fields(request, IMAGE_FIELDS, IMAGE_FIELDS)
+        box_id = await aget_object_or_404(Box.objects.values_list('pk', flat=True), label=label)
+        etag = self.etag_for(box_version(box_id))
+        if get_conditional_response(request, etag=etag) is not None:
+            return self.respond(None, etag)
+
+        images = BoxImage.objects.filter(box_id=box_id).order_by('pk').only(*IMAGE_COLUMNS)
+        return self.respond({'data': [serialize(image, IMAGE_FIELDS, fields) async for image in images]}, etag)
+
+
+class HistoryApiView(ApiView):
+    """
+    /api/v1/history/                 - Aktivitäten aller Boxen (wie /history/)
+    /api/v1/boxes/<label>/history/   - kompletter Verlauf einer Box
+    Neueste zuerst; ?user=<benutzername> filtert nach Benutzer.
+    """
+    ordering = ['-history_date', '-history_id']
+
+    async def get(self, request, label=None):
+        fields = parse_fields(request, HISTORY_FIELDS, HISTORY_DEFAULT_FIELDS)
+        if label is None:
+            # Gleiche Auswahl wie der Aktivitäten-Feed (nutzt dessen Teil-Indizes)
+            queryset = HistoricalBox.objects.filter(ACTIVITY_ENTRY)
+        else:
+            box_id = await aget_object_or_404(Box.objects.values_list('pk', flat=True), label=label)
+            if 'changes' in fields:
+                await sync_to_async(ensure_change_summaries)(box_id)
+            queryset = HistoricalBox.objects.filter(id=box_id)
+        if request.GET.get('user'):
+            queryset = queryset.filter(history_user__username=request.GET['user'])
+
+        queryset = tailor(queryset, HISTORY_FIELDS, fields, extra_columns=['history_id', 'history_date'])
+        page, links = await self.paginate(queryset, self.ordering)
+
+        # History-Einträge ändern sich nicht (nur change_summary wird nachberechnet)
+        etag = self.etag_for(lookups_version(), *(
+            (record.history_id, 'changes' in fields and record.change_summary is None) for record in page
+        ))
+        data = await sync_to_async(serialize_all)(page, HISTORY_FIELDS, fields)
+        return self.respond({'data': data, **links}, etag)
+
+
+class LocationListApiView(ApiView):
+    """/api/v1/locations/ - alle Lagerorte aus dem Cache (keine Abfrage)."""
+    permission_required = 'inventory.view_location'
+    rows = staticmethod(locations)
+    available = LOCATION_FIELDS
+
+    async def get(self, request):
+        fields = parse_fields(request, self.available, self.available)
+        rows = await sync_to_async(self.rows)()
+        data = [{name: row[name] for name in fields} for row in rows.values()]
+        return self.respond({'data': data, 'next': None, 'previous': None}, self.etag_for(lookups_version()))
+
+
+class CategoryListApiView(LocationListApiView):
+    """/api/v1/categories/ - alle Kategorien aus dem Cache."""
+    permission_required = 'inventory.view_category'
+    rows = staticmethod(categories)
+    available = CATEGORY_FIELDS
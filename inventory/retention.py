@@ -0,0 +1,184 @@
+import gzip
+import json
+from datetime import timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import bump_box_versions
+from .history import HistoricalBox, HistoricalBoxCategories, change_summary_batches
+from .models import HistoryArchive
+
+
+# --- Aufbewahrung der Box-History (Kompaktieren + Archivieren) ---
+# Die History-Tabelle wächst mit jeder Änderung. Zwei Schritte halten sie klein:
+#
+# 1. Kompaktieren: "~"-Einträge ohne Text, die sich in keinem Feld und keiner
+#    Kategorie vom Vorgänger unterscheiden (z.B. Speichern ohne Änderung),
+#    werden gelöscht.
+# 2. Archivieren: Einträge älter als N Tage wandern komprimiert nach
+#    HistoryArchive. Der jeweils neueste Eintrag jeder Box bleibt immer in der
+#    History-Tabelle, damit neue Einträge ihren Vorgänger zum Vergleichen finden.
+#
+# Beide Schritte arbeiten mengenbasiert in Stapeln (nicht Box für Box). Fehlende
+# change_summary-Werte älterer Einträge werden vorher stückweise berechnet,
+# damit sich die angezeigten Änderungen durch das Entfernen von Vorgängern
+# nicht verändern. Probeläufe (dry_run) schreiben nichts.
+#
+# Im Betrieb plant der Worker beides einmal am Tag als Job ein
+# (history_maintenance, siehe inventory/jobs.py).
+
+NO_OP_CANDIDATE = Q(history_type='~') & (Q(history_change_reason__isnull=True) | Q(history_change_reason=''))
+
+
+def _delete_records(history_ids):
+    """
+    Löscht History-Einträge samt Kategorien-Snapshots. Die m2m-History von
+    simple_history hängt ohne Fremdschlüssel-Constraint (DO_NOTHING) an den
+    Einträgen, würde also sonst verwaist liegen bleiben.
+    """
+    HistoricalBoxCategories.objects.filter(history_id__in=history_ids).delete()
+    deleted, _ = HistoricalBox.objects.filter(history_id__in=history_ids).delete()
+    return deleted
+
+
+def compact_history(box_ids=None, dry_run=False, batch_size=1000):
+    """
+    Löscht History-Einträge ohne Änderung (siehe oben). Gibt die Anzahl zurück.
+    """
+    candidates = HistoricalBox.objects.filter(NO_OP_CANDIDATE)
+    if box_ids is not None:
+        candidates = candidates.filter(id__in=box_ids)
+
+    # Ältere Einträge ohne change_summary; im Probelauf nur berechnen und zählen
+    pending = 0
+    for records in change_summary_batches(candidates, save=not dry_run):
+        pending += sum(1 for record in records if record.change_summary == [])
+
+    no_ops = candidates.filter(change_summary=[]).order_by('history_id').values_list('history_id', 'id')
+    if dry_run:
+        return no_ops.count() + pending
+
+    removed = 0
+    while batch := list(no_ops[:batch_size]):
+        with transaction.atomic():
+            _delete_records([history_id for history_id, _ in batch])
+            bump_box_versions({box_id for _, box_id in batch})
+        removed += len(batch)
+    return removed
+
+
+def _serialize(record, category_ids):
+    """Ein History-Eintrag als dict (alle Spalten + Kategorien + Benutzername)."""
+    data = {field.attname: getattr(record, field.attname) for field in HistoricalBox._meta.concrete_fields}
+    data['categories'] = sorted(category_ids)
+    data['history_user_name'] = record.history_user.get_username() if record.history_user else None
+    return data
+
+
+def _pack(rows):
+    lines = "\n".join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) for row in rows)
+    return gzip.compress(lines.encode('utf-8'))
+
+
+def archive_history(older_than_days, batch_size=200, dry_run=False):
+    """
+    Verschiebt History-Einträge älter als `older_than_days` Tage nach
+    HistoryArchive (ein Abschnitt pro Box). Gibt (Einträge, Abschnitte) zurück.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    newest_per_box = (
+        HistoricalBox.objects
+        .filter(id=OuterRef('id'))
+        .order_by('-history_date', '-history_id')
+        .values('history_id')[:1]
+    )
+    candidates = (
+        HistoricalBox.objects
+        .filter(history_date__lt=cutoff)
+        .exclude(history_id=Subquery(newest_per_box))
+    )
+    if dry_run:
+        return candidates.count(), candidates.values('id').distinct().count()
+
+    box_ids = list(candidates.values_list('id', flat=True).distinct().order_by('id'))
+    archived = segments = 0
+    for start in range(0, len(box_ids), batch_size):
+        batch = box_ids[start:start + batch_size]
+        # Auch der verbleibende neueste Eintrag braucht seinen Wert, solange der Vorgänger noch da ist
+        for _ in change_summary_batches(HistoricalBox.objects.filter(id__in=batch)):
+            pass
+
+        with transaction.atomic():
+            records = list(
+                candidates.filter(id__in=batch)
+                .select_related('history_user')
+                .order_by('id', '-history_date', '-history_id')
+            )
+            categories = {}
+            for history_id, category_id in (
+                HistoricalBoxCategories.objects
+                .filter(history_id__in=[r.history_id for r in records])
+                .values_list('history_id', 'category_id')
+            ):
+                categories.setdefault(history_id, set()).add(category_id)
+
+            by_box = {}
+            for record in records:
+                by_box.setdefault(record.id, []).append(record)
+
+            HistoryArchive.objects.bulk_create([
+                HistoryArchive(
+                    box_id=box_id,
+                    first_date=box_records[-1].history_date,
+                    last_date=box_records[0].history_date,
+                    entry_count=len(box_records),
+                    data=_pack(_serialize(r, categories.get(r.history_id, ())) for r in box_records),
+                )
+                for box_id, box_records in by_box.items()
+            ])
+            _delete_records([r.history_id for r in records])
+            bump_box_versions(by_box)
+
+        archived += len(records)
+        segments += len(by_box)
+    return archived, segments
+
+
+def run_history_maintenance(older_than_days):
+    """Kompaktieren und Archivieren in einem Schritt (Job history_maintenance)."""
+    removed = compact_history()
+    archived, segments = archive_history(older_than_days)
+    return removed, archived, segments
+
+
+# --- Archiv lesen ---
+
+class ArchivedRecord:
+    """
+    Ein archivierter History-Eintrag mit den Attributen, die
+    box_history_rows.html und history_entries() von HistoricalBox kennen.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.history_id = data['history_id']
+        self.history_date = parse_datetime(data['history_date'])
+        self.history_type = data['history_type']
+        self.history_change_reason = data.get('history_change_reason')
+        self.history_user = data.get('history_user_name')
+        self.change_summary = data.get('change_summary')
+
+
+def archived_records(segment):
+    """Entpackt einen Archiv-Abschnitt (neueste Einträge zuerst)."""
+    lines = gzip.decompress(bytes(segment.data)).decode('utf-8').splitlines()
+    return [ArchivedRecord(json.loads(line)) for line in lines if line]
+
+
+def is_meaningful(record):
+    """Gegenstück zu MEANINGFUL_ENTRY für archivierte Einträge."""
+    return bool(record.history_change_reason) or record.history_type in ('+', '-') or record.change_summary != []
@@ -0,0 +1,119 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .models import Box, BoxSearchDocument
+
+
+# --- Volltextsuche (Postgres) ---
+# Statt vier icontains-Lookups über JOINs (Sequential Scan + DISTINCT) pflegen
+# wir pro Box einen tsvector mit Beschreibung, Lagerort- und
+# Kategorienamen in einer eigenen Tabelle (BoxSearchDocument, 1:1 zur Box).
+# Der GIN-Index darauf macht die Suche unabhängig von der Anzahl der Boxen.
+# Barcode-Fragmente laufen über einen Trigramm-Index auf label.
+
+SEARCH_CONFIG = 'german'
+
+# Mapping deutscher Begriffe auf die Datenbank-Werte (STATUS_CHOICES)
+STATUS_SEARCH_MAP = {
+    'gelagert': 'STORED',
+    'verliehen': 'LENT',
+    'zugriff': 'ACCESS',
+    'extern': 'EXT',
+    'transit': 'TRANSIT',
+    'verloren': 'LOST',
+    'unbekannt': 'LOST',
+}
+
+# Gewichtung: Beschreibung (A) zählt mehr als Lagerort/Kategorien (B)
+_UPSERT_SQL = """
+    INSERT INTO {document} (box_id, vector)
+    SELECT b.id,
+        setweight(to_tsvector(%s, coalesce(b.description, '')), 'A') ||
+        setweight(to_tsvector(%s, coalesce(l.name, '')), 'B') ||
+        setweight(to_tsvector(%s, coalesce((
+            SELECT string_agg(c.name, ' ')
+            FROM {box_categories} AS bc
+            JOIN {category} AS c ON c.id = bc.category_id
+            WHERE bc.box_id = b.id
+        ), '')), 'B')
+    FROM {box} AS b
+    JOIN {location} AS l ON l.id = b.location_id
+    {where}
+    ON CONFLICT (box_id) DO UPDATE SET vector = EXCLUDED.vector
+"""
+
+
+def update_search_vectors(box_ids=None):
+    """
+    Berechnet den Suchvektor für die angegebenen Boxen neu (alle, wenn None).
+
+    Läuft als ein einziges Upsert direkt in der Datenbank, ohne Box.save():
+    es entstehen also weder History-Einträge noch ein neues updated_at.
+    """
+    if box_ids is not None:
+        box_ids = list(box_ids)
+        if not box_ids:
+            return
+
+    Category = Box._meta.get_field('categories').related_model
+    Location = Box._meta.get_field('location').related_model
+    params = [SEARCH_CONFIG, SEARCH_CONFIG, SEARCH_CONFIG]
+    where = ''
+    if box_ids is not None:
+        where = 'WHERE b.id = ANY(%s)'
+        params.append(box_ids)
+
+    sql = _UPSERT_SQL.format(
+        document=connection.ops.quote_name(BoxSearchDocument._meta.db_table),
+        box=connection.ops.quote_name(Box._meta.db_table),
+        box_categories=connection.ops.quote_name(Box.categories.through._meta.db_table),
+        category=connection.ops.quote_name(Category._meta.db_table),
+        location=connection.ops.quote_name(Location._meta.db_table),
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def search_boxes(queryset, term):
+    """
+    Filtert ein Box-Queryset nach einem Suchbegriff und annotiert die
+    Relevanz als 'rank' (höher = besser).
+
+    - Wörter: Volltextsuche (websearch-Syntax, deutsche Stammformen)
+    - Barcode-Fragmente ('94.123', '4567'): Teilstring-Suche auf label,
+      beschleunigt durch den Trigramm-Index
+    - Status-Begriffe ('verliehen', ...): Filter auf das Status-Feld
+
+    Jeder Zweig ist eine eigene ID-Abfrage mit passendem Index, die Treffer
+    werden per UNION zusammengeführt. Ein OR über den LEFT JOIN auf die
+    Suchvektoren könnte Postgres nur per Sequential Scan auswerten.
+    """
+    term = term.strip()
+    if not term:
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+    branches = [BoxSearchDocument.objects.filter(vector=query).values('box_id')]
+
+    # So funktioniert die Suche nach z.B. '94.123' und '94123' gleichermaßen (1.5.3)
+    label_fragment = term.replace('.', '').replace(' ', '')
+    if label_fragment.isdigit():
+        branches.append(Box.objects.filter(label__contains=label_fragment).values('pk'))
+
+    mapped_status = STATUS_SEARCH_MAP.get(term.lower())
+    if mapped_status:
+        branches.append(Box.objects.filter(status=mapped_status).values('pk'))
+
+    matches = branches[0].union(*branches[1:]) if len(branches) > 1 else branches[0]
+
+    # ts_rank liefert float4; als float8 gecastet kommt der Wert verlustfrei
+    # zurück, was die Keyset-Paginierung über 'rank' braucht.
+    # Boxen ohne (noch nicht berechneten) Vektor bekommen 0 statt NULL.
+    rank = Coalesce(
+        Cast(SearchRank(F('search_document__vector'), query), FloatField()),
+        Value(0.0, output_field=FloatField()),
+    )
+    return queryset.filter(pk__in=matches).annotate(rank=rank)
@@ -1,30 +1,31 @@
-from django.db.models.signals import post_save, post_delete
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
-from simple_history.utils import update_change_reason
+from simple_history.signals import post_create_historical_record
 
-from .models import BoxImage
+from .caching import bump_box_versions
+from .history import HistoricalBox, record_image_event, save_change_summaries
+from .images import generate_variants, release_image_files
+from .lookups import invalidate_lookups
+from .models import Box, BoxImage, Category, Location, UploadSession
+from .permissions import invalidate_permissions, users_of_groups, users_with_permissions
+from .search import update_search_vectors
+from .uploads import release_upload_part
 
 
 @receiver(post_save, sender=BoxImage)
-def log_image_add(sender, instance, created, **kwargs):
+def log_image_add(sender, instance, created, raw=False, **kwargs):
     """
     Protokolliert das Hinzufügen eines Bildes an einer Box.
 
-    Vorgehen:
-    - Text (history_change_reason) an die Box hängen
-    - box.save() aufrufen
-    -> simple_history erzeugt den History-Eintrag sauber (inkl. Benutzer).
+    Der Text landet nicht sofort in der History, sondern wird gesammelt
+    (siehe image_history_batch in inventory/history.py): mehrere Bilder in
+    einem Request/Job ergeben einen gemeinsamen Eintrag inkl. Benutzer.
     """
-    if not created:
+    if not created or raw:
         return
-
-    box = instance.box
-    filename = instance.image.name.split('/')[-1]
-    reason = f"Bild hinzugefügt: {filename}"
-
-    # Falls der View bereits _history_user gesetzt hat, nutzt simple_history diesen.
-    update_change_reason(box, reason)
-    box.save()
+    record_image_event(instance.box, 'added', instance.display_name)
 
 
 @receiver(post_delete, sender=BoxImage)
@@ -32,9 +33,201 @@ def log_image_delete(sender, instance, **kwargs):
     """
     Protokolliert das Löschen eines Bildes an einer Box.
     """
-    box = instance.box
-    filename = instance.image.name.split('/')[-1]
-    reason = f"Bild gelöscht: {filename}"
+    record_image_event(instance.box, 'removed', instance.display_name)
+
+
+# --- Box-Verlauf: Änderungen gleich beim Schreiben berechnen ---
+
+@receiver(post_create_historical_record, sender=HistoricalBox)
+def store_change_summary(sender, history_instance, **kwargs):
+    """
+    Einzelne Einträge (box.save(), Kategorien geändert); Massen-Einträge
+    berechnet bulk_create_history selbst.
+    """
+    save_change_summaries([history_instance])
+
+
+# --- Bild-Varianten (Thumbnails) ---
+
+@receiver(post_save, sender=BoxImage)
+def create_image_variants(sender, instance, created, raw=False, **kwargs):
+    """
+    Erzeugt die verkleinerten Varianten direkt nach dem Upload.
+    """
+    if not created or raw:
+        return
+    generate_variants(instance)
+
+
+@receiver(post_delete, sender=BoxImage)
+def remove_image_files(sender, instance, **kwargs):
+    # Gleiche Fotos teilen sich Dateien -> erst entfernen, wenn kein Verweis mehr da ist
+    release_image_files(instance)
+
+
+@receiver(post_delete, sender=UploadSession)
+def remove_upload_part(sender, instance, **kwargs):
+    # Auch für Uploads, die mit ihrer Box gelöscht werden (CASCADE)
+    release_upload_part(instance)
+
+
+# --- Volltextsuche: Suchvektoren aktuell halten ---
+
+@receiver(post_save, sender=Box)
+def refresh_box_search_vector(sender, instance, raw=False, **kwargs):
+    """
+    Beschreibung oder Lagerort könnten sich geändert haben -> Vektor neu berechnen.
+    """
+    if raw:  # loaddata: Vektor kommt ggf. aus dem Fixture bzw. später per Rebuild
+        return
+    update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Box.categories.through)
+def refresh_search_vector_on_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Kategorien einer Box geändert (oder Boxen einer Kategorie, reverse=True).
+    """
+    if action == 'pre_clear' and reverse:
+        # post_clear von der Kategorie-Seite liefert kein pk_set -> vorher merken
+        instance._search_box_ids = list(instance.box_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        update_search_vectors([instance.pk])
+    elif pk_set:
+        update_search_vectors(pk_set)
+    else:
+        update_search_vectors(getattr(instance, '_search_box_ids', []))
+
+
+@receiver(post_save, sender=Location)
+def refresh_search_vectors_for_location(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    update_search_vectors(instance.box_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def refresh_search_vectors_for_category(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    update_search_vectors(instance.box_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_boxes_of_category(sender, instance, **kwargs):
+    # Nach dem Löschen sind die Zuordnungen weg, daher vorher merken
+    instance._search_box_ids = list(instance.box_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def refresh_search_vectors_after_category_delete(sender, instance, **kwargs):
+    update_search_vectors(getattr(instance, '_search_box_ids', []))
+
+
+# --- Versionsnummern für Fragment-Cache und ETags (inventory/caching.py) ---
+
+@receiver(post_save, sender=Box)
+@receiver(post_delete, sender=Box)
+def bump_box_cache_version(sender, instance, **kwargs):
+    bump_box_versions([instance.pk])
+
+
+@receiver(post_save, sender=BoxImage)
+@receiver(post_delete, sender=BoxImage)
+def bump_box_cache_version_for_image(sender, instance, **kwargs):
+    bump_box_versions([instance.box_id])
+
+
+@receiver(m2m_changed, sender=Box.categories.through)
+def bump_box_cache_version_for_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    # Von der Kategorie-Seite (reverse=True) ändern sich Name/Farbe nicht,
+    # das deckt die Versionsnummer der Lookups ab - nur die Zuordnungen zählen
+    if action == 'pre_clear' and reverse:
+        instance._cache_box_ids = list(instance.box_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        bump_box_versions([instance.pk])
+    elif pk_set:
+        bump_box_versions(pk_set)
+    else:
+        bump_box_versions(getattr(instance, '_cache_box_ids', []))
+
+
+# --- Lagerort-/Kategorien-Cache aktuell halten ---
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_lookup_cache(sender, **kwargs):
+    invalidate_lookups()
+
+
+# --- Berechtigungs-Cache aktuell halten ---
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_permissions_on_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Gruppen eines Benutzers geändert (oder Benutzer einer Gruppe, reverse=True).
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_permissions([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_permissions(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_permissions(pk_set)
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_permissions_on_user_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_permissions([instance.pk])
+    elif action == 'pre_clear':
+        invalidate_permissions(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_permissions(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_permissions_on_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Rechte einer Gruppe geändert (oder Gruppen einer Berechtigung, reverse=True)
+    -> alle Mitglieder der Gruppe(n) betroffen.
+    """
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_permissions(users_of_groups([instance.pk]))
+    elif action == 'pre_clear':
+        invalidate_permissions(users_of_groups(instance.group_set.values_list('pk', flat=True)))
+    elif action in ('post_add', 'post_remove'):
+        invalidate_permissions(users_of_groups(pk_set))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_permissions_on_user_change(sender, instance, **kwargs):
+    # is_active / is_superuser könnten sich geändert haben
+    invalidate_permissions([instance.pk])
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_permissions_on_group_delete(sender, instance, **kwargs):
+    # Nach dem Löschen sind die Mitgliedschaften weg, daher vorher ermitteln
+    invalidate_permissions(users_of_groups([instance.pk]))
+
 
-    update_change_reason(box, reason)
-    box.save()
\ No newline at end of file
+@receiver(pre_delete, sender=Permission)
+def invalidate_permissions_on_permission_delete(sender, instance, **kwargs):
+    invalidate_permissions(users_with_permissions([instance.pk]))
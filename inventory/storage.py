@@ -0,0 +1,104 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+
+
+# --- Inhaltsadressierte Ablage für Box-Bilder ---
+# Der Dateiname eines Bildes ist der SHA-256 seines Inhalts, z.B.
+# box_images/3f/3f9a…c2.jpg. Der Hash entsteht beim Schreiben (die Datei wird
+# nur einmal gelesen). Liegt derselbe Inhalt schon da (gleiches Foto erneut
+# hochgeladen), wird die neue Kopie verworfen und die vorhandene verwendet.
+#
+# Mehrere BoxImage-Zeilen können so auf dieselbe Datei zeigen. Gelöscht wird
+# sie erst, wenn keine Zeile mehr darauf verweist (siehe
+# release_image_files in inventory/images.py). Speichern und Freigeben
+# desselben Inhalts sperren sich gegenseitig über lock_content(), sonst
+# könnte ein Upload auf eine Datei verweisen, die gerade gelöscht wird.
+# Da sich der Inhalt unter einem Namen nie ändert, dürfen Browser die Bilder
+# dauerhaft cachen (siehe inventory/media.py).
+
+CHUNK_SIZE = 64 * 1024
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9]+)?$')
+
+
+def content_digest(name):
+    """SHA-256 aus einem inhaltsadressierten Namen, sonst None."""
+    match = HASHED_NAME.search(name or '')
+    return match.group(2) if match else None
+
+
+def lock_content(digest):
+    """
+    Sperrt einen Inhalt (SHA-256) bis zum Ende der laufenden Transaktion
+    (pg_advisory_xact_lock). Das BoxImage muss deshalb in derselben
+    Transaktion angelegt werden wie die Datei gespeichert wird (Job
+    ingest_images, Admin, dedupe_images) - erst mit dem Commit ist der
+    Verweis sichtbar. Außerhalb einer Transaktion wäre die Sperre sofort
+    wieder frei, deshalb ist das ein Fehler.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    if not connection.in_atomic_block:
+        raise TransactionManagementError("lock_content() braucht eine laufende Transaktion (transaction.atomic).")
+    with connection.cursor() as cursor:
+        # Die ersten 60 Bit des Hashs passen in den bigint-Schlüssel
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [int(digest[:15], 16)])
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, der Dateien unter dem Hash ihres Inhalts ablegt."""
+
+    def get_available_name(self, name, max_length=None):
+        # Keine Zufalls-Endung bei Namensgleichheit: der endgültige Name
+        # entsteht erst in _save() aus dem Inhalt
+        return name
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+
+        temp_name = os.path.join(directory, 'tmp', f"{uuid.uuid4().hex}.part")
+        temp_path = self.path(temp_name)
+        os.makedirs(os.path.dirname(temp_path), exist_ok=True)
+
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            final_name = os.path.join(directory, hexdigest[:2], f"{hexdigest}{extension}").replace('\\', '/')
+            final_path = self.path(final_name)
+            # Eine laufende Freigabe (release_image_files) erst zu Ende löschen lassen
+            lock_content(hexdigest)
+            if os.path.exists(final_path):
+                # Gleicher Inhalt liegt schon da -> nur verweisen
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(temp_path, self.file_permissions_mode)
+                os.replace(temp_path, final_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return final_name
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    # Als Callable für ImageField(storage=...), damit Migrationen nur den Verweis speichern
+    return image_storage
@@ -0,0 +1,258 @@
+import json
+
+from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.db import connection
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views import View
+
+from .barcodes import normalize_label
+from .history import HistoricalBox
+from .lookups import categories, locations, lookups_version
+from .models import Box, BoxImage, Location
+
+
+# --- Delta-Sync für den Offline-Client (/app/) ---
+# Der Client hält den Bestand lokal (IndexedDB) und fragt nur noch ab, was
+# sich seit seinem letzten Stand ("Watermark") geändert hat:
+#
+#   GET  /api/sync/?since=<watermark>  -> geänderte Boxen, gelöschte Box-IDs,
+#                                         Lagerorte/Kategorien (nur wenn geändert)
+#   POST /api/sync/                    -> offline gesammelte Änderungen
+#                                         {"changes": [{"label", "location", "status"}, ...]}
+#
+# Die Watermark ist "x<transaktion>-<lookups_version>": jede Box-Änderung
+# erzeugt einen History-Eintrag, gelöschte Boxen einen Eintrag mit
+# history_type '-' (Grabstein). Jeder Eintrag kennt die Transaktion, die ihn
+# geschrieben hat (history_xid). Die Watermark ist die älteste beim Sync noch
+# laufende Transaktion (pg_snapshot_xmin): alle älteren sind abgeschlossen,
+# ihre Einträge also schon sichtbar - es kann nachträglich keiner mehr
+# "hinter" der Watermark auftauchen. Die history_id taugt dafür nicht, sie
+# wird beim Einfügen vergeben, nicht beim Commit. Lagerorte und Kategorien sind
+# klein und werden bei neuer Version der Lookups (inventory/lookups.py) komplett
+# mitgeschickt. Ohne (gültige) Watermark gibt es den kompletten Bestand.
+#
+# Große Antworten werden nach Box-ID in Seiten geteilt ("next"); die neue
+# Watermark gilt erst nach der letzten Seite.
+
+PAGE_SIZE = 1000
+
+MAX_CHANGES_PER_REQUEST = 1000
+
+
+def format_watermark(xid, version):
+    return f"x{xid}-{version}"
+
+
+def parse_watermark(value):
+    """
+    (transaktion, lookups_version) oder None bei fehlender/ungültiger
+    Watermark. Ältere Watermarks (noch mit history_id) gelten als ungültig.
+    """
+    value = str(value or '')
+    if not value.startswith('x'):
+        return None
+    try:
+        xid, version = value[1:].split('-', 1)
+        return int(xid), int(version)
+    except ValueError:
+        return None
+
+
+def current_xid():
+    """
+    Älteste noch laufende Transaktion. Alles, was ältere Transaktionen
+    geschrieben haben, ist committet (oder verworfen) und damit sichtbar.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def changed_box_ids(since, until, after, limit):
+    """IDs der Boxen mit History-Einträgen aus Transaktionen in [since, until), nach ID sortiert."""
+    return list(
+        HistoricalBox.objects
+        .filter(history_xid__gte=since, history_xid__lt=until, id__gt=after)
+        .order_by('id')
+        .values_list('id', flat=True)
+        .distinct()[:limit]
+    )
+
+
+def boxes_as_json(box_ids=None, after=0, limit=PAGE_SIZE):
+    """
+    Boxen für den Client (IDs statt Namen für Lagerort/Kategorien, dazu das
+    Vorschaubild). Entweder die angegebenen IDs oder die nächste Seite ab `after`.
+    """
+    queryset = Box.objects.order_by('pk').values('id', 'label', 'location_id', 'status', 'description', 'updated_at')
+    if box_ids is None:
+        rows = list(queryset.filter(pk__gt=after)[:limit])
+    else:
+        rows = list(queryset.filter(pk__in=box_ids))
+    ids = [row['id'] for row in rows]
+
+    category_ids = {}
+    for box_id, category_id in Box.categories.through.objects.filter(box_id__in=ids).values_list('box_id', 'category_id'):
+        category_ids.setdefault(box_id, []).append(category_id)
+
+    thumbs = {}
+    for box_image in BoxImage.objects.filter(box_id__in=ids).order_by('box_id', 'pk').only('box_id', 'image', 'variants'):
+        thumbs.setdefault(box_image.box_id, box_image.variant_url('thumb'))
+
+    return [
+        {
+            'id': row['id'],
+            'label': row['label'],
+            'location': row['location_id'],
+            'status': row['status'],
+            'description': row['description'],
+            'categories': category_ids.get(row['id'], []),
+            'thumb': thumbs.get(row['id']),
+            'updated_at': row['updated_at'].isoformat(),
+        }
+        for row in rows
+    ]
+
+
+def sync_page(since=None, until=None, after=0, limit=PAGE_SIZE):
+    """
+    Eine Seite des Deltas seit `since` (Watermark-Tupel oder None = alles).
+    `until` ist die Transaktion, bis zu der diese Runde reicht (ab Seite 2
+    aus dem next-Link, damit alle Seiten denselben Stand haben).
+    """
+    version = lookups_version()
+    if until is None:
+        until = current_xid()
+    # Watermark aus der Zukunft (z.B. Datenbank zurückgesetzt) -> alles neu
+    full = since is None or since[0] > until
+
+    if full:
+        boxes = boxes_as_json(after=after, limit=limit)
+        deleted = []
+        more = len(boxes) == limit
+        last = boxes[-1]['id'] if boxes else after
+    else:
+        ids = changed_box_ids(since[0], until, after, limit)
+        boxes = boxes_as_json(box_ids=ids)
+        # Geändert, aber nicht mehr vorhanden -> gelöscht (history_type '-')
+        present = {box['id'] for box in boxes}
+        deleted = [box_id for box_id in ids if box_id not in present]
+        more = len(ids) == limit
+        last = ids[-1] if ids else after
+
+    send_lookups = full or since[1] != version
+    return {
+        'watermark': format_watermark(until, version),
+        'full': full,
+        'boxes': boxes,
+        'deleted': deleted,
+        'locations': list(locations().values()) if send_lookups and not after else None,
+        'categories': list(categories().values()) if send_lookups and not after else None,
+        'statuses': dict(Box.STATUS_CHOICES) if full and not after else None,
+        'more': more,
+        'after': last,
+    }
+
+
+def apply_changes(changes, user):
+    """
+    Wendet offline gesammelte Änderungen an (Lagerort und/oder Status pro Box).
+    Pro Box gilt der letzte Stand der Liste; gleiche Ziele laufen gebündelt
+    über BoxQuerySet.move(). Gibt pro Änderung ein Ergebnis zurück.
+    """
+    statuses = dict(Box.STATUS_CHOICES)
+    known_locations = locations()
+    results = []
+    targets = {}
+
+    for change in changes:
+        if not isinstance(change, dict):
+            results.append({'ok': False, 'error': "Objekt erwartet."})
+            continue
+        result = {'id': change.get('id'), 'label': normalize_label(str(change.get('label') or ''))}
+        location_id = change.get('location')
+        status = change.get('status')
+        if location_id is not None and (not isinstance(location_id, int) or location_id not in known_locations):
+            result.update(ok=False, error="Unbekannter Lagerort.")
+        elif status is not None and (not isinstance(status, str) or status not in statuses):
+            result.update(ok=False, error="Unbekannter Status.")
+        elif location_id is None and status is None:
+            result.update(ok=False, error="Keine Änderung angegeben.")
+        else:
+            target = targets.setdefault(result['label'], {})
+            if location_id is not None:
+                target['location'] = location_id
+            if status is not None:
+                target['status'] = status
+        results.append(result)
+
+    existing = set(Box.objects.filter(label__in=targets).values_list('label', flat=True))
+    groups = {}
+    for label, target in targets.items():
+        if label in existing:
+            groups.setdefault((target.get('location'), target.get('status')), []).append(label)
+    for (location_id, status), labels in groups.items():
+        location = Location(pk=location_id) if location_id is not None else None
+        Box.objects.filter(label__in=labels).move(location=location, status=status, user=user)
+
+    for result in results:
+        if 'ok' in result:
+            continue
+        if result['label'] in existing:
+            result['ok'] = True
+        else:
+            result.update(ok=False, error="Box nicht gefunden.")
+    return results
+
+
+class SyncView(LoginRequiredMixin, PermissionRequiredMixin, View):
+    """Delta-Sync (GET) und Hochladen gesammelter Änderungen (POST), siehe oben."""
+    permission_required = 'inventory.view_box'
+
+    def handle_no_permission(self):
+        if not self.request.user.is_authenticated:
+            return JsonResponse({'error': "Nicht angemeldet."}, status=401)
+        return JsonResponse({'error': "Keine Berechtigung."}, status=403)
+
+    def get(self, request):
+        since = parse_watermark(request.GET.get('since'))
+        try:
+            until = int(request.GET['until']) if 'until' in request.GET else None
+            after = int(request.GET.get('after', 0))
+        except ValueError:
+            return JsonResponse({'error': "Ungültige Parameter."}, status=400)
+
+        page = sync_page(since=since, until=until, after=after)
+        next_after = page.pop('after')
+        page['next'] = None
+        if page.pop('more'):
+            params = {'until': parse_watermark(page['watermark'])[0], 'after': next_after}
+            if not page['full']:
+                params['since'] = format_watermark(*since)
+            page['next'] = f"{reverse('api_sync')}?{urlencode(params)}"
+
+        response = JsonResponse(page)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+
+    def post(self, request):
+        if not request.user.has_perm('inventory.change_box'):
+            return JsonResponse({'error': "Keine Berechtigung zum Ändern von Boxen."}, status=403)
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': "Ungültiges JSON."}, status=400)
+        changes = payload.get('changes') if isinstance(payload, dict) else None
+        if not isinstance(changes, list):
+            return JsonResponse({'error': "'changes' muss eine Liste sein."}, status=400)
+        if len(changes) > MAX_CHANGES_PER_REQUEST:
+            return JsonResponse({'error': f"Maximal {MAX_CHANGES_PER_REQUEST} Änderungen pro Anfrage."}, status=400)
+
+        results = apply_changes(changes, request.user)
+        return JsonResponse({
+            'results': results,
+            'ok': sum(1 for r in results if r['ok']),
+            'failed': sum(1 for r in results if not r['ok']),
+        })
@@ -1,6 +1,8 @@
 # Erstellt in Version 1.5.3
 from django import template
 
+from inventory.lookups import locations
+
 register = template.Library()
 
 @register.filter(name='format_barcode')
@@ -26,4 +28,31 @@ def url_replace(context, **kwargs):
     query = context['request'].GET.copy()
     for key, value in kwargs.items():
         query[key] = value
-    return query.urlencode()
\ No newline at end of file
+    return query.urlencode()
+
+@register.filter(name='format_count')
+def format_count(value):
+    """
+    Formatiert Zähler mit schmalem Leerzeichen als Tausendertrenner.
+    Beispiel: 1204 -> '1 204'
+    """
+    try:
+        return f"{int(value):,}".replace(',', '\u202f')
+    except (TypeError, ValueError):
+        return value
+
+@register.filter(name='variant')
+def variant(image, key):
+    """
+    URL einer Bild-Variante (siehe inventory/images.py).
+    Beispiel: {{ img|variant:'medium_webp' }}
+    """
+    return image.variant_url(key)
+
+@register.filter(name='location_name')
+def location_name(location_id):
+    """
+    Name eines Lagerorts aus dem Cache (inventory/lookups.py), ohne JOIN.
+    Beispiel: {{ box.location_id|location_name }}
+    """
+    return locations().get(location_id, {}).get('name', '---')
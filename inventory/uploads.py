@@ -0,0 +1,284 @@
+import fcntl
+import json
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+
+from .images import VARIANT_SIZES, verify_image
+from .jobs import INCOMING_DIR, enqueue
+from .models import Box, Job, UploadSession
+
+
+# --- Bilder in Stücken hochladen (fortsetzbar) ---
+# Statt alle Fotos in einem einzigen Formular-Request zu schicken (der bei
+# langsamem Handy-Netz einen Worker minutenlang blockiert und bei einem
+# Abbruch komplett verloren ist), lädt die Bearbeiten-Seite jede Datei in
+# Stücken hoch:
+#
+#   POST   /box/<label>/uploads/   {"filename": ..., "size": ...}  -> Upload anlegen
+#   PATCH  /uploads/<id>/          Header Upload-Offset, Body = Bytes -> ein Stück
+#   GET    /uploads/<id>/          -> Stand (received), z.B. nach Verbindungsabbruch
+#   DELETE /uploads/<id>/          -> abbrechen
+#
+# Jedes Stück wird beim Lesen direkt in die Teildatei geschrieben (nie ganz im
+# Speicher). Ist die Datei vollständig und ein lesbares Bild, übernimmt der
+# Worker sie wie einen normalen Upload (Job 'ingest_images') - jedes Bild
+# erscheint also, sobald es fertig ist, unabhängig vom Rest.
+
+UPLOAD_DIR = f'{INCOMING_DIR}/chunked'
+
+# Empfohlene Stückgröße für den Client und Obergrenze pro Request
+CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+READ_SIZE = 64 * 1024
+
+# Größer als die größte Variante wird ein Foto nie angezeigt -> Client darf
+# vorher auf diese Kantenlänge verkleinern
+CLIENT_MAX_EDGE = max(VARIANT_SIZES.values())
+
+# Nur was Pillow lesen kann (siehe verify_image), also z.B. kein HEIC
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff'}
+
+# Angefangene Uploads ohne neues Stück werden nach einem Tag entfernt
+STALE_AFTER = timedelta(days=1)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_upload_size():
+    return settings.BEBO_UPLOAD_MAX_MB * 1024 * 1024
+
+
+def part_name(upload):
+    return f"{UPLOAD_DIR}/{upload.pk}.part"
+
+
+def start_upload(box, user, filename, size):
+    """Legt einen Upload an (prüft Dateiname und angekündigte Größe)."""
+    filename = os.path.basename(str(filename or '')).strip()[:255]
+    if not filename or os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+        raise UploadError("Nur Bilddateien erlaubt.")
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        raise UploadError("Ungültige Dateigröße.")
+    if size > max_upload_size():
+        raise UploadError(f"Datei zu groß (maximal {settings.BEBO_UPLOAD_MAX_MB} MB).", status=413)
+
+    upload = UploadSession.objects.create(
+        box=box,
+        created_by=user if user.is_authenticated else None,
+        filename=filename,
+        size=size,
+    )
+    path = default_storage.path(part_name(upload))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+def _check_chunk(upload, offset, length):
+    if upload.status != 'OPEN':
+        raise UploadError("Upload ist bereits abgeschlossen.", status=409)
+    if offset != upload.received:
+        raise UploadError("Falscher Offset.", status=409)
+    if length <= 0 or length > MAX_CHUNK_SIZE:
+        raise UploadError(f"Stück muss zwischen 1 Byte und {MAX_CHUNK_SIZE // (1024 * 1024)} MB groß sein.", status=413)
+    if offset + length > upload.size:
+        raise UploadError("Stück geht über das Dateiende hinaus.", status=413)
+
+
+def write_chunk(upload_id, offset, length, stream):
+    """
+    Schreibt ein Stück ab `offset` in die Teildatei. Erwartet wird immer genau
+    der bisherige Stand (received) - so geht nach einem Abbruch nichts doppelt
+    oder verloren. Endet der Body vorzeitig, zählt alles bis dahin Empfangene.
+
+    Während der Client sendet, ist keine Transaktion offen: parallele Requests
+    für dieselbe Datei hält eine Dateisperre ab, den neuen Stand übernimmt ein
+    bedingtes UPDATE (nur solange received noch `offset` ist).
+    """
+    upload = UploadSession.objects.get(pk=upload_id)
+    _check_chunk(upload, offset, length)
+
+    try:
+        f = open(default_storage.path(part_name(upload)), 'r+b')
+    except FileNotFoundError:
+        raise UploadError("Upload wurde abgebrochen.", status=409)
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Für diesen Upload wird gerade ein anderes Stück geschrieben.", status=409)
+
+        # Stand erst unter der Sperre verbindlich: ein anderer Request kann inzwischen fertig sein
+        upload = UploadSession.objects.filter(pk=upload_id).first()
+        if upload is None:
+            raise UploadError("Upload wurde abgebrochen.", status=409)
+        _check_chunk(upload, offset, length)
+
+        # Immer ab dem bestätigten Stand schreiben und danach abschneiden:
+        # Reste eines abgebrochenen Versuchs werden so überschrieben
+        written = 0
+        f.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            f.write(data)
+            written += len(data)
+        f.truncate(offset + written)
+        f.flush()
+
+        now = timezone.now()
+        updated = (
+            UploadSession.objects
+            .filter(pk=upload_id, status='OPEN', received=offset)
+            .update(received=offset + written, updated_at=now)
+        )
+    if not updated:
+        raise UploadError("Upload wurde inzwischen abgebrochen.", status=409)
+
+    upload.received = offset + written
+    upload.updated_at = now
+    if upload.received == upload.size:
+        complete_upload(upload)
+    return upload
+
+
+def complete_upload(upload):
+    """Vollständige Datei prüfen und an den Worker übergeben (wird zum BoxImage)."""
+    with default_storage.open(part_name(upload), 'rb') as f:
+        if not verify_image(f):
+            abort_upload(upload)
+            raise UploadError("Die Datei ist kein lesbares Bild.", status=422)
+
+    with transaction.atomic():
+        upload.job = enqueue(
+            'ingest_images',
+            {'files': [{'path': part_name(upload), 'name': upload.filename}]},
+            box=upload.box,
+            user=upload.created_by,
+            description=f"Bild verarbeiten: {upload.filename}"[:200],
+        )
+        upload.status = 'COMPLETE'
+        upload.save(update_fields=['job', 'status', 'updated_at'])
+
+
+def abort_upload(upload):
+    # Die Teildatei entfernt das Signal (release_upload_part)
+    upload.delete()
+
+
+def release_upload_part(upload):
+    """
+    Nach dem Löschen eines Uploads (abgebrochen, veraltet oder zusammen mit
+    seiner Box): Teildatei entfernen, außer ein Job soll sie noch übernehmen.
+    """
+    name = part_name(upload)
+    job_id = upload.job_id
+
+    def release():
+        if job_id and Job.objects.filter(pk=job_id, status__in=['PENDING', 'RUNNING']).exists():
+            return
+        default_storage.delete(name)
+    transaction.on_commit(release)
+
+
+def purge_stale_uploads(older_than=STALE_AFTER):
+    """Entfernt abgebrochene Uploads (Teildatei + Eintrag) und alte abgeschlossene Einträge."""
+    stale = UploadSession.objects.filter(updated_at__lt=timezone.now() - older_than)
+    removed = 0
+    for upload in stale.filter(status='OPEN').iterator():
+        abort_upload(upload)
+        removed += 1
+    # Abgeschlossene: Datei hat der Job übernommen, nur der Eintrag bleibt übrig
+    stale.filter(status='COMPLETE').delete()
+    return removed
+
+
+def upload_as_json(upload):
+    return {
+        'id': str(upload.pk),
+        'url': reverse('upload_detail', args=[upload.pk]),
+        'filename': upload.filename,
+        'size': upload.size,
+        'received': upload.received,
+        'complete': upload.status == 'COMPLETE',
+        'job': upload.job_id,
+    }
+
+
+class UploadMixin(LoginRequiredMixin, PermissionRequiredMixin):
+    """Rechte wie beim Bearbeiten einer Box; Fehler immer als JSON."""
+    permission_required = 'inventory.change_box'
+
+    def handle_no_permission(self):
+        if not self.request.user.is_authenticated:
+            return JsonResponse({'error': "Nicht angemeldet."}, status=401)
+        return JsonResponse({'error': "Keine Berechtigung."}, status=403)
+
+
+class UploadStartView(UploadMixin, View):
+    def post(self, request, label_id):
+        box = get_object_or_404(Box, label=label_id)
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': "Ungültiges JSON."}, status=400)
+        if not isinstance(payload, dict):
+            return JsonResponse({'error': "JSON-Objekt erwartet."}, status=400)
+
+        try:
+            upload = start_upload(box, request.user, payload.get('filename'), payload.get('size'))
+        except UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+        return JsonResponse({
+            **upload_as_json(upload),
+            'chunk_size': CHUNK_SIZE,
+            'max_chunk_size': MAX_CHUNK_SIZE,
+            'max_size': max_upload_size(),
+            # Hinweis an den Client: vor dem Hochladen auf diese Kantenlänge verkleinern
+            'max_edge': CLIENT_MAX_EDGE,
+        }, status=201)
+
+
+class UploadDetailView(UploadMixin, View):
+    def get_upload(self):
+        # Nur eigene Uploads
+        return get_object_or_404(UploadSession, pk=self.kwargs['pk'], created_by=self.request.user)
+
+    def get(self, request, pk):
+        return JsonResponse(upload_as_json(self.get_upload()))
+
+    def patch(self, request, pk):
+        upload = self.get_upload()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+            length = int(request.headers.get('Content-Length', ''))
+        except ValueError:
+            return JsonResponse({'error': "Header Upload-Offset und Content-Length erforderlich."}, status=400)
+
+        try:
+            upload = write_chunk(upload.pk, offset, length, request)
+        except UploadError as e:
+            upload = UploadSession.objects.filter(pk=upload.pk).first()
+            return JsonResponse({'error': str(e), **(upload_as_json(upload) if upload else {})}, status=e.status)
+        return JsonResponse(upload_as_json(upload))
+
+    def delete(self, request, pk):
+        upload = self.get_upload()
+        if upload.status == 'OPEN':
+            abort_upload(upload)
+        return JsonResponse({'deleted': True})
@@ -1,16 +1,30 @@
 from django.urls import path
+from .api import ScanView
+from .restapi import (
+    ApiIndexView, BoxDetailApiView, BoxImagesApiView, BoxListApiView,
+    CategoryListApiView, HistoryApiView, LocationListApiView,
+)
+from .sync import SyncView
+from .uploads import UploadDetailView, UploadStartView
 from .views import (
     # --- Verbleibende Funktions-Views --- 
     global_history, 
+    global_history_export,
+    service_worker,
+    web_manifest,
+    OfflineAppView,
     changelog_view,
     
     # --- Feature Release 1.6.0: Box Management (CBVs) ---
     BoxListView,
     BoxDetailView,
+    BoxHistoryView,
     BoxCreateView, 
     BoxUpdateView, 
     BoxDeleteView,
     BoxImageDeleteView,
+    BoxBulkMoveView,
+    JobStatusView,
     
     # --- Feature Release 1.6.0: Stammdaten (CBVs) ---
     LocationListView, 
@@ -28,10 +42,16 @@ urlpatterns = [
     # Wir nutzen BoxListView für das Dashboard, um die Rechteprüfung (view_box) zu erzwingen.
     path('', BoxListView.as_view(), name='dashboard'),                                          # 1.6.0 Feature
     path('box/new/', BoxCreateView.as_view(), name='box_new'),                                  # 1.6.0 Feature
+    path('box/bulk-move/', BoxBulkMoveView.as_view(), name='box_bulk_move'),                    # Sammel-Umzug
     path('box/<str:label_id>/', BoxDetailView.as_view(), name='box_detail'),                    # 1.6.0 Feature
+    path('box/<str:label_id>/history/', BoxHistoryView.as_view(), name='box_history'),          # Verlauf (nachgeladen)
     path('box/<str:label_id>/edit/', BoxUpdateView.as_view(), name='box_edit'),                 # 1.6.0 Feature
     path('box/<str:label_id>/delete/', BoxDeleteView.as_view(), name='box_delete'),             # 1.6.0 Feature
 
+    # Bilder in Stücken hochladen (fortsetzbar, JSON)
+    path('box/<str:label_id>/uploads/', UploadStartView.as_view(), name='upload_start'),
+    path('uploads/<uuid:pk>/', UploadDetailView.as_view(), name='upload_detail'),
+
     # Bilder löschen über die CBV
     path('image/<int:pk>/delete/', BoxImageDeleteView.as_view(), name='image_delete'),          # 1.6.0 Feature
 
@@ -47,7 +67,31 @@ urlpatterns = [
     path('categories/<int:pk>/edit/', CategoryUpdateView.as_view(), name='category_update'),    # 1.6.0 Feature
     path('categories/<int:pk>/delete/', CategoryDeleteView.as_view(), name='category_delete'),  # 1.6.0 Feature
 
+    # --- SCAN-API (Handscanner, JSON) ---
+    path('api/scan/', ScanView.as_view(), name='api_scan'),
+    path('api/scan/<str:code>/', ScanView.as_view(), name='api_scan_code'),
+
+    # --- LESE-API (JSON, versioniert) ---
+    path('api/v1/', ApiIndexView.as_view(), name='api_index'),
+    path('api/v1/boxes/', BoxListApiView.as_view(), name='api_boxes'),
+    path('api/v1/boxes/<str:label>/', BoxDetailApiView.as_view(), name='api_box'),
+    path('api/v1/boxes/<str:label>/images/', BoxImagesApiView.as_view(), name='api_box_images'),
+    path('api/v1/boxes/<str:label>/history/', HistoryApiView.as_view(), name='api_box_history'),
+    path('api/v1/history/', HistoryApiView.as_view(), name='api_history'),
+    path('api/v1/locations/', LocationListApiView.as_view(), name='api_locations'),
+    path('api/v1/categories/', CategoryListApiView.as_view(), name='api_categories'),
+
+    # --- OFFLINE-APP (Delta-Sync + PWA) ---
+    path('api/sync/', SyncView.as_view(), name='api_sync'),
+    path('app/', OfflineAppView.as_view(), name='offline_app'),
+    path('sw.js', service_worker, name='service_worker'),
+    path('manifest.webmanifest', web_manifest, name='web_manifest'),
+
+    # --- HINTERGRUND-AUFGABEN ---
+    path('jobs/<int:pk>/', JobStatusView.as_view(), name='job_status'),
+
     # --- SONSTIGES (Historie, Changelog) ---
     path('history/', global_history, name='global_history'),
+    path('history/export/', global_history_export, name='global_history_export'),
     path('changelog/', changelog_view, name='changelog'),
 ]
\ No newline at end of file
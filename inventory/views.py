@@ -1,17 +1,40 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
-from .models import Box, BoxImage, Location, Category
-from .forms import BoxForm
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.contrib.auth.decorators import login_required, permission_required
+from .models import Box, BoxImage, HistoryArchive, Job, Location, Category
+from .forms import BoxForm, BoxBulkMoveForm
 from django.db.models import Q
-from django.core.paginator import Paginator
 
 # Imports für Feature Release 1.6.0
 from django.urls import reverse_lazy
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
+from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, FormView, TemplateView
+from django.contrib import messages
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.http import http_date
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.mixins import PermissionRequiredMixin
 from django.db.models import Q
 
+from .asgi import AsyncPermissionRequiredMixin, is_asgi, stream_in_thread
+from .bulk import move_boxes, parse_labels
+from .caching import FRAGMENT_TIMEOUT, box_version, box_versions, make_etag
+from .facets import box_facets
+from .history import EXPORT_FIELDS, FEED_SORT_FIELDS, MEANINGFUL_ENTRY, activity_feed, ensure_change_summaries, export_feed, history_entries
+from .jobs import enqueue_image_ingest, enqueue_missing_variants
+from .lookups import lookups_version
+from .pagination import KeysetPaginator, estimated_count
+from .retention import archived_records, is_meaningful
+from .search import search_boxes
+from .uploads import CLIENT_MAX_EDGE
+
 
 @login_required
 def dashboard(request):
@@ -42,59 +65,34 @@ def dashboard(request):
         'search_query': query         # Damit das Suchfeld gefüllt bleibt
     })
 
-@login_required
-def global_history(request):
-    # Basis-Query: nur "sinnvolle" Einträge:
-    # - mit Benutzer ODER
-    # - mit Change-Reason ODER
-    # - Erzeugt / Gelöscht (+ / -)
-    history_qs = (
-        Box.history.all()
-        .select_related('history_user', 'location')
-        .filter(
-            Q(history_user__isnull=False) |
-            Q(history_change_reason__isnull=False) |
-            Q(history_type__in=['+', '-'])
-        )
-    )
-
-    view_title = "Alle Aktivitäten"
-
-    # Filter: nur eigene Aktivitäten
-    user_filter = request.GET.get('user')
-    if user_filter == 'me' and request.user.is_authenticated:
-        history_qs = history_qs.filter(history_user=request.user)
-        view_title = "Meine Aktivitäten"
+def _feed_filters(request):
+    """Filter und Sortierung des Aktivitäten-Feeds aus der URL (Seite und Export)."""
+    feed_user = None
+    if request.GET.get('user') == 'me' and request.user.is_authenticated:
+        feed_user = request.user
 
-    # Sortierung
     sort_key = request.GET.get('sort', 'wann')
-    sort_dir = request.GET.get('dir', 'desc')
+    if sort_key not in FEED_SORT_FIELDS:
+        sort_key = 'wann'
+    sort_dir = 'asc' if request.GET.get('dir') == 'asc' else 'desc'
+    return feed_user, sort_key, sort_dir
 
-    valid_sort_fields = {
-        'wann': 'history_date',
-        'wer': 'history_user__username',
-        'aktion': 'history_type',
-        'box': 'label',
-        'lagerort': 'location__name',
-        'status': 'status',
-    }
 
-    db_field = valid_sort_fields.get(sort_key, 'history_date')
-
-    if sort_dir == 'desc':
-        order_by = f'-{db_field}'
-    else:
-        order_by = db_field
-
-    history_qs = history_qs.order_by(order_by, '-history_id')
+@login_required
+def global_history(request):
+    # Feed nur mit "sinnvollen" Einträgen (mit Benutzer, mit Text oder
+    # Erzeugt/Gelöscht), siehe activity_feed() in inventory/history.py
+    # Filter: nur eigene Aktivitäten; Sortierung
+    feed_user, sort_key, sort_dir = _feed_filters(request)
+    view_title = "Meine Aktivitäten" if feed_user else "Alle Aktivitäten"
 
-    # Pagination
-    paginator = Paginator(history_qs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    history_qs, ordering = activity_feed(user=feed_user, sort=sort_key, direction=sort_dir)
 
-    current_params = request.GET.copy()
-    current_params.pop('page', None)
+    # Keyset-Paginierung statt Seitenzahlen: kein COUNT(*) und kein OFFSET
+    # über die ganze History-Tabelle; die Gesamtzahl ist nur geschätzt
+    paginator = KeysetPaginator(history_qs, ordering, per_page=50)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    total_count, count_is_estimate = estimated_count(history_qs)
 
     next_sort_dir = 'asc' if sort_dir == 'desc' else 'desc'
 
@@ -103,14 +101,71 @@ def global_history(request):
         'inventory/global_history.html',
         {
             'page_obj': page_obj,
+            'total_count': total_count,
+            'count_is_estimate': count_is_estimate,
             'view_title': view_title,
             'current_sort': sort_key,
             'current_dir': sort_dir,
             'next_sort_dir': next_sort_dir,
-            'query_params': current_params.urlencode(),
         },
     )
 
+
+class _Echo:
+    """Pseudo-Datei für csv.writer: gibt die geschriebene Zeile direkt zurück."""
+    def write(self, value):
+        return value
+
+
+def _export_lines(rows, file_format, lines_per_chunk=500):
+    """Zeilen für den Export, in Blöcken gebündelt (nicht jede Zeile einzeln senden)."""
+    if file_format == 'jsonl':
+        lines = (json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+    else:
+        writer = csv.writer(_Echo())
+        # BOM, damit Excel die Umlaute erkennt
+        header = '\ufeff' + writer.writerow(EXPORT_FIELDS)
+        lines = itertools.chain([header], (
+            writer.writerow([
+                *(row[field] for field in EXPORT_FIELDS[:-1]),
+                '; '.join(f"{c['field']}: {c['old']} → {c['new']}" for c in row['changes']),
+            ])
+            for row in rows
+        ))
+
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= lines_per_chunk:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+@login_required
+@permission_required('inventory.view_box', raise_exception=True)
+def global_history_export(request):
+    """
+    Kompletter Aktivitäten-Feed (gleiche Filter/Sortierung wie die Seite) als
+    CSV oder JSONL. Wird während des Lesens gestreamt, siehe export_feed().
+    """
+    feed_user, sort_key, sort_dir = _feed_filters(request)
+    file_format = 'jsonl' if request.GET.get('format') == 'jsonl' else 'csv'
+
+    history_qs, ordering = activity_feed(user=feed_user, sort=sort_key, direction=sort_dir)
+    rows = export_feed(history_qs, ordering)
+
+    content_type = 'application/x-ndjson' if file_format == 'jsonl' else 'text/csv'
+    lines = _export_lines(rows, file_format)
+    if is_asgi(request):
+        lines = stream_in_thread(lines)
+    response = StreamingHttpResponse(lines, content_type=f'{content_type}; charset=utf-8')
+    filename = f"aktivitaeten-{timezone.localdate():%Y%m%d}.{file_format}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
 # View für die Changelog-Seite
 @login_required
 def changelog_view(request):
@@ -181,19 +236,22 @@ class CategoryDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView
 
     # --- Feature Release 1.6.0: BOX (BOX) VIEWS ---
 
-class BoxListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
+class BoxListView(AsyncPermissionRequiredMixin, ListView):
     permission_required = 'inventory.view_box'
     model = Box
     template_name = 'inventory/dashboard.html'              # Das Dashboard dient als Liste
     context_object_name = 'boxes'
-    ordering = ['-updated_at']                              # Letzte Änderung zuerst
+    ordering = ['-updated_at', '-id']                       # Letzte Änderung zuerst, id als eindeutiger Tie-Breaker
+    search_ordering = ['-rank', '-updated_at', '-id']       # Sortierung bei aktiver Suche (beste Treffer zuerst)
+    paginate_by = 48                                        # Karten pro Seite (teilbar durch 2 und 3 Spalten)
     raise_exception = False                                  # Zeigt 403 Fehler bei fehlender Berechtigung
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # Lagerort-Namen aus dem Cache (|location_name), Kategorien in einer Zusatz-Query -> kein N+1 pro Karte
+        queryset = Box.objects.prefetch_related('categories')
         
         # 1. Parameter aus der URL holen
-        search_query = self.request.GET.get('q')            # Suchbegriff aus dem Suchformular
+        search_query = self.request.GET.get('q', '').strip()  # Suchbegriff aus dem Suchformular
         location_id = self.request.GET.get('location')      # Filter für Lagerort (Antippen)
         category_id = self.request.GET.get('category')      # Filter für Kategorie (Antippen)
         status_filter = self.request.GET.get('status')      # Filter für Status (Antippen der Badges)
@@ -209,43 +267,99 @@ class BoxListView(LoginRequiredMixin, PermissionRequiredMixin, ListView):
             queryset = queryset.filter(status=status_filter)
 
         # --- LOGIK: VOLLTEXTSUCHE (Manuelle Eingabe im Suchfeld) ---
+        # Postgres-Volltextsuche + Trigramm-Suche im Barcode, siehe inventory/search.py.
+        # Kein JOIN auf Kategorien mehr -> auch kein DISTINCT nötig.
         if search_query:
-            # Mapping deutscher Begriffe auf die Datenbank-Werte (STATUS_CHOICES)
-            status_map = {
-                'gelagert': 'STORED',
-                'verliehen': 'LENT',
-                'zugriff': 'ACCESS',
-                'extern': 'EXT',
-                'transit': 'TRANSIT',
-                'verloren': 'LOST',
-                'unbekannt': 'LOST'
-            }
-            mapped_status = status_map.get(search_query.lower())
-
-            # Suche über alle relevanten Felder mit Q-Objekten
-            q_objects = Q(label__icontains=search_query) | \
-                        Q(description__icontains=search_query) | \
-                        Q(location__name__icontains=search_query) | \
-                        Q(categories__name__icontains=search_query)
-
-            # Falls der Suchbegriff einem Status entspricht, diesen in die Suche einbeziehen
-            if mapped_status:
-                q_objects |= Q(status=mapped_status)
-
-            queryset = queryset.filter(q_objects).distinct()
+            queryset = search_boxes(queryset, search_query)
             
-        return queryset
+        return queryset.order_by(*self.get_ordering())
+
+    async def get(self, request, *args, **kwargs):
+        # Async (siehe inventory/asgi.py): die Seite kommt über das async ORM,
+        # Facetten und Versionsnummern gesammelt in einem Schritt im Sync-Thread
+        self.object_list = self.get_queryset()
+        paginator = KeysetPaginator(self.object_list, self.get_ordering(), self.paginate_by)
+        self.page = await paginator.aget_page(request.GET.get('cursor'))
+        context = await sync_to_async(self.get_context_data)()
+        return self.render_to_response(context)
+
+    def get_ordering(self):
+        # Bei einer Suche zuerst nach Relevanz, sonst nach letzter Änderung
+        if self.request.GET.get('q', '').strip():
+            return self.search_ordering
+        return self.ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Keyset-Paginierung statt OFFSET: Der Cursor in der URL (?cursor=...)
+        merkt sich die Sortierwerte der Randkarte (updated_at, id bzw. bei
+        einer Suche rank, updated_at, id), dadurch kosten tiefe Seiten
+        genauso viel wie die erste. Geladen wird die Seite schon in get().
+        """
+        page = self.page
+        return (page.paginator, page, page.object_list, page.has_other_pages())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # total_count muss auf dem bereits gefilterten Queryset basieren
-        context['total_count'] = self.get_queryset().count()
+        # Gesamtzahl + Zähler pro Status/Lagerort/Kategorie für den aktuellen
+        # Filter in einer einzigen Abfrage (statt get_queryset().count() erneut)
+        facets = box_facets(self.object_list)
+        context['facets'] = facets
+        context['total_count'] = facets['total']
+        # Versionsnummern für die gecachten Karten (ein Cache-Zugriff für die ganze Seite)
+        versions = box_versions([box.pk for box in context['boxes']])
+        for box in context['boxes']:
+            box.cache_version = versions[box.pk]
+        context['lookups_version'] = lookups_version()
+        context['fragment_timeout'] = FRAGMENT_TIMEOUT
         # Suchbegriff für das Template bereitstellen
         context['search_query'] = self.request.GET.get('q', '')
         return context
     
 
-class BoxDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
+class ConditionalBoxMixin:
+    """
+    Bedingte GET-Requests für Box-Seiten: ETag aus Versionsnummer der Box
+    (inventory/caching.py) und weiteren Bestandteilen, Last-Modified aus
+    updated_at. Hat sich nichts geändert, antwortet die View mit 304, ohne
+    etwas zu rendern. Stehen noch Meldungen (messages) aus, wird immer
+    gerendert, sonst gingen sie verloren.
+    """
+
+    def get_etag_parts(self):
+        return [
+            settings.BEBO_VERSION,
+            box_version(self.object.pk),
+            lookups_version(),
+            self.request.user.pk,
+            # Neues CSRF-Secret (z.B. nach erneutem Login) -> Logout-Formular neu rendern
+            self.request.META.get('CSRF_COOKIE'),
+            self.request.get_full_path(),
+        ]
+
+    def render_box(self):
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    async def get(self, request, *args, **kwargs):
+        # Async (siehe inventory/asgi.py): Box per Label über das async ORM,
+        # ETag-Bestandteile und Rendern laufen im Sync-Thread
+        self.object = await aget_object_or_404(self.get_queryset(), **{self.slug_field: self.kwargs[self.slug_url_kwarg]})
+        if len(messages.get_messages(request)):
+            return await sync_to_async(self.render_box)()
+
+        etag = make_etag(*await sync_to_async(self.get_etag_parts)())
+        last_modified = int(self.object.updated_at.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = await sync_to_async(self.render_box)()
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+        # Seiten hängen am Benutzer und sollen immer neu geprüft werden (dann meist 304)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+class BoxDetailView(AsyncPermissionRequiredMixin, ConditionalBoxMixin, DetailView):
     permission_required = 'inventory.view_box'
     model = Box
     template_name = 'inventory/box_detail.html'
@@ -253,126 +367,107 @@ class BoxDetailView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
     slug_field = 'label'
     slug_url_kwarg = 'label_id'
 
+    # Kein select_related/prefetch_related: Lagerort-Name kommt aus dem Cache
+    # (|location_name), Kategorien und Bilder lädt das Template nur, wenn das
+    # jeweilige Fragment nicht im Cache liegt.
+
+    def get_jobs(self):
+        # Laufende und fehlgeschlagene Hintergrund-Aufgaben dieser Box
+        if not hasattr(self, '_jobs'):
+            self._jobs = list(self.object.jobs.exclude(status='DONE').order_by('created_at'))
+        return self._jobs
+
+    def get_images(self):
+        images = list(self.object.images.all())
+        # Ältere Uploads ohne verkleinerte Varianten: im Hintergrund nachziehen
+        enqueue_missing_variants(self.object, images)
+        return images
+
+    def get_etag_parts(self):
+        return [
+            *super().get_etag_parts(),
+            self.request.user.has_perm('inventory.change_box'),
+            [(job.pk, job.status) for job in self.get_jobs()],
+        ]
+
     def get_context_data(self, **kwargs):
-        # 1. Rufe die Basis-Implementierung auf, um den Standard-Kontext zu erhalten
         context = super().get_context_data(**kwargs)
+        context['jobs'] = self.get_jobs()
+        # Wird erst im Template (bei fehlendem Fragment) aufgerufen
+        context['box_images'] = self.get_images
+        context['box_version'] = box_version(self.object.pk)
+        context['lookups_version'] = lookups_version()
+        context['fragment_timeout'] = FRAGMENT_TIMEOUT
+        return context
 
-        # 2. Hole das aktuelle Box-Objekt und die zugehörigen Modelle
-        box = self.get_object()
-        Location = self.model._meta.get_field('location').related_model
-        Category = self.model._meta.get_field('categories').related_model
+    # Der Verlauf wird nicht mehr hier berechnet, sondern vom Tab "Verlauf"
+    # seitenweise über BoxHistoryView nachgeladen.
 
-        # 3. Hole die komplette Historie für diese Box, neueste zuerst
-        #    Liste erzwingen, damit Index-Zugriffe und len() effizient sind
-        history_records = list(
-            box.history.all()
-            .select_related('history_user')
-            .order_by('-history_date', '-history_id')
+
+class BoxHistoryView(AsyncPermissionRequiredMixin, ConditionalBoxMixin, DetailView):
+    """
+    Liefert den Verlauf einer Box als HTML-Fragment (Tabellenzeilen), seitenweise
+    per Cursor. Die Feldänderungen sind in HistoricalBox.change_summary
+    vorberechnet (siehe inventory/history.py), pro Seite gibt es also nur eine
+    Abfrage statt einer pro Eintrag. Die fertigen Zeilen liegen pro
+    Versionsnummer der Box und Seite im Cache.
+    """
+    permission_required = 'inventory.view_box'
+    model = Box
+    template_name = 'inventory/box_history_rows.html'
+    context_object_name = 'box'
+    slug_field = 'label'
+    slug_url_kwarg = 'label_id'
+    paginate_by = 25
+
+    def render_box(self):
+        key = 'bebo:history-rows:{}:{}:{}'.format(
+            self.object.pk,
+            box_version(self.object.pk),
+            make_etag(self.request.GET.urlencode()),
         )
+        content = cache.get(key)
+        if content is None:
+            response = super().render_box()
+            response.render()
+            cache.set(key, response.content, FRAGMENT_TIMEOUT)
+            return response
+        return HttpResponse(content)
 
-        # 4. Bereite die Daten so auf, wie das Template sie erwartet (mit Änderungsdetails)
-        processed_history = []
-
-        for i, record in enumerate(history_records):
-
-            # 4a. Einträge mit Text (history_change_reason) immer direkt übernehmen.
-            #     Das betrifft u. a.:
-            #     - "Bild hinzugefügt: ..."
-            #     - "Bild gelöscht: ..."
-            #     - "Kategorien hinzugefügt/entfernt: ..."
-            #     - "Status geändert: ..."
-            if record.history_change_reason:
-                processed_history.append({
-                    'record': record,
-                    'changes': [],  # Template zeigt dann nur den Text an
-                })
-                continue  # Für diese Einträge keine Feld-Diffs berechnen
-
-            changes_list = []
-
-            # Nur bei Änderungs-Einträgen (~) Diffs berechnen
-            if record.history_type == '~' and i + 1 < len(history_records):
-                prev_record = history_records[i + 1]
-
-                try:
-                    delta = record.diff_against(prev_record)
-                except Exception:
-                    delta = None
-
-                if delta:
-                    for change in delta.changes:
-                        field_name = change.field
-
-                        # Feldnamen lesbar machen, wenn möglich
-                        try:
-                            field_verbose_name = self.model._meta.get_field(field_name).verbose_name
-                        except Exception:
-                            field_verbose_name = field_name
-
-                        old_value = change.old
-                        new_value = change.new
-
-                        # --- START: Logik zur "Übersetzung" der Werte in Klarnamen ---
-                        if field_name == 'location':
-                            old_obj = Location.objects.filter(pk=old_value).first()
-                            new_obj = Location.objects.filter(pk=new_value).first()
-                            old_value = old_obj.name if old_obj else "---"
-                            new_value = new_obj.name if new_obj else "---"
-
-                        elif field_name == 'status':
-                            choices = dict(self.model.STATUS_CHOICES)
-                            old_value = choices.get(old_value, old_value)
-                            new_value = choices.get(new_value, new_value)
-
-                        elif field_name == 'categories':
-                            # Listen mit Dicts -> nur die IDs extrahieren
-                            old_ids = [item['category'] for item in (old_value or [])]
-                            new_ids = [item['category'] for item in (new_value or [])]
-
-                            old_items = Category.objects.filter(pk__in=old_ids).values_list('name', flat=True)
-                            new_items = Category.objects.filter(pk__in=new_ids).values_list('name', flat=True)
-
-                            old_value = ", ".join(sorted(old_items)) or "Keine"
-                            new_value = ", ".join(sorted(new_items)) or "Keine"
-
-                        else:  # Fallback für andere Felder wie 'description'
-                            old_value = old_value if old_value else "---"
-                            new_value = new_value if new_value else "---"
-                        # --- ENDE: Logik zur "Übersetzung" ---
-
-                        changes_list.append(
-                            {
-                                'field': field_verbose_name,
-                                'old': old_value,
-                                'new': new_value,
-                            }
-                        )
-
-            # 5. Anzeige-Logik:
-            #    - Erstellen/Löschen immer
-            #    - Änderungen nur, wenn es tatsächlich Feld-Änderungen gibt
-            has_diffs = len(changes_list) > 0
-            is_creation = record.history_type == '+'
-            is_deletion = record.history_type == '-'
-
-            include = (
-                is_creation or
-                is_deletion or
-                has_diffs
-            )
-
-            if include:
-                processed_history.append(
-                    {
-                        'record': record,
-                        'changes': changes_list,
-                    }
-                )
-
-        # 6. Füge die aufbereiteten Verlaufsdaten zum Kontext hinzu
-        context['history_data'] = processed_history
-        
-        # 7. Gib den vollständigen Kontext zurück
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+
+        archives = HistoryArchive.objects.filter(box_id=self.object.pk).order_by('-last_date', '-id')
+        archive_id = self.request.GET.get('archive')
+        if archive_id:
+            # Archivierte Einträge: ein Abschnitt pro Klick (siehe inventory/retention.py)
+            if not archive_id.isdigit():
+                raise Http404
+            segment = get_object_or_404(archives, pk=archive_id)
+            records = [r for r in archived_records(segment) if is_meaningful(r)]
+            context['history_data'] = history_entries(records)
+            context['next_archive'] = archives.filter(
+                Q(last_date__lt=segment.last_date) | Q(last_date=segment.last_date, id__lt=segment.id)
+            ).first()
+            context['in_archive'] = True
+            return context
+
+        # Fehlende Zusammenfassungen einmalig nachholen (danach: leere Abfrage)
+        ensure_change_summaries(self.object.pk)
+
+        history_qs = (
+            self.object.history
+            .filter(MEANINGFUL_ENTRY)
+            .select_related('history_user')
+        )
+        paginator = KeysetPaginator(history_qs, ['-history_date', '-history_id'], self.paginate_by)
+        page = paginator.get_page(self.request.GET.get('cursor'))
+
+        context['history_data'] = history_entries(page.object_list)
+        context['page_obj'] = page
+        # Am Ende des aktuellen Verlaufs ggf. ins Archiv weiterblättern
+        if not page.has_next():
+            context['next_archive'] = archives.first()
         return context
 
 class BoxCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
@@ -391,10 +486,10 @@ class BoxCreateView(LoginRequiredMixin, PermissionRequiredMixin, CreateView):
         # bevor wir Bilder anlegen (für die Bild-Logs)
         self.object._history_user = self.request.user
 
-        # Dann hochgeladene Bilder anlegen
-        uploaded_files = self.request.FILES.getlist('image_upload')
-        for file in uploaded_files:
-            BoxImage.objects.create(box=self.object, image=file)
+        # Dann hochgeladene Bilder an den Worker übergeben (Varianten + Verlauf im Hintergrund)
+        job = enqueue_image_ingest(self.object, self.request.FILES.getlist('image_upload'), user=self.request.user)
+        if job:
+            messages.info(self.request, f"{job.description}: läuft im Hintergrund.")
 
         return response
 
@@ -441,10 +536,10 @@ class BoxUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
         # User auch am gespeicherten Objekt setzen (für Bild-Logs)
         self.object._history_user = self.request.user
 
-        # Jetzt die hochgeladenen Bilder verarbeiten
-        uploaded_files = self.request.FILES.getlist('image_upload')
-        for file in uploaded_files:
-            BoxImage.objects.create(box=self.object, image=file)
+        # Hochgeladene Bilder nur zwischenspeichern, den Rest erledigt der Worker
+        job = enqueue_image_ingest(self.object, self.request.FILES.getlist('image_upload'), user=self.request.user)
+        if job:
+            messages.info(self.request, f"{job.description}: läuft im Hintergrund.")
 
         return response
 
@@ -455,6 +550,8 @@ class BoxUpdateView(LoginRequiredMixin, PermissionRequiredMixin, UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['box_detail'] = "Box bearbeiten"
+        # Für das Hochladen in Stücken (inventory/uploads.py)
+        context['upload_max_edge'] = CLIENT_MAX_EDGE
         return context
 
 class BoxDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
@@ -469,4 +566,72 @@ class BoxDeleteView(LoginRequiredMixin, PermissionRequiredMixin, DeleteView):
         self.object = self.get_object()
         # User an die Box hängen, bevor gelöscht wird
         self.object._history_user = request.user
-        return super().delete(request, *args, **kwargs)
\ No newline at end of file
+        return super().delete(request, *args, **kwargs)
+
+
+class BoxBulkMoveView(LoginRequiredMixin, PermissionRequiredMixin, FormView):
+    """
+    Sammel-Umzug: Liste von Barcodes an einen Lagerort und/oder in einen Status.
+    Läuft in einer Transaktion mit gebündelten Updates und History-Einträgen.
+    """
+    permission_required = 'inventory.change_box'
+    form_class = BoxBulkMoveForm
+    template_name = 'inventory/box_bulk_move.html'
+
+    def form_valid(self, form):
+        result = move_boxes(
+            parse_labels(form.cleaned_data['labels']),
+            location=form.cleaned_data['location'],
+            status=form.cleaned_data['status'] or None,
+            user=self.request.user,
+        )
+
+        messages.success(
+            self.request,
+            f"{result['moved']} Boxen geändert, {result['unchanged']} waren bereits auf dem Zielstand.",
+        )
+        if result['not_found'] or result['invalid']:
+            # Formular mit den Problemfällen erneut anzeigen, damit man sie korrigieren kann
+            return self.render_to_response(self.get_context_data(form=form, result=result))
+        return redirect('box_bulk_move')
+
+
+class JobStatusView(LoginRequiredMixin, PermissionRequiredMixin, DetailView):
+    """
+    Status einer Hintergrund-Aufgabe als JSON (für die Anzeige auf der Detailseite).
+    """
+    permission_required = 'inventory.view_box'
+    model = Job
+
+    def render_to_response(self, context, **response_kwargs):
+        job = self.object
+        return JsonResponse({
+            'id': job.pk,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'description': job.description,
+            'finished': job.status in ('DONE', 'FAILED'),
+        })
+
+
+# --- Offline-App (PWA) ---
+# /app/ ist eine einzelne Seite, die den Bestand über /api/sync/ in die
+# IndexedDB des Browsers lädt und dort durchsucht. Der Service Worker hält
+# die Seite samt Bootstrap im Cache; Änderungen und Scans ohne Netz landen
+# in einer Warteschlange und werden beim nächsten Sync hochgeladen
+# (siehe inventory/sync.py).
+
+class OfflineAppView(LoginRequiredMixin, PermissionRequiredMixin, TemplateView):
+    permission_required = 'inventory.view_box'
+    template_name = 'inventory/offline_app.html'
+
+
+def service_worker(request):
+    # Liegt unter /sw.js (nicht /static/), damit er für die ganze Seite gilt
+    response = render(request, 'inventory/sw.js', content_type='application/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def web_manifest(request):
+    return render(request, 'inventory/manifest.webmanifest', content_type='application/manifest+json')
@@ -0,0 +1,82 @@
+// BeBo Service Worker (wird über die View service_worker ausgeliefert).
+// - Bootstrap, Icons usw. vom CDN und /static/: aus dem Cache (versionierte URLs)
+// - Bilder mit Inhalts-Hash im Namen: aus dem Cache (ändern sich nie)
+// - Offline-App (/app/): sofort aus dem Cache, im Hintergrund aktualisiert
+// - andere Seiten: immer vom Server; ohne Netz stattdessen die Offline-App
+// - /api/ und alles außer GET: nie aus dem Cache
+// Mit jeder neuen BeBo-Version gibt es einen neuen Cache.
+
+const CACHE = 'bebo-{{ bebo_version }}';
+const APP_URL = "{% url 'offline_app' %}";
+const CDN_HOSTS = ['cdn.jsdelivr.net', 'unpkg.com'];
+const CONTENT_HASHED = /\/[0-9a-f]{64}[^/]*$/;
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(CACHE)
+            .then(cache => fetch(APP_URL, {credentials: 'same-origin'})
+                // Nicht angemeldet -> Weiterleitung zum Login, die nicht cachen
+                .then(response => (response.ok && !response.redirected) ? cache.put(APP_URL, response) : null))
+            .catch(() => null)
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil(
+        caches.keys()
+            .then(keys => Promise.all(keys.filter(key => key.startsWith('bebo-') && key !== CACHE).map(key => caches.delete(key))))
+            .then(() => self.clients.claim())
+    );
+});
+
+const cacheFirst = async (request) => {
+    const cached = await caches.match(request);
+    if (cached) return cached;
+    const response = await fetch(request);
+    // opaque: CDN-Antworten ohne CORS (z.B. <script src>)
+    if (response.ok || response.type === 'opaque') {
+        const cache = await caches.open(CACHE);
+        cache.put(request, response.clone());
+    }
+    return response;
+};
+
+const appShell = async (request) => {
+    const cache = await caches.open(CACHE);
+    const cached = await cache.match(APP_URL);
+    const update = fetch(request)
+        .then(response => {
+            if (response.ok && !response.redirected) cache.put(APP_URL, response.clone());
+            return response;
+        });
+    if (cached) {
+        update.catch(() => null);
+        return cached;
+    }
+    return update;
+};
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (CDN_HOSTS.includes(url.hostname)) {
+        event.respondWith(cacheFirst(request));
+        return;
+    }
+    if (url.origin !== self.location.origin || url.pathname.startsWith('/api/')) return;
+
+    if (url.pathname.startsWith('/static/') || (url.pathname.startsWith('/media/') && CONTENT_HASHED.test(url.pathname))) {
+        event.respondWith(cacheFirst(request));
+        return;
+    }
+    if (request.mode === 'navigate') {
+        if (url.pathname === APP_URL) {
+            event.respondWith(appShell(request));
+        } else {
+            event.respondWith(fetch(request).catch(() => caches.match(APP_URL).then(cached => cached || Response.error())));
+        }
+    }
+});